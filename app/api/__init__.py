@@ -2,26 +2,47 @@
 This package contains API-related modules, including endpoints for chatbot functionality, health checks, token tracking, và lịch sử hội thoại.
 """
 
-from .chatbot_tool import process_message_with_assistant_tool
+from .chatbot_tool import (
+	process_message_with_assistant_tool,
+	process_message_with_deferred_enhancement,
+	stream_message_with_assistant_tool
+)
 from .token_tracker import update_token_usage, get_token_usage, get_user_token_usage
 from .chat_history import (
 	create_or_get_session,
 	add_message_to_session,
 	get_chat_history,
+	get_chat_history_page,
+	get_session_updated_at,
 	get_user_chat_sessions,
+	get_user_session_summaries,
+	get_user_session_versions,
 	delete_chat_session,
-	update_session_metadata
+	update_session_metadata,
+	get_session_message,
+	update_message_content
 )
+from .export import export_user_sessions, export_user_token_usage
 
 __all__ = [
 	"process_message_with_assistant_tool",
+	"process_message_with_deferred_enhancement",
+	"stream_message_with_assistant_tool",
 	"update_token_usage",
 	"get_token_usage",
 	"get_user_token_usage",
 	"create_or_get_session",
 	"add_message_to_session",
 	"get_chat_history",
+	"get_chat_history_page",
+	"get_session_updated_at",
 	"get_user_chat_sessions",
+	"get_user_session_summaries",
+	"get_user_session_versions",
 	"delete_chat_session",
-	"update_session_metadata"
+	"update_session_metadata",
+	"get_session_message",
+	"update_message_content",
+	"export_user_sessions",
+	"export_user_token_usage"
 ]
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+Archive of idle chat sessions.
+
+archive_idle_sessions() (run periodically by app/scripts/archive_sessions.py) moves every
+session not updated for CHAT_ARCHIVE_AFTER_DAYS out of chat_history / chat_messages into
+chat_archive: one document per session with the header fields and all messages as a single
+compressed BSON blob (zstd when the zstandard package is installed, zlib otherwise; the codec
+is stored next to the blob). The hot collections, their indexes and the server's working set
+then only hold sessions that are still in use.
+
+Archived sessions come back on access: a history read that finds no session, or (while
+CHAT_ARCHIVE_AFTER_DAYS is set) the first message written to a session id that turns out to
+be archived, restores the session into chat_history (in the current CHAT_STORAGE_MODE) and
+removes it from the archive.
+
+With CHAT_ARCHIVE_RETENTION_DAYS a TTL index deletes archived sessions that many days after
+their last activity. archive_stats() compares the archive's size with the bytes its sessions
+took in the hot collections.
+"""
+
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import logging
+
+import bson
+from bson import Binary
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.core import metrics
+from app.core.config import settings
+from app.database import (
+    get_async_chat_archive_collection,
+    get_async_chat_history_collection,
+    get_async_chat_messages_collection
+)
+from .chat_history import STORAGE_BUCKETED, _bucket_messages, _session_changed
+
+try:
+    import zstandard
+except ImportError:  # Optional: pip install zstandard
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+# Sessions read per round trip by the archival job
+ARCHIVE_BATCH_SIZE = 100
+# Fields that describe the hot layout; a restored session gets them again from the current mode
+LAYOUT_FIELDS = ("_id", "messages", "message_count", "storage")
+# Attempts at restoring a session that is written concurrently
+RESTORE_ATTEMPTS = 3
+
+
+def compress(payload: bytes, codec: str) -> Tuple[str, bytes]:
+    """(codec actually used, compressed payload); zstd falls back to zlib when zstandard is missing"""
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+    return CODEC_ZLIB, zlib.compress(payload, ZLIB_LEVEL)
+
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Archived session is zstd-compressed: install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+def _without_seq(messages: List[dict]) -> List[dict]:
+    return [{key: value for key, value in message.items() if key != "seq"} for message in messages]
+
+
+async def _session_messages(session: dict) -> Tuple[List[dict], int, List]:
+    """
+    All messages of a session document, the BSON bytes the session takes (header plus
+    buckets) and the _ids of the buckets read
+    """
+    raw_bytes = len(bson.encode(session))
+    if session.get("storage") != STORAGE_BUCKETED:
+        return _without_seq(session.get("messages") or []), raw_bytes, []
+    messages, bucket_ids = [], []
+    buckets = get_async_chat_messages_collection().find({"session_id": session["session_id"]}).sort("bucket", 1)
+    async for bucket in buckets:
+        raw_bytes += len(bson.encode(bucket))
+        messages.extend(bucket["messages"])
+        bucket_ids.append(bucket["_id"])
+    return _without_seq(messages), raw_bytes, bucket_ids
+
+
+async def archive_session(session: dict, dry_run: bool = False) -> Optional[Tuple[int, int]]:
+    """
+    Move one session document to the archive. Returns (bytes it took in the hot collections,
+    compressed bytes), or None when it was written meanwhile (it then stays where it is) or
+    was archived by another run.
+    """
+    session_id = session["session_id"]
+    messages, raw_bytes, bucket_ids = await _session_messages(session)
+    if session.get("storage") == STORAGE_BUCKETED and len(messages) != session.get("message_count"):
+        # A message was counted in the header but is not in its bucket yet: an append is in flight
+        return None
+    codec, blob = compress(bson.encode({"messages": messages}), settings.CHAT_ARCHIVE_CODEC)
+    if dry_run:
+        return raw_bytes, len(blob)
+
+    archive = get_async_chat_archive_collection()
+    await archive.replace_one(
+        {"_id": session_id},
+        {
+            "_id": session_id,
+            "user_id": session.get("user_id"),
+            "updated_at": session.get("updated_at"),
+            "archived_at": datetime.now(timezone.utc),
+            "header": {key: value for key, value in session.items() if key not in LAYOUT_FIELDS},
+            "message_count": len(messages),
+            "codec": codec,
+            "blob": Binary(blob),
+            "raw_bytes": raw_bytes,
+            "stored_bytes": len(blob)
+        },
+        upsert=True
+    )
+    # Only drop the session if nothing was written since it was read
+    sessions = get_async_chat_history_collection()
+    result = await sessions.delete_one({"_id": session["_id"], "updated_at": session.get("updated_at")})
+    if not result.deleted_count:
+        if await sessions.count_documents({"session_id": session_id}, limit=1):
+            await archive.delete_one({"_id": session_id})
+        return None
+    if bucket_ids:
+        # Only the buckets read above: anything else belongs to a session created since
+        await get_async_chat_messages_collection().delete_many({"_id": {"$in": bucket_ids}})
+    await _session_changed(session_id)
+    return raw_bytes, len(blob)
+
+
+async def archive_idle_sessions(idle_days: float, limit: int = 0, dry_run: bool = False) -> dict:
+    """Archive the sessions not updated for idle_days, least recently used first; returns counts and bytes."""
+    if settings.CHAT_ARCHIVE_CODEC == CODEC_ZSTD and zstandard is None:
+        logger.warning("CHAT_ARCHIVE_CODEC=zstd needs the zstandard package; compressing with zlib")
+    cutoff = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    cursor = get_async_chat_history_collection().find(
+        {"updated_at": {"$lt": cutoff}}
+    ).sort([("updated_at", 1), ("session_id", 1)]).batch_size(ARCHIVE_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    stats = {"archived": 0, "skipped": 0, "failed": 0, "raw_bytes": 0, "stored_bytes": 0}
+    async for session in cursor:
+        try:
+            result = await archive_session(session, dry_run)
+        except Exception as e:
+            logger.error(f"Archiving session {session.get('session_id')} failed: {e}")
+            stats["failed"] += 1
+            continue
+        if result is None:
+            stats["skipped"] += 1
+            continue
+        raw_bytes, stored_bytes = result
+        stats["archived"] += 1
+        stats["raw_bytes"] += raw_bytes
+        stats["stored_bytes"] += stored_bytes
+        if not dry_run:
+            metrics.incr("archive.sessions")
+            metrics.incr("archive.bytes_reclaimed", raw_bytes - stored_bytes)
+        if stats["archived"] % 1000 == 0:
+            logger.info(f"{stats['archived']} sessions archived")
+    stats["bytes_reclaimed"] = stats["raw_bytes"] - stats["stored_bytes"]
+    return stats
+
+
+async def restore_session(session_id: str) -> bool:
+    """
+    Put an archived session back into chat_history and drop it from the archive. Messages
+    written to the session id after it was archived are kept after the archived ones.
+    False when the session is not archived.
+    """
+    archive = get_async_chat_archive_collection()
+    sessions = get_async_chat_history_collection()
+    for _ in range(RESTORE_ATTEMPTS):
+        archived = await archive.find_one({"_id": session_id})
+        if archived is None:
+            return False
+        current = await sessions.find_one({"session_id": session_id})
+        if current is not None and current.get("archived_at") == archived["archived_at"]:
+            # Restored by a concurrent request that has not dropped the archive yet
+            break
+        messages = bson.decode(decompress(archived["codec"], archived["blob"]))["messages"]
+        if await _write_restored(archived, current, messages):
+            break
+    else:
+        logger.error(f"Session {session_id} kept changing, not restored from the archive")
+        return False
+
+    await archive.delete_one({"_id": session_id, "archived_at": archived["archived_at"]})
+    await _session_changed(session_id)
+    metrics.incr("archive.restored")
+    logger.info(f"Restored session {session_id} from the archive ({archived['message_count']} messages)")
+    return True
+
+
+async def _write_restored(archived: dict, current: Optional[dict], messages: List[dict]) -> bool:
+    """Write the archived session (plus the messages of current, a session created since) to chat_history"""
+    session_id = archived["_id"]
+    header = {**archived["header"], "session_id": session_id, "archived_at": archived["archived_at"]}
+    if current is not None:
+        header["updated_at"] = current.get("updated_at")
+        header["metadata"] = {**(header.get("metadata") or {}), **(current.get("metadata") or {})}
+        if current.get("storage") == STORAGE_BUCKETED:
+            messages = messages + _without_seq(await _bucket_messages(session_id))
+        else:
+            messages = messages + (current.get("messages") or [])
+        bucketed = current.get("storage") == STORAGE_BUCKETED
+    else:
+        bucketed = settings.CHAT_STORAGE_MODE == STORAGE_BUCKETED
+
+    size = settings.CHAT_BUCKET_SIZE
+    buckets = -(-len(messages) // size) if bucketed else 0
+    # Buckets left behind when archiving stopped between dropping the header and its buckets;
+    # anything created after archived_at belongs to a session written since
+    await get_async_chat_messages_collection().delete_many({
+        "session_id": session_id,
+        "bucket": {"$gte": buckets},
+        "created_at": {"$lt": archived["archived_at"]}
+    })
+    if bucketed:
+        now = datetime.now(timezone.utc)
+        writes = [
+            UpdateOne(
+                {"session_id": session_id, "bucket": start // size},
+                {
+                    "$set": {"messages": [
+                        {**message, "seq": seq} for seq, message in enumerate(messages[start:start + size], start)
+                    ]},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for start in range(0, len(messages), size)
+        ]
+        if writes:
+            await get_async_chat_messages_collection().bulk_write(writes, ordered=False)
+        document = {**header, "storage": STORAGE_BUCKETED, "message_count": len(messages)}
+    else:
+        document = {**header, "messages": messages}
+
+    sessions = get_async_chat_history_collection()
+    if current is None:
+        try:
+            await sessions.insert_one(document)
+            return True
+        except DuplicateKeyError:
+            # Created meanwhile: merge with it on the next attempt
+            return False
+    result = await sessions.replace_one({"_id": current["_id"], "updated_at": current.get("updated_at")}, document)
+    return result.matched_count > 0
+
+
+async def archive_stats() -> dict:
+    """Size of the archive against the bytes its sessions took in the hot collections"""
+    groups = await get_async_chat_archive_collection().aggregate([
+        {"$group": {
+            "_id": "$codec",
+            "sessions": {"$sum": 1},
+            "messages": {"$sum": "$message_count"},
+            "raw_bytes": {"$sum": "$raw_bytes"},
+            "stored_bytes": {"$sum": "$stored_bytes"}
+        }}
+    ]).to_list(length=None)
+    totals = {
+        key: sum(group[key] for group in groups) for key in ("sessions", "messages", "raw_bytes", "stored_bytes")
+    }
+    return {
+        **totals,
+        "bytes_reclaimed": totals["raw_bytes"] - totals["stored_bytes"],
+        "compression_ratio": round(totals["raw_bytes"] / totals["stored_bytes"], 2) if totals["stored_bytes"] else None,
+        "codecs": {group["_id"]: group["sessions"] for group in groups},
+        "archive_after_days": settings.CHAT_ARCHIVE_AFTER_DAYS,
+        "retention_days": settings.CHAT_ARCHIVE_RETENTION_DAYS
+    }
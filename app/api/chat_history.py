@@ -1,103 +1,504 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime, timezone
-from app.models.chat_history_model import ChatHistory, Message
+from app.models.chat_history_model import ChatHistory, ChatHistoryPage, ChatSessionSummary, Message
 from uuid import uuid4
-from app.database import get_chat_history_collection
+from app.core.config import settings
+from app.database import (
+    get_async_chat_history_collection,
+    get_async_chat_messages_collection,
+    get_async_chat_archive_collection
+)
+from app.api.session_cache import session_cache, invalidation_channel
+from app.api.chat_search import chat_search
+from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import logging
 
 logger = logging.getLogger(__name__)
 
-def create_or_get_session(session_id: Optional[str], user_id: str) -> ChatHistory:
-    """Create a new chat session or get existing one"""
-    collection = get_chat_history_collection()
-    
-    if session_id:
-        # Try to find existing session
-        session_data = collection.find_one({"session_id": session_id})
-        if session_data:
-            # Convert MongoDB document to ChatHistory model
-            session_data["_id"] = str(session_data["_id"])  # Convert ObjectId to string
-            return ChatHistory(**session_data)
-    
-    # Create new session
-    new_session_id = session_id or str(uuid4())
-    new_session = ChatHistory(
-        session_id=new_session_id,
-        user_id=user_id,
-        messages=[],
-        created_at=datetime.now(timezone.utc),
-        updated_at=datetime.now(timezone.utc)
+# Session metadata key holding the OpenAI thread reused across turns
+THREAD_ID_METADATA_KEY = "openai_thread_id"
+# CHAT_STORAGE_MODE values. Embedded sessions keep every message in the session document;
+# bucketed sessions keep a header in chat_history and the messages in chat_messages buckets
+# of CHAT_BUCKET_SIZE, keyed by (session_id, bucket). The header's "storage" field records
+# the layout, so sessions created before switching modes keep working until migrated
+# (app/scripts/migrate_message_buckets.py).
+STORAGE_EMBEDDED = "embedded"
+STORAGE_BUCKETED = "bucketed"
+
+# Whether chat_history has a unique index on session_id (checked at startup by
+# check_session_id_index). Embedded appends rely on it to reject an upsert that would
+# duplicate a bucketed session, bucketed appends to keep concurrent first messages on one header.
+_session_id_unique = True
+
+async def check_session_id_index() -> bool:
+    """
+    Look for the unique session_id index. Without it, bucketed storage is turned off for new
+    sessions and embedded appends read the session's layout before upserting.
+    """
+    global _session_id_unique
+    try:
+        indexes = await get_async_chat_history_collection().index_information()
+        _session_id_unique = any(
+            index.get("unique") and index["key"] == [("session_id", 1)] for index in indexes.values()
+        )
+    except Exception as e:
+        logger.error(f"Could not check the chat_history indexes: {e}")
+        _session_id_unique = False
+    if not _session_id_unique:
+        if settings.CHAT_STORAGE_MODE == STORAGE_BUCKETED:
+            logger.error("chat_history has no unique session_id index: bucketed storage disabled for new sessions")
+            settings.CHAT_STORAGE_MODE = STORAGE_EMBEDDED
+        else:
+            logger.warning("chat_history has no unique session_id index: appends read the session layout first")
+    return _session_id_unique
+
+def recent_message_limit() -> int:
+    """Messages a chat turn needs: the context history plus the message just added"""
+    return settings.CONTEXT_MAX_HISTORY_MESSAGES + 1
+
+def _session_on_insert(user_id: str, now: datetime) -> dict:
+    """Fields a session gets when an upsert creates it"""
+    fields = {"user_id": user_id, "created_at": now, "metadata": {}}
+    if settings.CHAT_STORAGE_MODE == STORAGE_BUCKETED:
+        fields["storage"] = STORAGE_BUCKETED
+    return fields
+
+def _is_bucketed(session_data: Optional[dict]) -> bool:
+    return bool(session_data) and session_data.get("storage") == STORAGE_BUCKETED
+
+def _bucket_of(seq: int) -> int:
+    return seq // settings.CHAT_BUCKET_SIZE
+
+def _to_chat_history(session_data: dict, messages: Optional[List[dict]] = None) -> ChatHistory:
+    session_data["_id"] = str(session_data["_id"])  # Convert ObjectId to string
+    if messages is not None:
+        session_data["messages"] = messages
+    elif not _is_bucketed(session_data):
+        # Only bucketed headers keep a count
+        session_data["message_count"] = len(session_data.get("messages") or [])
+    return ChatHistory(**session_data)
+
+# Session fields kept in the session cache next to the recent messages
+CACHED_HEADER_FIELDS = {
+    "id", "session_id", "user_id", "created_at", "updated_at", "metadata", "message_count", "summary", "summary_upto"
+}
+
+def _cache_session(history: ChatHistory) -> None:
+    """Keep the recent part of a session that was just written or read (write-through)"""
+    session_cache.put(
+        history.session_id,
+        history.model_dump(include=CACHED_HEADER_FIELDS),
+        [message.model_dump() for message in history.messages[-recent_message_limit():]]
     )
-    
-    # Insert into MongoDB
-    session_dict = new_session.model_dump(by_alias=True)
-    if '_id' in session_dict:
-        del session_dict['_id']
-
-    result = collection.insert_one(session_dict)
-    new_session.id = str(result.inserted_id)
-    
-    return new_session
-
-def add_message_to_session(session_id: str, user_id: str, message: Message) -> ChatHistory:
-    """Add a message to an existing chat session"""
-    collection = get_chat_history_collection()
-    
-    # Get existing session
-    session_data = collection.find_one({"session_id": session_id})
-    if not session_data:
-        # Create new session if not exists
-        return create_or_get_session(session_id, user_id)
-    
-    # Update session with new message
-    update_result = collection.update_one(
+
+def _cached_recent(session_id: str, limit: Optional[int]) -> Optional[Tuple[dict, List[dict]]]:
+    """(header, last limit messages) from the session cache when it holds enough of the session"""
+    cached = session_cache.get(session_id)
+    if cached is None:
+        return None
+    header, messages = cached
+    count = header.get("message_count") or 0
+    if len(messages) < (min(limit, count) if limit else count):
+        return None
+    return header, messages[-limit:] if limit else messages
+
+async def _session_changed(session_id: str) -> None:
+    """Drop a session changed other than by a new message, here and in the other workers"""
+    session_cache.invalidate(session_id)
+    await invalidation_channel.publish(session_id)
+
+async def _restore_archived(session_id: str) -> bool:
+    """Bring an archived session back into chat_history; False if it is not archived"""
+    # Imported here: chat_archive builds on this module
+    from .chat_archive import restore_session
+    return await restore_session(session_id)
+
+async def _bucket_messages(session_id: str, first_seq: int = 0, end_seq: Optional[int] = None) -> List[dict]:
+    """Messages of a bucketed session with sequence numbers in [first_seq, end_seq), in order"""
+    bucket_range = {"$gte": _bucket_of(first_seq)}
+    if end_seq is not None:
+        if end_seq <= first_seq:
+            return []
+        bucket_range["$lte"] = _bucket_of(end_seq - 1)
+    buckets = get_async_chat_messages_collection().find(
+        {"session_id": session_id, "bucket": bucket_range},
+        {"_id": 0, "messages": 1}
+    ).sort("bucket", 1)
+    return [
+        m async for bucket in buckets for m in bucket["messages"]
+        if first_seq <= m.get("seq", 0) and (end_seq is None or m.get("seq", 0) < end_seq)
+    ]
+
+async def _recent_messages(session_data: dict, limit: int) -> List[dict]:
+    """Last limit messages of a session; for a bucketed session only the buckets holding them are read"""
+    if not _is_bucketed(session_data):
+        return (session_data.get("messages") or [])[-limit:]
+    count = session_data.get("message_count", 0)
+    return await _bucket_messages(session_data["session_id"], max(count - limit, 0)) if count else []
+
+async def create_or_get_session(session_id: Optional[str], user_id: str) -> ChatHistory:
+    """
+    Create a new chat session or get existing one (one round trip). A bucketed session
+    comes back with its recent messages only (recent_message_limit()).
+    """
+    collection = get_async_chat_history_collection()
+    now = datetime.now(timezone.utc)
+    on_insert = {**_session_on_insert(user_id, now), "updated_at": now}
+    if _is_bucketed(on_insert):
+        on_insert["message_count"] = 0
+    else:
+        on_insert["messages"] = []
+    session_data = await collection.find_one_and_update(
+        {"session_id": session_id or str(uuid4())},
+        {"$setOnInsert": on_insert},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if _is_bucketed(session_data):
+        history = _to_chat_history(session_data, await _recent_messages(session_data, recent_message_limit()))
+    else:
+        history = _to_chat_history(session_data)
+    _cache_session(history)
+    return history
+
+async def add_message_to_session(session_id: str, user_id: str, message: Message) -> ChatHistory:
+    """
+    Add a message to a chat session, creating the session if it does not exist.
+    Embedded sessions: a single upsert that returns the updated header and the recent messages.
+    Bucketed sessions: the header upsert allocates the message's sequence number, then the
+    message is pushed into its bucket, whose messages give the recent ones.
+    Either way the returned session holds only the recent messages (recent_message_limit());
+    message_count is the total: callers that need the whole history load it with
+    get_chat_history_page.
+    The session cache is updated with the result, and the other workers drop their copy.
+    While archiving is on (CHAT_ARCHIVE_AFTER_DAYS), a session's first message also checks the
+    archive: if the session id was archived, the session is restored and the message follows
+    its archived messages. The message is added
+    to the chat search index.
+    """
+    history = await _append_message(session_id, user_id, message)
+    if history.message_count == 1 and settings.CHAT_ARCHIVE_AFTER_DAYS > 0 and await _restore_archived(session_id):
+        history = await get_chat_history_page(session_id, recent_message_limit())
+    _cache_session(history)
+    chat_search.on_message(history, message)
+    await invalidation_channel.publish(session_id)
+    return history
+
+async def _append_message(session_id: str, user_id: str, message: Message) -> ChatHistory:
+    collection = get_async_chat_history_collection()
+    now = datetime.now(timezone.utc)
+    on_insert = _session_on_insert(user_id, now)
+    bucketed = _is_bucketed(on_insert)
+    if not bucketed and not _session_id_unique:
+        # No index to reject a duplicate of a bucketed session: look its layout up first
+        bucketed = _is_bucketed(await collection.find_one({"session_id": session_id}, {"storage": 1}))
+    # Only the recent messages come back, as for bucketed sessions
+    embedded_projection = _header_projection({"$slice": [{"$ifNull": ["$messages", []]}, -recent_message_limit()]})
+    if not bucketed:
+        try:
+            session_data = await collection.find_one_and_update(
+                {"session_id": session_id, "storage": {"$ne": STORAGE_BUCKETED}},
+                {
+                    "$push": {"messages": message.dict()},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": on_insert
+                },
+                projection=embedded_projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return _to_chat_history(session_data, session_data["messages"])
+        except DuplicateKeyError:
+            # The session was created bucketed (before switching back to embedded): append to its buckets
+            pass
+
+    session_data = await collection.find_one_and_update(
         {"session_id": session_id},
         {
-            "$push": {"messages": message.dict()},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
+            "$inc": {"message_count": 1},
+            "$set": {"updated_at": now},
+            "$setOnInsert": on_insert
+        },
+        projection={"messages": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if not _is_bucketed(session_data):
+        # Session created before bucketed storage and not migrated yet: keep it embedded
+        session_data = await collection.find_one_and_update(
+            {"session_id": session_id},
+            {"$push": {"messages": message.dict()}},
+            projection=embedded_projection,
+            return_document=ReturnDocument.AFTER
+        )
+        return _to_chat_history(session_data, session_data["messages"])
+
+    seq = session_data["message_count"] - 1
+    bucket = await get_async_chat_messages_collection().find_one_and_update(
+        {"session_id": session_id, "bucket": _bucket_of(seq)},
+        {
+            # $sort keeps sequence order when concurrent appends land out of order
+            "$push": {"messages": {"$each": [{**message.dict(), "seq": seq}], "$sort": {"seq": 1}}},
+            "$setOnInsert": {"created_at": now}
+        },
+        projection={"_id": 0, "messages": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
-    
-    if update_result.modified_count == 0:
-        logger.error(f"Failed to update session {session_id}")
-        raise Exception("Failed to update chat session")
-    
-    # Get updated session
-    updated_session = collection.find_one({"session_id": session_id})
-    updated_session["_id"] = str(updated_session["_id"])
-    return ChatHistory(**updated_session)
-
-def get_chat_history(session_id: str) -> Optional[ChatHistory]:
-    """Get chat history for a session"""
-    collection = get_chat_history_collection()
-    session_data = collection.find_one({"session_id": session_id})
-    
+    recent = bucket["messages"]
+    limit = recent_message_limit()
+    if len(recent) < limit and _bucket_of(seq) > 0:
+        recent = await _bucket_messages(session_id, max(seq + 1 - limit, 0))
+    return _to_chat_history(session_data, recent[-limit:])
+
+async def load_session_context(session_id: str, limit: int) -> Optional[dict]:
+    """
+    Session document reduced to what a chat turn needs: the last limit messages, metadata,
+    message_count and the rolling summary
+    """
+    cached = _cached_recent(session_id, limit)
+    if cached:
+        header, messages = cached
+    else:
+        results = await get_async_chat_history_collection().aggregate([
+            {"$match": {"session_id": session_id}},
+            {"$project": _header_projection({"$slice": ["$messages", -limit]})}
+        ]).to_list(length=1)
+        if not results:
+            return None
+        header = results[0]
+        messages = await _recent_messages(header, limit)
+    return {
+        "messages": messages,
+        "metadata": header.get("metadata"),
+        "message_count": header.get("message_count"),
+        "summary": header.get("summary"),
+        "summary_upto": header.get("summary_upto")
+    }
+
+async def get_chat_history(session_id: str) -> Optional[ChatHistory]:
+    """Get chat history for a session, restoring it first if it was archived"""
+    collection = get_async_chat_history_collection()
+    session_data = await collection.find_one({"session_id": session_id})
+    if session_data is None and await _restore_archived(session_id):
+        session_data = await collection.find_one({"session_id": session_id})
+
     if session_data:
-        session_data["_id"] = str(session_data["_id"])
-        return ChatHistory(**session_data)
+        if _is_bucketed(session_data):
+            return _to_chat_history(session_data, await _bucket_messages(session_id))
+        return _to_chat_history(session_data)
     return None
 
-def get_user_chat_sessions(user_id: str, limit: int = 10) -> List[ChatHistory]:
+def _header_projection(messages=None) -> dict:
+    """
+    Aggregation $project of a session without its messages (or with the given messages
+    expression); message_count is computed for embedded sessions, which do not store it.
+    Also valid as a find / findAndModify projection (MongoDB 4.4+).
+    """
+    projection = {
+        "session_id": 1, "user_id": 1, "created_at": 1, "updated_at": 1, "metadata": 1, "storage": 1,
+        "summary": 1, "summary_upto": 1,
+        "message_count": {"$cond": [
+            {"$eq": ["$storage", STORAGE_BUCKETED]},
+            "$message_count",
+            {"$size": {"$ifNull": ["$messages", []]}}
+        ]}
+    }
+    if messages is not None:
+        projection["messages"] = messages
+    return projection
+
+async def get_chat_history_page(
+    session_id: str,
+    limit: Optional[int],
+    before: Optional[int] = None,
+    restore: bool = True
+) -> Optional[ChatHistoryPage]:
+    """
+    Messages of a session with sequence numbers (positions) below `before` (default: all),
+    at most `limit` of them (the newest), in one round trip for embedded sessions ($slice)
+    and two for bucketed ones (header, then the buckets covering the range). The newest page
+    comes from the session cache when it holds enough messages. An archived session is
+    restored first, unless restore is False.
+    """
+    if before is None and limit:
+        cached = _cached_recent(session_id, limit)
+        if cached:
+            header, messages = cached
+            count = header.get("message_count") or 0
+            return ChatHistoryPage(**header, messages=messages, next_before=max(count - limit, 0) or None)
+
+    window = "$messages" if before is None else {"$slice": ["$messages", before]}
+    if limit:
+        window = {"$slice": [window, -limit]}
+    results = await get_async_chat_history_collection().aggregate([
+        {"$match": {"session_id": session_id}},
+        {"$project": _header_projection(window)}
+    ]).to_list(length=1)
+    if not results:
+        if restore and await _restore_archived(session_id):
+            return await get_chat_history_page(session_id, limit, before)
+        return None
+    session_data = results[0]
+
+    total = session_data.get("message_count") or 0
+    end = total if before is None else min(before, total)
+    start = max(end - limit, 0) if limit else 0
+    if _is_bucketed(session_data):
+        session_data["messages"] = await _bucket_messages(session_id, start, end)
+    session_data["_id"] = str(session_data["_id"])
+    session_data["next_before"] = start or None
+    return ChatHistoryPage(**session_data)
+
+async def get_session_updated_at(session_id: str) -> Optional[datetime]:
+    """
+    Last modification time of a session (None if it does not exist); reads only the header.
+    Always asked of Mongo, not the session cache: another worker may have written the session,
+    and a stale value would answer a conditional GET with a wrong 304.
+    """
+    collection = get_async_chat_history_collection()
+    session_data = await collection.find_one({"session_id": session_id}, {"_id": 0, "updated_at": 1})
+    if session_data is None and await _restore_archived(session_id):
+        session_data = await collection.find_one({"session_id": session_id}, {"_id": 0, "updated_at": 1})
+    return session_data.get("updated_at") if session_data else None
+
+async def get_user_session_versions(user_id: str, limit: int = 10) -> List[Tuple[str, datetime]]:
+    """(session_id, updated_at) of the sessions get_user_chat_sessions would return, without their contents"""
+    collection = get_async_chat_history_collection()
+    sessions = await collection.find(
+        {"user_id": user_id}, {"_id": 0, "session_id": 1, "updated_at": 1}
+    ).sort("updated_at", -1).limit(limit).to_list(length=limit)
+    return [(session["session_id"], session.get("updated_at")) for session in sessions]
+
+async def get_user_session_summaries(user_id: str, limit: int = 10) -> List[ChatSessionSummary]:
+    """Recent sessions of a user without their messages"""
+    collection = get_async_chat_history_collection()
+    sessions = await collection.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"updated_at": -1}},
+        {"$limit": limit},
+        {"$project": _header_projection()}
+    ]).to_list(length=limit)
+    for session in sessions:
+        session["_id"] = str(session["_id"])
+    return [ChatSessionSummary(**session) for session in sessions]
+
+async def get_user_chat_sessions(user_id: str, limit: int = 10) -> List[ChatHistory]:
     """Get recent chat sessions for a user"""
-    collection = get_chat_history_collection()
-    sessions = collection.find(
+    collection = get_async_chat_history_collection()
+    sessions = await collection.find(
         {"user_id": user_id}
-    ).sort("updated_at", -1).limit(limit)
-    
-    return [ChatHistory(**{**session, "_id": str(session["_id"])}) for session in sessions]
+    ).sort("updated_at", -1).limit(limit).to_list(length=limit)
 
-def delete_chat_session(session_id: str) -> bool:
-    """Delete a chat session"""
-    collection = get_chat_history_collection()
-    result = collection.delete_one({"session_id": session_id})
-    return result.deleted_count > 0
+    # Messages of bucketed sessions: one query for all of them
+    bucketed_messages = {session["session_id"]: [] for session in sessions if _is_bucketed(session)}
+    if bucketed_messages:
+        buckets = get_async_chat_messages_collection().find(
+            {"session_id": {"$in": list(bucketed_messages)}},
+            {"_id": 0, "session_id": 1, "messages": 1}
+        ).sort([("session_id", 1), ("bucket", 1)])
+        async for bucket in buckets:
+            bucketed_messages[bucket["session_id"]].extend(bucket["messages"])
 
-def update_session_metadata(session_id: str, metadata: dict) -> bool:
+    return [_to_chat_history(session, bucketed_messages.get(session["session_id"])) for session in sessions]
+
+async def delete_chat_session(session_id: str) -> bool:
+    """Delete a chat session, including its archived copy"""
+    collection = get_async_chat_history_collection()
+    result = await collection.delete_one({"session_id": session_id})
+    await get_async_chat_messages_collection().delete_many({"session_id": session_id})
+    archived = await get_async_chat_archive_collection().delete_one({"_id": session_id})
+    await _session_changed(session_id)
+    chat_search.on_session_deleted(session_id)
+    return result.deleted_count > 0 or archived.deleted_count > 0
+
+async def update_session_metadata(session_id: str, metadata: dict) -> bool:
     """Update metadata for a chat session"""
-    collection = get_chat_history_collection()
-    result = collection.update_one(
+    collection = get_async_chat_history_collection()
+    result = await collection.update_one(
         {"session_id": session_id},
         {"$set": {"metadata": metadata, "updated_at": datetime.now(timezone.utc)}}
     )
-    return result.modified_count > 0
\ No newline at end of file
+    await _session_changed(session_id)
+    return result.modified_count > 0
+
+async def set_session_thread_id(session_id: str, thread_id: Optional[str]) -> None:
+    """Store (or clear, with None) the OpenAI thread id in the session metadata without touching other keys"""
+    collection = get_async_chat_history_collection()
+    now = datetime.now(timezone.utc)
+    result = await collection.update_one(
+        {"session_id": session_id, "metadata": {"$type": "object"}},
+        {"$set": {f"metadata.{THREAD_ID_METADATA_KEY}": thread_id, "updated_at": now}}
+    )
+    if result.matched_count == 0:
+        # metadata is missing or null (sessions created before it was set on insert): create it
+        await collection.update_one(
+            {"session_id": session_id},
+            {"$set": {"metadata": {THREAD_ID_METADATA_KEY: thread_id}, "updated_at": now}}
+        )
+    await _session_changed(session_id)
+
+async def save_summary(session_id: str, summary: str, summary_upto: int, previous_upto: Optional[int]) -> bool:
+    """
+    Store a rolling summary of the first summary_upto messages, unless another summarizer
+    moved the summary on since previous_upto was read
+    """
+    collection = get_async_chat_history_collection()
+    result = await collection.update_one(
+        {"session_id": session_id, "summary_upto": previous_upto},
+        {"$set": {"summary": summary, "summary_upto": summary_upto, "updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count:
+        await _session_changed(session_id)
+    return result.matched_count > 0
+
+async def get_session_message(session_id: str, message_id: str) -> Optional[Message]:
+    """Get a single message of a session by its message_id"""
+    for collection, _ in _message_collections():
+        session_data = await collection.find_one(
+            {"session_id": session_id, "messages.message_id": message_id},
+            {"messages": {"$elemMatch": {"message_id": message_id}}}
+        )
+        if session_data and session_data.get("messages"):
+            return Message(**session_data["messages"][0])
+    return None
+
+async def update_message_content(
+    session_id: str,
+    message_id: str,
+    content: Optional[str],
+    enhancement_status: Optional[str]
+) -> bool:
+    """Replace the content (if given) and enhancement status of a stored message"""
+    update = {"messages.$.enhancement_status": enhancement_status}
+    if content is not None:
+        update["messages.$.content"] = content
+    now = datetime.now(timezone.utc)
+    for collection, is_header in _message_collections():
+        result = await collection.update_one(
+            {"session_id": session_id, "messages.message_id": message_id},
+            {"$set": {**update, "updated_at": now} if is_header else update}
+        )
+        if result.matched_count:
+            if not is_header:
+                await get_async_chat_history_collection().update_one(
+                    {"session_id": session_id}, {"$set": {"updated_at": now}}
+                )
+            await _session_changed(session_id)
+            return result.modified_count > 0
+    return False
+
+def _message_collections() -> List[Tuple[AsyncIOMotorCollection, bool]]:
+    """
+    (collection, is session document) pairs that can hold a session's messages, the current
+    storage mode's first, so lookups by message_id take one round trip unless the session
+    uses the other layout.
+    """
+    embedded = (get_async_chat_history_collection(), True)
+    bucketed = (get_async_chat_messages_collection(), False)
+    if settings.CHAT_STORAGE_MODE == STORAGE_BUCKETED:
+        return [bucketed, embedded]
+    return [embedded, bucketed]
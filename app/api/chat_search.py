@@ -0,0 +1,362 @@
+"""
+In-memory BM25 search over chat messages (CHAT_SEARCH_ENABLED).
+
+Every message is a document of the index, tokenized with the shared diacritic-folding
+tokenizer (app.core.text), so "don hang DH123" finds "Đơn hàng DH-123". Results are grouped by
+session: a session ranks by its best-matching message. The index is loaded from chat_history /
+chat_messages at startup (only sessions updated within CHAT_SEARCH_MAX_AGE_DAYS, when set),
+add_message_to_session adds each message as it is written, and a refresh re-indexes the
+sessions updated since the last one (CHAT_SEARCH_REFRESH_SECONDS), which picks up writes made
+by other workers and enhanced replies. A full rebuild every CHAT_SEARCH_FULL_REFRESH_SECONDS
+drops deleted and archived sessions. Message texts are not kept: the routes read the
+best-matching messages of the page from Mongo.
+"""
+
+import asyncio
+import heapq
+import math
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.text import tokenize_with_bigrams
+from app.database import get_chat_history_collection, get_chat_messages_collection
+from app.models.chat_history_model import ChatHistory, Message
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms found in more than this share of the messages (e.g. "hang", "ban") only add to the
+# score of messages that match a rarer query term, so they do not make every message a candidate
+COMMON_TERM_RATIO = 0.05
+# Sessions read per round trip while loading
+FETCH_BATCH_SIZE = 200
+# A refresh re-reads sessions updated this long before the previous one started (clock skew between workers)
+REFRESH_OVERLAP_SECONDS = 5
+MESSAGE_PROJECTION = {"messages.content": 1, "messages.timestamp": 1, "messages.seq": 1}
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # Mongo and Message.timestamp use naive UTC datetimes
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ChatSearchIndex:
+    """BM25 inverted index of chat messages, keyed by (session_id, position)."""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # doc id -> (session_id, position, timestamp, length, terms)
+        self._docs: Dict[int, Tuple[str, int, Optional[float], int, Tuple[str, ...]]] = {}
+        self._doc_ids: Dict[Tuple[str, int], int] = {}
+        # session_id -> (user_id, updated_at), and the doc ids of its messages
+        self._sessions: Dict[str, Tuple[str, Optional[datetime]]] = {}
+        self._session_docs: Dict[str, List[int]] = defaultdict(list)
+        self._user_sessions: Dict[str, Set[str]] = defaultdict(set)
+        self._next_id = 0
+        self._total_length = 0
+        self.watermark: Optional[datetime] = None
+        self.loaded_at = 0.0
+        self.full_loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def add_message(
+        self,
+        session_id: str,
+        user_id: str,
+        updated_at: Optional[datetime],
+        position: int,
+        content: str,
+        timestamp: Optional[datetime]
+    ) -> None:
+        """Index a message, replacing the one previously indexed at the same position."""
+        self._sessions[session_id] = (user_id, updated_at)
+        self._user_sessions[user_id].add(session_id)
+        previous = self._doc_ids.pop((session_id, position), None)
+        if previous is not None:
+            self._remove_doc(previous)
+            self._session_docs[session_id].remove(previous)
+        terms = Counter(tokenize_with_bigrams(content))
+        if not terms:
+            return
+        doc_id = self._next_id
+        self._next_id += 1
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+        length = sum(terms.values())
+        self._docs[doc_id] = (session_id, position, _epoch(timestamp), length, tuple(terms))
+        self._doc_ids[(session_id, position)] = doc_id
+        self._session_docs[session_id].append(doc_id)
+        self._total_length += length
+
+    def index_session(self, session_id: str, user_id: str, updated_at: Optional[datetime], messages: List[dict]) -> None:
+        """(Re)index all messages of a session; messages carry content, timestamp and optionally seq."""
+        self.remove_session(session_id)
+        for position, message in enumerate(messages):
+            self.add_message(
+                session_id, user_id, updated_at, message.get("seq", position),
+                message.get("content") or "", message.get("timestamp")
+            )
+        self._sessions[session_id] = (user_id, updated_at)
+        self._user_sessions[user_id].add(session_id)
+
+    def remove_session(self, session_id: str) -> None:
+        for doc_id in self._session_docs.pop(session_id, []):
+            if doc_id in self._docs:
+                self._doc_ids.pop(self._docs[doc_id][:2], None)
+                self._remove_doc(doc_id)
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            user_sessions = self._user_sessions.get(session[0])
+            if user_sessions is not None:
+                user_sessions.discard(session_id)
+                if not user_sessions:
+                    del self._user_sessions[session[0]]
+
+    def _remove_doc(self, doc_id: int) -> None:
+        _, _, _, length, terms = self._docs.pop(doc_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= length
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[int, List[Tuple[float, str, int, int]]]:
+        """
+        (sessions matching, top-k (score, session_id, best message position, matching messages)).
+        since/until filter on the message timestamp.
+        """
+        n_docs = len(self._docs)
+        if not n_docs:
+            return 0, []
+        avg_length = self._total_length / n_docs
+        # (postings, idf) of the query terms, rarest first
+        query_terms = [
+            (postings, math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5)))
+            for postings in sorted(
+                (self._postings[term] for term in set(tokenize_with_bigrams(query)) if term in self._postings), key=len
+            )
+        ]
+        if not query_terms:
+            return 0, []
+
+        def term_score(idf: float, doc_id: int, tf: int) -> float:
+            length_norm = 1 - BM25_B + BM25_B * self._docs[doc_id][3] / avg_length
+            return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+
+        scores: Dict[int, float] = defaultdict(float)
+        user_doc_ids = self._user_doc_ids(user_id) if user_id is not None else None
+        if user_doc_ids is not None and len(user_doc_ids) < sum(len(postings) for postings, _ in query_terms):
+            # Fewer messages in the user's sessions than postings to walk: score those messages directly
+            for doc_id in user_doc_ids:
+                for postings, idf in query_terms:
+                    tf = postings.get(doc_id)
+                    if tf:
+                        scores[doc_id] += term_score(idf, doc_id, tf)
+        else:
+            rare = [(postings, idf) for postings, idf in query_terms if len(postings) <= COMMON_TERM_RATIO * n_docs]
+            common = query_terms[len(rare):] if rare else []
+            for postings, idf in rare or query_terms:
+                for doc_id, tf in postings.items():
+                    scores[doc_id] += term_score(idf, doc_id, tf)
+            for postings, idf in common:
+                for doc_id in scores:
+                    tf = postings.get(doc_id)
+                    if tf:
+                        scores[doc_id] += term_score(idf, doc_id, tf)
+
+        since_epoch, until_epoch = _epoch(since), _epoch(until)
+        best: Dict[str, Tuple[float, int]] = {}
+        matches: Counter = Counter()
+        for doc_id, score in scores.items():
+            session_id, position, timestamp, _, _ = self._docs[doc_id]
+            if user_id is not None and self._sessions[session_id][0] != user_id:
+                continue
+            if since_epoch is not None and (timestamp is None or timestamp < since_epoch):
+                continue
+            if until_epoch is not None and (timestamp is None or timestamp >= until_epoch):
+                continue
+            matches[session_id] += 1
+            if session_id not in best or score > best[session_id][0]:
+                best[session_id] = (score, position)
+        top = heapq.nlargest(k, best.items(), key=lambda item: item[1][0])
+        return len(best), [(score, session_id, position, matches[session_id]) for session_id, (score, position) in top]
+
+    def _user_doc_ids(self, user_id: str) -> List[int]:
+        return [doc_id for session_id in self._user_sessions.get(user_id, ()) for doc_id in self._session_docs.get(session_id, ())]
+
+    def session_info(self, session_id: str) -> Tuple[str, Optional[datetime]]:
+        """(user_id, updated_at) of an indexed session."""
+        return self._sessions[session_id]
+
+
+class ChatSearch:
+    """Keeps a ChatSearchIndex in sync with Mongo and serves searches from it."""
+
+    def __init__(self):
+        self.index = ChatSearchIndex()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHAT_SEARCH_ENABLED
+
+    def start(self) -> None:
+        """Load the index in the background; searches before it is ready wait for it."""
+        self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        self._refresh_task = None
+
+    def on_message(self, session: ChatHistory, message: Message) -> None:
+        """Index a message just written to a session (called by add_message_to_session)."""
+        if not self.enabled:
+            return
+        count = session.message_count or len(session.messages)
+        position = count - 1
+        # A concurrent append may have landed after this message
+        for offset, stored in enumerate(reversed(session.messages)):
+            if stored.message_id == message.message_id:
+                position = count - 1 - offset
+                break
+        self.index.add_message(
+            session.session_id, session.user_id, session.updated_at, position, message.content, message.timestamp
+        )
+
+    def on_session_deleted(self, session_id: str) -> None:
+        if self.enabled:
+            self.index.remove_session(session_id)
+
+    async def search(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 10
+    ) -> Tuple[int, List[Tuple[float, str, int, int]]]:
+        """(sessions matching, the page of (score, session_id, best message position, matching messages))."""
+        await self.ensure_fresh()
+        started = time.perf_counter()
+        total, top = self.index.search(query, offset + limit, user_id, since, until)
+        metrics.incr("chat_search.searches")
+        metrics.incr("chat_search.search_seconds", time.perf_counter() - started)
+        return total, top[offset:]
+
+    async def ensure_fresh(self) -> None:
+        """Wait for the first load; afterwards refresh in the background when stale."""
+        if not self.index.loaded_at:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh())
+            await asyncio.shield(self._refresh_task)
+            return
+        if time.monotonic() - self.index.loaded_at >= settings.CHAT_SEARCH_REFRESH_SECONDS:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self) -> None:
+        """Re-index the sessions updated since the last refresh (or everything, when a rebuild is due)."""
+        full = (
+            not self.index.full_loaded_at
+            or time.monotonic() - self.index.full_loaded_at >= settings.CHAT_SEARCH_FULL_REFRESH_SECONDS
+        )
+        watermark = datetime.now(timezone.utc) - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+        try:
+            if full:
+                # Built off the event loop; messages written meanwhile are picked up by the next refresh
+                index = await asyncio.to_thread(self._build)
+            else:
+                changed = await asyncio.to_thread(lambda: list(self._fetch(self.index.watermark)))
+        except Exception as e:
+            logger.error(f"Chat search index refresh failed: {e}")
+            # Try again after the normal refresh interval rather than on every search
+            self.index.loaded_at = time.monotonic()
+            return
+
+        now = time.monotonic()
+        if full:
+            index.full_loaded_at = now
+            self.index = index
+            logger.info(f"Chat search index rebuilt with {len(index)} messages of {index.session_count} sessions")
+        else:
+            for session, messages in changed:
+                self.index.index_session(session["session_id"], session.get("user_id"), session.get("updated_at"), messages)
+            metrics.incr("chat_search.sessions_refreshed", len(changed))
+        self.index.watermark = watermark
+        self.index.loaded_at = now
+        metrics.incr("chat_search.refreshes")
+
+    def _build(self) -> ChatSearchIndex:
+        index = ChatSearchIndex()
+        for session, messages in self._fetch(None):
+            index.index_session(session["session_id"], session.get("user_id"), session.get("updated_at"), messages)
+        return index
+
+    def _fetch(self, since: Optional[datetime]) -> Iterator[Tuple[dict, List[dict]]]:
+        """(session header, messages) of the sessions updated since `since` and within CHAT_SEARCH_MAX_AGE_DAYS."""
+        bounds = []
+        if since is not None:
+            bounds.append(since)
+        if settings.CHAT_SEARCH_MAX_AGE_DAYS > 0:
+            bounds.append(datetime.now(timezone.utc) - timedelta(days=settings.CHAT_SEARCH_MAX_AGE_DAYS))
+        query = {"updated_at": {"$gte": max(bounds)}} if bounds else {}
+        sessions = get_chat_history_collection().find(
+            query, {"session_id": 1, "user_id": 1, "updated_at": 1, **MESSAGE_PROJECTION}
+        ).batch_size(FETCH_BATCH_SIZE)
+        for session in sessions:
+            messages = session.get("messages")
+            if messages is None:
+                # Bucketed session: the header has no messages
+                buckets = get_chat_messages_collection().find(
+                    {"session_id": session["session_id"]}, MESSAGE_PROJECTION
+                ).sort("bucket", 1)
+                messages = [message for bucket in buckets for message in bucket.get("messages", [])]
+            yield session, messages
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "messages": len(self.index),
+            "sessions": self.index.session_count,
+            "terms": self.index.term_count,
+            "watermark": str(self.index.watermark) if self.index.watermark is not None else None
+        }
+
+
+chat_search = ChatSearch()
@@ -1,17 +1,77 @@
 import os
 import re
-from openai import OpenAI
+import asyncio
+import time
+from openai import AsyncOpenAI, NotFoundError, BadRequestError
 import json
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, AsyncIterator, Optional, Callable, Awaitable
 from ..models.chat_history_model import Message
-from app.database import get_chat_history_collection
+from app.core import metrics
+from app.core.config import settings
+from app.core.deadline import Deadline, iterate_until, REASON_DEADLINE, REASON_DISCONNECT
+from .chat_history import (
+    set_session_thread_id,
+    load_session_context,
+    recent_message_limit,
+    THREAD_ID_METADATA_KEY
+)
+from .response_cache import response_cache, make_cache_key, make_context_hash, make_generation
+from .semantic_cache import semantic_cache, build_embedder, context_id
+from .context_builder import build_context, count_tokens, count_messages_tokens, MESSAGE_OVERHEAD_TOKENS
+from .enhancement_prompt import build_enhancement_messages
+from .completion_prompt import build_completion_messages
+from .summary_prompt import summary_context_message
+from .product_index import product_catalog
+from .enhancement_policy import decide_enhancement, ENHANCE_SKIP
+from .openai_scheduler import openai_scheduler, OpenAIOverloaded, PRIORITY_WEB, PRIORITY_BATCH
+from .single_flight import single_flight
+from .resilience import hedged, get_circuit_breaker, get_latency_tracker
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client (async so runs never block the event loop).
+# Retries are left to openai_scheduler, which backs off with jitter and respects the deadline.
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 assistant_id = os.getenv("OPENAI_ASSISTANT_ID")
+# Model used for the second (formatting) pass
+ENHANCEMENT_MODEL = settings.OPENAI_ENHANCEMENT_MODEL
+# Policy reasons that mean the reply was degraded only because time ran short (never cached)
+TIME_DEGRADED_REASONS = ("no_time", "low_time")
+# Embeds questions for the semantic cache
+embedder = build_embedder(client)
+# Chat engines: the Assistant (threads + file search) or one chat completion over the
+# in-process product index (see product_index.py)
+ENGINE_ASSISTANT = "assistant"
+ENGINE_COMPLETION = "completion"
+CHAT_ENGINES = (ENGINE_ASSISTANT, ENGINE_COMPLETION)
+
+# Delay between run status checks while waiting for the Assistant
+RUN_POLL_INTERVAL = 0.5
+# Run statuses after which polling stops
+RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+# Reply when the OpenAI scheduler sheds the turn because it could not start before the deadline
+OVERLOADED_REPLY = "[Assistant is busy right now, please try again in a moment.]"
+# Reply when the Assistant's circuit breaker is open
+UNAVAILABLE_REPLY = "[Assistant is temporarily unavailable, please try again later.]"
+# Circuit breaker / latency tracker name of the Assistant runs
+ASSISTANT_CIRCUIT = "assistant"
+# Reason used when a run exceeds ASSISTANT_RUN_TIMEOUT_SECONDS (before the request deadline)
+REASON_RUN_TIMEOUT = "timeout"
+# Upper bound for the calls made after a request was abandoned (cancel, partial reply)
+ABANDON_GRACE_SECONDS = 3
+# max_tokens of the enhancement completion (also reserved in the TPM bucket)
+ENHANCEMENT_MAX_TOKENS = 1000
+# Keeps background run cancellations alive until they finish
+_pending_cancels = set()
+# Streaming events that carry a run in a terminal status
+RUN_TERMINAL_EVENTS = (
+    "thread.run.completed",
+    "thread.run.failed",
+    "thread.run.cancelled",
+    "thread.run.expired",
+    "thread.run.incomplete",
+)
 
 
 def _strip_emojis(text: str) -> str:
@@ -39,120 +99,1065 @@ def _strip_emojis(text: str) -> str:
 async def process_message_with_assistant_tool(
     message: str,
     session_id: str = None,
-    n_history: int = 5,
-    enhance_response: bool = True
+    n_history: Optional[int] = None,
+    enhance_response: bool = True,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB,
+    engine: Optional[str] = None,
+    session_data: Optional[dict] = None
 ) -> Tuple[str, dict]:
     """
     Process user message using OpenAI Assistant tool with vector search and chat history context.
     Returns: (AI's answer, token_usage dict from .usage field if available, else zeros)
     Includes automatic enhancement with OpenAI for better formatting.
+    History is selected by the context token budget; n_history optionally caps the message count.
+    The whole turn is bounded by deadline (default REQUEST_DEADLINE_SECONDS); when it expires or
+    the client disconnects, the run is cancelled and the best partial reply is returned.
+    OpenAI calls are queued in openai_scheduler at the given priority. Concurrent identical
+    questions (same cache key) share one run through single_flight.
+    engine selects "assistant" or "completion" (one chat completion over the product index);
+    None uses CHAT_ENGINE. session_data is the session document if the caller already has it
+    (saves reading it again).
+    """
+    engine = engine or settings.CHAT_ENGINE
+    logger.info(f"Processing message with enhance_response={enhance_response}, engine={engine}")
+    deadline = deadline or Deadline(settings.REQUEST_DEADLINE_SECONDS)
+    if session_data is None:
+        session_data = await _load_session(session_id)
+    context = _build_thread_messages(message, session_data, n_history)
+
+    cached, cache_lookup = await _lookup_cached_reply(
+        message, session_id, session_data, context, enhance_response, deadline, priority, engine
+    )
+    if cached:
+        return cached
+
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        assistant_reply, token_usage, cacheable = await _answer(
+            engine, message, session_id, session_data, context, enhance_response, deadline, priority
+        )
+        if cacheable:
+            await cache_lookup.store(assistant_reply, token_usage)
+        return assistant_reply, token_usage
+
+    flight_key = make_cache_key(message, cache_lookup.context_hash)
+    # The run may end up answering other users: only the leader's disconnect while nobody
+    # else is waiting may cancel it
+    flight_deadline = Deadline(deadline.remaining(), _disconnect_unless_shared(deadline, flight_key))
+
+    async def answer() -> Tuple[str, dict]:
+        reply, usage, cacheable = await _answer(
+            engine, message, session_id, session_data, context, enhance_response, flight_deadline, priority
+        )
+        if cacheable:
+            await cache_lookup.store(reply, usage)
+        return reply, usage
+
+    try:
+        (assistant_reply, token_usage), shared = await single_flight.do(
+            flight_key, answer, timeout=deadline.remaining()
+        )
+    except asyncio.TimeoutError:
+        _record_abandoned(REASON_DEADLINE, "single_flight")
+        return _abandoned_reply(REASON_DEADLINE), usage_to_dict(None)
+    if shared:
+        logger.info("Serving assistant reply from an identical in-flight request")
+        # The leader paid for the run; this turn behaves like a cache hit
+        return await _serve_cached_reply(assistant_reply, session_id, session_data)
+    return assistant_reply, token_usage
+
+async def process_message_with_deferred_enhancement(
+    message: str,
+    session_id: str = None,
+    n_history: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB,
+    engine: Optional[str] = None,
+    session_data: Optional[dict] = None
+) -> Tuple[str, dict, Optional[Callable[[], Awaitable[Optional[Tuple[str, dict]]]]]]:
+    """
+    Like process_message_with_assistant_tool with enhancement, but returns the raw Assistant
+    reply right away. Returns (reply, token_usage, enhance_job): enhance_job is None when the
+    reply is final (cache hit or failure); otherwise awaiting it produces (enhanced reply,
+    enhancement token_usage), or None if the policy decides enhancement is not worth it;
+    it raises when the enhancement call fails, is shed or its circuit is open.
+    The job's OpenAI call is queued at batch priority. The completion engine formats its reply
+    in the same call, so it never returns a job.
+    """
+    engine = engine or settings.CHAT_ENGINE
+    logger.info(f"Processing message with deferred enhancement, engine={engine}")
+    deadline = deadline or Deadline(settings.REQUEST_DEADLINE_SECONDS)
+    if session_data is None:
+        session_data = await _load_session(session_id)
+    context = _build_thread_messages(message, session_data, n_history)
+
+    cached, cache_lookup = await _lookup_cached_reply(
+        message, session_id, session_data, context, True, deadline, priority, engine
+    )
+    if cached:
+        return cached[0], cached[1], None
+
+    if engine == ENGINE_COMPLETION:
+        reply, token_usage, cacheable = await _answer_with_completion(
+            message, session_id, session_data, context, True, deadline, priority
+        )
+        if cacheable:
+            await cache_lookup.store(reply, token_usage)
+        return reply, token_usage, None
+
+    raw_reply, token_usage, cacheable = await _answer_with_assistant(
+        message, session_id, session_data, context, False, deadline, priority
+    )
+    if not cacheable:
+        return raw_reply, token_usage, None
+
+    async def enhance_job() -> Optional[Tuple[str, dict]]:
+        # Nobody is waiting on this reply any more, so the policy gets no time budget;
+        # the call itself is still bounded so a hung request cannot pin a worker slot
+        decision = decide_enhancement(raw_reply)
+        if decision.action == ENHANCE_SKIP:
+            await cache_lookup.store(raw_reply, token_usage)
+            return None
+        job_deadline = Deadline(settings.REQUEST_DEADLINE_SECONDS)
+        try:
+            enhanced_reply, enhancement_usage = await asyncio.wait_for(
+                enhance_with_openai(raw_reply, message, decision.model, job_deadline, PRIORITY_BATCH, raise_errors=True),
+                timeout=job_deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            _record_abandoned(REASON_DEADLINE, "deferred_enhancement")
+            raise
+        enhanced_reply = _strip_emojis(enhanced_reply)
+        if not enhanced_reply or enhanced_reply == raw_reply:
+            return None
+        await cache_lookup.store(enhanced_reply, _merge_usage(token_usage, enhancement_usage))
+        return enhanced_reply, enhancement_usage
+
+    return raw_reply, token_usage, enhance_job
+
+async def _answer(
+    engine: str,
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool,
+    deadline: Deadline,
+    priority: int = PRIORITY_WEB
+) -> Tuple[str, dict, bool]:
+    """Answer with the selected engine. Returns (reply, token_usage, cacheable)."""
+    if engine == ENGINE_COMPLETION:
+        return await _answer_with_completion(
+            message, session_id, session_data, context, enhance_response, deadline, priority
+        )
+    return await _answer_with_assistant(
+        message, session_id, session_data, context, enhance_response, deadline, priority
+    )
+
+async def _answer_with_completion(
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool,
+    deadline: Deadline,
+    priority: int = PRIORITY_WEB
+) -> Tuple[str, dict, bool]:
+    """
+    Answer with a single chat completion: products retrieved from the in-process index plus
+    the selected history. With enhance_response the formatting instructions are part of the
+    prompt, so there is no second pass. Falls back to the Assistant while COMPLETION_MODEL's
+    circuit is open. Returns (reply, token_usage, cacheable).
+    """
+    reason = await deadline.abandoned()
+    if reason:
+        _record_abandoned(reason, "history")
+        return _abandoned_reply(reason), usage_to_dict(None), False
+
+    model = settings.COMPLETION_MODEL
+    circuit = get_circuit_breaker(model)
+    if not circuit.allow():
+        if assistant_id:
+            metrics.incr("completion.circuit_fallback")
+            return await _answer_with_assistant(
+                message, session_id, session_data, context, enhance_response, deadline, priority
+            )
+        return UNAVAILABLE_REPLY, usage_to_dict(None), False
+
+    try:
+        messages = await _completion_messages(message, context, enhance_response)
+        tokens = count_messages_tokens(messages) + settings.COMPLETION_MAX_TOKENS
+        response = await asyncio.wait_for(
+            hedged(
+                model,
+                lambda: openai_scheduler.call(
+                    lambda: client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=settings.COMPLETION_MAX_TOKENS,
+                        temperature=0.3
+                    ),
+                    tokens=tokens,
+                    priority=priority,
+                    deadline=deadline
+                ),
+                estimated_tokens=tokens
+            ),
+            timeout=deadline.remaining()
+        )
+        circuit.record_success()
+    except asyncio.TimeoutError:
+        _record_abandoned(REASON_DEADLINE, "completion")
+        return _abandoned_reply(REASON_DEADLINE), usage_to_dict(None), False
+    except OpenAIOverloaded as e:
+        logger.warning(f"Completion call shed: {e}")
+        return OVERLOADED_REPLY, usage_to_dict(None), False
+    except Exception as e:
+        logger.error(f"OpenAI completion error: {e}")
+        circuit.record_failure()
+        return "[Error communicating with Assistant API.]", usage_to_dict(None), False
+
+    reply = (response.choices[0].message.content or "").strip()
+    if not reply:
+        return "[No assistant reply found.]", usage_to_dict(response.usage, model), False
+    token_usage = usage_to_dict(response.usage, model)
+    _record_completion_usage(token_usage)
+    await _forget_session_thread(session_id, session_data)
+    return _strip_emojis(reply), token_usage, True
+
+async def _completion_messages(
+    message: str,
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool
+) -> List[Dict[str, str]]:
+    """Prompt for the completion engine; the product search is skipped if the index is unavailable."""
+    try:
+        products = await product_catalog.search(message)
+    except Exception as e:
+        logger.error(f"Product search failed: {e}")
+        products = []
+    return build_completion_messages(context[0][:-1], message, products, enhance_response)
+
+def _record_completion_usage(usage: dict) -> None:
+    """Track how much of the completion prompt was served from the provider's prompt cache."""
+    metrics.incr("completion.prompt_tokens", usage.get("prompt_tokens", 0))
+    metrics.incr("completion.cached_tokens", usage.get("cached_tokens", 0))
+
+async def _forget_session_thread(session_id: Optional[str], session_data: Optional[dict]) -> None:
+    """This turn never reaches the session's thread: let the next Assistant turn re-seed it from history."""
+    if _session_thread_id(session_data):
+        await set_session_thread_id(session_id, None)
+
+async def _answer_with_assistant(
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool,
+    deadline: Deadline,
+    priority: int = PRIORITY_WEB
+) -> Tuple[str, dict, bool]:
     """
-    logger.info(f"Processing message with enhance_response={enhance_response}")
-    # Collect chat history
-    chat_history = []
-    if session_id:
-        collection = get_chat_history_collection()
-        session_data = collection.find_one({"session_id": session_id})
-        if session_data:
-            chat_history = session_data.get("messages", [])
-
-    # Prepare messages for context (last n_history + current)
-    messages = []
-    if chat_history:
-        for msg in chat_history[-n_history:]:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-    messages.append({"role": "user", "content": message})
+    Run the Assistant (plus optional enhancement) within the deadline.
+    Returns (reply, token_usage, cacheable); failed turns, partial replies and replies degraded
+    for lack of time are not cacheable.
+    """
+    # History load and cache lookups may already have used up the request
+    reason = await deadline.abandoned()
+    if reason:
+        _record_abandoned(reason, "history")
+        return _abandoned_reply(reason), usage_to_dict(None), False
+
+    # Fail fast while the Assistant keeps failing
+    circuit = get_circuit_breaker(ASSISTANT_CIRCUIT)
+    if not circuit.allow():
+        return UNAVAILABLE_REPLY, usage_to_dict(None), False
 
     try:
-        # Call OpenAI Assistant API (threading for context)
-        thread = client.beta.threads.create(messages=messages)
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id
+        # Reuse the session's OpenAI thread (or seed a new one) with the current message
+        run_started = time.monotonic()
+        thread_id, run = await asyncio.wait_for(
+            _start_run(message, session_id, session_data, context, deadline, priority),
+            timeout=deadline.remaining()
         )
         # Ensure token_usage is always defined so we can safely return it later
-        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        token_usage = usage_to_dict(None)
 
-        # Wait for completion (polling)
-        import time
-        while run.status not in ("completed", "failed", "cancelled"):
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        # Wait for completion (polling without blocking other requests)
+        run, reason = await _wait_for_run(thread_id, run, deadline)
+        _record_run_outcome(circuit, run, reason, run_started)
+        if reason:
+            # Run was cancelled: keep whatever text it produced so far
+            partial_reply = await _partial_reply(thread_id, run.id)
+            if partial_reply:
+                metrics.incr("assistant.run.partial_reply")
+                return _strip_emojis(partial_reply), token_usage, False
+            return _abandoned_reply(reason), token_usage, False
         if run.status == "completed":
             # Get the latest message from the thread
-            thread_messages = list(client.beta.threads.messages.list(thread_id=thread.id, run_id=run.id))
+            thread_messages = (await openai_scheduler.call(
+                lambda: client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id),
+                deadline=deadline,
+                admit=False
+            )).data
             assistant_reply = None
             if thread_messages and len(thread_messages) > 0:
                 assistant_reply = thread_messages[0].content[0].text.value
             if assistant_reply is None:
-                return ("[No assistant reply found.]", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+                return "[No assistant reply found.]", usage_to_dict(run.usage, run.model), False
 
             # Filter and format the response
             # assistant_reply = filter_response(assistant_reply)  # Removed filter function
             logger.info(f"Response after local filtering: {len(assistant_reply)} chars")
             
-            # Send to OpenAI for final enhancement
-            if enhance_response:
-                logger.info("Starting OpenAI enhancement...")
+            # Try to get token usage from .usage field if available
+            if hasattr(run, "usage") and run.usage:
+                token_usage = usage_to_dict(run.usage, run.model)
+
+            # Send to OpenAI for final enhancement, unless the policy says it is not worth it
+            decision = decide_enhancement(assistant_reply, deadline.remaining()) if enhance_response else None
+            degraded = bool(decision and decision.reason in TIME_DEGRADED_REASONS)
+            if decision and decision.action != ENHANCE_SKIP:
+                reason = await deadline.abandoned()
+                if reason:
+                    _record_abandoned(reason, "enhancement")
+                    decision, degraded = None, True
+            if decision and decision.action == ENHANCE_SKIP:
+                logger.info(f"Enhancement skipped by policy ({decision.reason})")
+            elif decision:
+                logger.info(f"Starting OpenAI enhancement ({decision.action}, {decision.reason})...")
                 try:
-                    enhanced_reply = await enhance_with_openai(assistant_reply, message)
-                    if enhanced_reply:
+                    enhanced_reply, enhancement_usage = await asyncio.wait_for(
+                        enhance_with_openai(assistant_reply, message, decision.model, deadline, priority),
+                        timeout=deadline.remaining()
+                    )
+                    token_usage = _merge_usage(token_usage, enhancement_usage)
+                    if enhanced_reply == assistant_reply:
+                        # Enhancement failed or its circuit is open: don't cache the raw reply as enhanced
+                        degraded = True
+                    elif enhanced_reply:
                         logger.info(f"Enhancement successful: {len(enhanced_reply)} chars")
                         # Ensure no emojis are returned
                         enhanced_reply = _strip_emojis(enhanced_reply)
                         assistant_reply = enhanced_reply
                     else:
                         logger.warning("Enhancement returned empty result")
+                except asyncio.TimeoutError:
+                    # Out of time: the raw reply is the best result we have
+                    logger.warning("Enhancement cut off by the request deadline, using raw reply")
+                    _record_abandoned(REASON_DEADLINE, "enhancement")
+                    degraded = True
                 except Exception as e:
                     logger.error(f"Enhancement failed: {e}")
                     # Continue with filtered response
             else:
                 logger.info("Enhancement disabled, using filtered response only")
 
-            # Try to get token usage from .usage field if available
-            
-            if hasattr(run, "usage") and run.usage:
-                usage = run.usage
-                token_usage = {
-                    "prompt_tokens": getattr(usage, "prompt_tokens", 0),
-                    "completion_tokens": getattr(usage, "completion_tokens", 0),
-                    "total_tokens": getattr(usage, "total_tokens", 0)
-                }
-
             # strip emojis from final assistant reply as an extra safety
             assistant_reply = _strip_emojis(assistant_reply)
-            return assistant_reply, token_usage
+            return assistant_reply, token_usage, not degraded
         else:
             logger.error(f"Assistant run failed: {run.status}")
-            return ("[Assistant failed to generate a response.]", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            return "[Assistant failed to generate a response.]", usage_to_dict(None), False
+    except asyncio.TimeoutError:
+        # Deadline passed before the run was even created
+        _record_abandoned(REASON_DEADLINE, "run")
+        return _abandoned_reply(REASON_DEADLINE), usage_to_dict(None), False
+    except OpenAIOverloaded as e:
+        logger.warning(f"Assistant call shed: {e}")
+        return OVERLOADED_REPLY, usage_to_dict(None), False
     except Exception as e:
         logger.error(f"OpenAI Assistant API error: {e}")
-        return ("[Error communicating with Assistant API.]", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+        circuit.record_failure()
+        return "[Error communicating with Assistant API.]", usage_to_dict(None), False
+
+def _record_run_outcome(circuit, run, reason: Optional[str], started: float) -> None:
+    """Feed a finished or abandoned run into the Assistant's circuit breaker and latency window."""
+    if reason is None and run.status == "completed":
+        circuit.record_success()
+        get_latency_tracker(ASSISTANT_CIRCUIT).record(time.monotonic() - started)
+    elif reason is None or reason == REASON_RUN_TIMEOUT:
+        # failed/expired/incomplete runs and runs over ASSISTANT_RUN_TIMEOUT_SECONDS;
+        # deadline and disconnect are the caller's doing, not the Assistant's
+        circuit.record_failure()
 
-async def enhance_with_openai(raw_response: str, original_message: str) -> str:
+async def _start_run(
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    deadline: Deadline,
+    priority: int
+):
+    """Prepare the thread and start a (non-streaming) run on it. Returns (thread_id, run)."""
+    thread_id = await _prepare_thread(message, session_id, session_data, context, deadline, priority)
+    run = await openai_scheduler.call(
+        lambda: client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            truncation_strategy=_truncation_strategy(context, session_data, thread_id)
+        ),
+        tokens=_run_token_estimate(context),
+        priority=priority,
+        deadline=deadline,
+        idempotent=False
+    )
+    return thread_id, run
+
+async def _wait_for_run(thread_id: str, run, deadline: Deadline):
     """
-    Send the raw response to OpenAI for final enhancement and formatting.
+    Poll a run until it reaches a terminal status, yielding to the event loop between checks.
+    Returns (run, reason): reason is None when the run finished; otherwise the run exceeded
+    ASSISTANT_RUN_TIMEOUT_SECONDS ("timeout"), the request deadline ("deadline") or the client
+    disconnected ("disconnect"), and it has been cancelled.
+    """
+    run_deadline = deadline.limited(settings.ASSISTANT_RUN_TIMEOUT_SECONDS)
+    while run.status not in RUN_TERMINAL_STATUSES:
+        reason = await run_deadline.abandoned()
+        if reason:
+            reason = REASON_RUN_TIMEOUT if reason == REASON_DEADLINE and not deadline.expired else reason
+            _record_abandoned(reason, "run")
+            await _cancel_run(thread_id, run.id, reason)
+            return run, reason
+        await asyncio.sleep(min(RUN_POLL_INTERVAL, run_deadline.remaining()))
+        try:
+            run = await asyncio.wait_for(
+                openai_scheduler.call(
+                    lambda: client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id),
+                    deadline=run_deadline,
+                    admit=False
+                ),
+                timeout=max(run_deadline.remaining(), RUN_POLL_INTERVAL)
+            )
+        except asyncio.TimeoutError:
+            continue
+    return run, None
+
+async def _cancel_run(thread_id: str, run_id: str, reason: str) -> None:
+    """Cancel an abandoned run so it stops consuming tokens."""
+    try:
+        await asyncio.wait_for(
+            openai_scheduler.call(
+                lambda: client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id),
+                admit=False
+            ),
+            timeout=ABANDON_GRACE_SECONDS
+        )
+        metrics.incr(f"assistant.run.cancelled.{reason}")
+        logger.warning(f"Cancelled run {run_id} on thread {thread_id} ({reason})")
+    except Exception as e:
+        metrics.incr("assistant.run.cancel_failed")
+        logger.error(f"Failed to cancel run {run_id} on thread {thread_id}: {e}")
+
+def _cancel_run_in_background(thread_id: str, run_id: str, reason: str) -> None:
+    """Cancel a run from code that can no longer await (e.g. a generator being closed)."""
+    task = asyncio.get_running_loop().create_task(_cancel_run(thread_id, run_id, reason))
+    _pending_cancels.add(task)
+    task.add_done_callback(_pending_cancels.discard)
+
+async def _partial_reply(thread_id: str, run_id: str) -> Optional[str]:
+    """Text the run wrote before it was cancelled, if any."""
+    try:
+        thread_messages = (await asyncio.wait_for(
+            openai_scheduler.call(
+                lambda: client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id),
+                admit=False
+            ),
+            timeout=ABANDON_GRACE_SECONDS
+        )).data
+        if thread_messages and thread_messages[0].content:
+            return thread_messages[0].content[0].text.value or None
+    except Exception as e:
+        logger.warning(f"Could not read partial reply of run {run_id}: {e}")
+    return None
+
+def _disconnect_unless_shared(deadline: Deadline, flight_key: str):
+    """Disconnect check for a single-flight leader that ignores the disconnect while followers wait."""
+    if deadline.is_disconnected is None:
+        return None
+
+    async def is_disconnected() -> bool:
+        return not single_flight.waiting(flight_key) and await deadline.is_disconnected()
+    return is_disconnected
+
+def _run_token_estimate(context: Tuple[List[Dict[str, str]], int]) -> int:
+    """Tokens to reserve for an Assistant run: the selected context plus instructions/retrieval/answer."""
+    return context[1] + settings.ASSISTANT_RUN_TOKEN_ESTIMATE
+
+def _truncation_strategy(
+    context: Tuple[List[Dict[str, str]], int],
+    session_data: Optional[dict],
+    thread_id: str
+) -> dict:
+    """
+    Limit a run to as many of the thread's last messages as the budgeted context holds. A
+    reused thread keeps every earlier turn, so without this the prompt grows past
+    CONTEXT_TOKEN_BUDGET with the conversation. The summary message is only on threads
+    seeded from the context; a reused thread holds the turns it summarizes instead.
+    """
+    last_messages = len(context[0])
+    if (session_data or {}).get("summary") and thread_id == _session_thread_id(session_data):
+        last_messages -= 1
+    return {"type": "last_messages", "last_messages": last_messages}
+
+def _abandoned_reply(reason: str) -> str:
+    """Reply used when a turn is abandoned before the Assistant wrote anything."""
+    if reason == REASON_DEADLINE or reason == REASON_RUN_TIMEOUT:
+        return "[Assistant timed out before generating a response.]"
+    return "[Request cancelled before the Assistant responded.]"
+
+def _record_abandoned(reason: str, stage: str) -> None:
+    """Count a turn that stopped waiting: request.<deadline|timeout|disconnect>.<stage>."""
+    metrics.incr(f"request.{reason}.{stage}")
+
+async def _load_session(session_id: str) -> Optional[dict]:
+    """Load the recent messages and metadata used to build the Assistant context."""
+    if not session_id:
+        return None
+    return await load_session_context(session_id, recent_message_limit())
+
+def _build_thread_messages(
+    message: str,
+    session_data: Optional[dict],
+    n_history: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Select history that fits the context token budget (newest first, optionally capped at
+    n_history messages) plus the current message. When the session has a rolling summary it
+    goes first and replaces the messages it covers. Returns (messages, tokens spent).
+    """
+    chat_history = session_data.get("messages", []) if session_data else []
+    summary = session_data.get("summary") if session_data else None
+    if summary and chat_history:
+        # Position of the first loaded message in the whole conversation
+        first_position = (session_data.get("message_count") or len(chat_history)) - len(chat_history)
+        chat_history = chat_history[max((session_data.get("summary_upto") or 0) - first_position, 0):]
+    # The route stores the current user message before calling us; don't send it twice
+    if chat_history and chat_history[-1]["role"] == "user" and chat_history[-1]["content"] == message:
+        chat_history = chat_history[:-1]
+
+    return build_context(
+        chat_history,
+        message,
+        token_budget=settings.CONTEXT_TOKEN_BUDGET,
+        max_message_tokens=settings.CONTEXT_MAX_MESSAGE_TOKENS,
+        max_messages=min(n_history or settings.CONTEXT_MAX_HISTORY_MESSAGES, settings.CONTEXT_MAX_HISTORY_MESSAGES),
+        summary_message=summary_context_message(summary) if summary else None
+    )
+
+async def _seed_thread(
+    context: Tuple[List[Dict[str, str]], int],
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB
+) -> str:
+    """Create a new thread seeded with the selected history and the current message."""
+    messages, tokens = context
+    thread = await openai_scheduler.call(
+        lambda: client.beta.threads.create(messages=messages),
+        priority=priority,
+        deadline=deadline,
+        idempotent=False
+    )
+    metrics.incr("assistant.thread.created")
+    metrics.incr("assistant.history_messages.uploaded", len(messages) - 1)
+    metrics.incr("assistant.context_tokens.uploaded", tokens)
+    return thread.id
+
+def _session_thread_id(session_data: Optional[dict]) -> Optional[str]:
+    """OpenAI thread id stored on the session, if any."""
+    return ((session_data or {}).get("metadata") or {}).get(THREAD_ID_METADATA_KEY)
+
+async def _prepare_thread(
+    message: str,
+    session_id: str,
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB
+) -> str:
+    """
+    Return a thread id ready to run for this turn.
+    The session's thread (metadata.openai_thread_id) is reused by appending only the new user
+    message; a thread that no longer exists is re-seeded from the stored history and saved back.
+    """
+    thread_id = _session_thread_id(session_data)
+
+    if thread_id:
+        try:
+            await openai_scheduler.call(
+                lambda: client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message),
+                priority=priority,
+                deadline=deadline,
+                idempotent=False
+            )
+            metrics.incr("assistant.thread.reused")
+            metrics.incr("assistant.history_messages.saved", len(context[0]) - 1)
+            metrics.incr("assistant.context_tokens.saved", context[1] - count_tokens(message) - MESSAGE_OVERHEAD_TOKENS)
+            return thread_id
+        except NotFoundError:
+            logger.warning(f"Thread {thread_id} for session {session_id} expired, re-seeding")
+            metrics.incr("assistant.thread.reseeded")
+        except BadRequestError as e:
+            # Typically a run is still active on the shared thread: answer on a throwaway thread
+            logger.warning(f"Cannot append to thread {thread_id}: {e}")
+            metrics.incr("assistant.thread.busy")
+            return await _seed_thread(context, deadline, priority)
+
+    thread_id = await _seed_thread(context, deadline, priority)
+    if session_data:
+        await set_session_thread_id(session_id, thread_id)
+    return thread_id
+
+class _CacheLookup:
+    """Outcome of checking the reply caches for one turn; knows where to store the fresh reply."""
+
+    def __init__(self, cache_key: Optional[str], context_hash: str, vector=None):
+        self.cache_key = cache_key
+        self.context_hash = context_hash
+        self.vector = vector
+
+    async def store(self, reply: str, token_usage: dict) -> None:
+        if self.cache_key:
+            await response_cache.set(self.cache_key, reply, token_usage)
+        if self.vector is not None and semantic_cache is not None:
+            semantic_cache.add(self.vector, context_id(self.context_hash), reply)
+
+async def _lookup_cached_reply(
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB,
+    engine: str = ENGINE_ASSISTANT
+) -> Tuple[Optional[Tuple[str, dict]], _CacheLookup]:
+    """
+    Check the exact-match cache, then the semantic cache.
+    Returns ((reply, zero token usage) or None, lookup handle used to store a fresh reply).
+    Replies of the two engines are cached apart.
+    """
+    history = context[0][:-1]
+    context_hash = make_context_hash(history, _engine_id(engine), enhance_response, ENHANCEMENT_MODEL)
+    lookup = _CacheLookup(None, context_hash)
+    generation = make_generation(f"{assistant_id}\x1f{settings.COMPLETION_MODEL}", ENHANCEMENT_MODEL)
+
+    if settings.RESPONSE_CACHE_ENABLED:
+        await response_cache.ensure_generation(generation)
+        lookup.cache_key = make_cache_key(message, context_hash)
+        cached = await response_cache.get(lookup.cache_key)
+        if cached is not None:
+            logger.info("Serving assistant reply from response cache")
+            return await _serve_cached_reply(cached[0], session_id, session_data), lookup
+
+    if semantic_cache is not None:
+        semantic_cache.ensure_generation(generation)
+        try:
+            if embedder.remote:
+                vectors = await openai_scheduler.call(
+                    lambda: embedder.embed([message]),
+                    tokens=count_tokens(message),
+                    priority=priority,
+                    deadline=deadline
+                )
+            else:
+                vectors = await embedder.embed([message])
+            lookup.vector = vectors[0]
+        except Exception as e:
+            logger.error(f"Semantic cache embedding failed: {e}")
+            return None, lookup
+        reply = semantic_cache.lookup(lookup.vector, context_id(context_hash))
+        if reply is not None:
+            logger.info("Serving assistant reply from semantic cache")
+            # Known paraphrase: no need to add it as a new row
+            lookup.vector = None
+            return await _serve_cached_reply(reply, session_id, session_data), lookup
+
+    return None, lookup
+
+def _engine_id(engine: str) -> str:
+    """What produces an engine's replies, for the cache context hash."""
+    if engine == ENGINE_COMPLETION:
+        return f"{ENGINE_COMPLETION}:{settings.COMPLETION_MODEL}"
+    return assistant_id or ""
+
+async def _serve_cached_reply(reply: str, session_id: Optional[str], session_data: Optional[dict]) -> Tuple[str, dict]:
+    """Return a cached reply with zero token usage."""
+    await _forget_session_thread(session_id, session_data)
+    return reply, usage_to_dict(None)
+
+def usage_to_dict(usage, model: Optional[str] = None) -> dict:
+    """
+    Convert an OpenAI usage object into the token_usage dict used across the app; model is
+    the model that produced it (None when no call was made, e.g. a cache hit).
     """
+    if not usage:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0, "model": model}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "model": model
+    }
+
+_USAGE_COUNTS = ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")
+
+def _merge_usage(usage: dict, enhancement_usage: dict) -> dict:
+    """Add an enhancement's token_usage to the reply's; its model is kept as enhancement_model."""
+    merged = {key: usage.get(key, 0) + enhancement_usage.get(key, 0) for key in _USAGE_COUNTS}
+    merged["model"] = usage.get("model")
+    merged["enhancement_model"] = enhancement_usage.get("model")
+    return merged
+
+def _record_enhancement_usage(usage: dict) -> None:
+    """Track how much of the enhancement prompt was served from the provider's prompt cache."""
+    metrics.incr("enhancement.prompt_tokens", usage.get("prompt_tokens", 0))
+    metrics.incr("enhancement.cached_tokens", usage.get("cached_tokens", 0))
+
+async def stream_message_with_assistant_tool(
+    message: str,
+    session_id: str = None,
+    n_history: Optional[int] = None,
+    enhance_response: bool = True,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB,
+    engine: Optional[str] = None,
+    session_data: Optional[dict] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming variant of process_message_with_assistant_tool.
+    Yields (event, data) tuples:
+      - ("assistant_delta", {"text": ...}) while the Assistant run streams its reply
+      - ("enhancement_start", {}) once the raw reply is complete and enhancement begins
+      - ("enhancement_delta", {"text": ...}) while the enhanced reply streams
+      - ("final", {"reply": ..., "token_usage": {...}}) exactly once, always last
+    Errors are not raised; the stream ends with a "final" event carrying the usual error text.
+    When the deadline expires the run is cancelled and "final" carries the text streamed so far;
+    when the client disconnects (the generator is closed) the run is cancelled in the background.
+    The completion engine streams its (already formatted) reply as assistant_delta events only.
+    """
+    engine = engine or settings.CHAT_ENGINE
+    logger.info(f"Streaming message with enhance_response={enhance_response}, engine={engine}")
+    deadline = deadline or Deadline(settings.REQUEST_DEADLINE_SECONDS)
+    token_usage = usage_to_dict(None)
+    if session_data is None:
+        session_data = await _load_session(session_id)
+    context = _build_thread_messages(message, session_data, n_history)
+
+    cached, cache_lookup = await _lookup_cached_reply(
+        message, session_id, session_data, context, enhance_response, deadline, priority, engine
+    )
+    if cached:
+        yield "assistant_delta", {"text": cached[0]}
+        yield "final", {"reply": cached[0], "token_usage": cached[1]}
+        return
+
+    reason = await deadline.abandoned()
+    if reason:
+        _record_abandoned(reason, "history")
+        yield "final", {"reply": _abandoned_reply(reason), "token_usage": token_usage}
+        return
+
+    if engine == ENGINE_COMPLETION and get_circuit_breaker(settings.COMPLETION_MODEL).allow():
+        async for event, data in _stream_with_completion(
+            message, session_id, session_data, context, enhance_response, deadline, priority, cache_lookup
+        ):
+            yield event, data
+        return
+    if engine == ENGINE_COMPLETION:
+        metrics.incr("completion.circuit_fallback")
+
+    circuit = get_circuit_breaker(ASSISTANT_CIRCUIT)
+    if not circuit.allow():
+        yield "final", {"reply": UNAVAILABLE_REPLY, "token_usage": token_usage}
+        return
+
+    run_started = time.monotonic()
+    thread_id = run_id = stream = None
+    parts = []
+    run = None
+    run_deadline = deadline.limited(settings.ASSISTANT_RUN_TIMEOUT_SECONDS)
+    try:
+        thread_id = await asyncio.wait_for(
+            _prepare_thread(message, session_id, session_data, context, deadline, priority),
+            timeout=run_deadline.remaining()
+        )
+        stream = await openai_scheduler.call(
+            lambda: client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                truncation_strategy=_truncation_strategy(context, session_data, thread_id),
+                stream=True
+            ),
+            tokens=_run_token_estimate(context),
+            priority=priority,
+            deadline=deadline,
+            idempotent=False
+        )
+        async for event in iterate_until(stream, run_deadline):
+            if event.event == "thread.run.created":
+                run_id = event.data.id
+            elif event.event == "thread.message.delta":
+                for block in event.data.delta.content or []:
+                    if block.type == "text" and block.text and block.text.value:
+                        text = _strip_emojis(block.text.value)
+                        parts.append(text)
+                        yield "assistant_delta", {"text": text}
+            elif event.event in RUN_TERMINAL_EVENTS:
+                run = event.data
+    except asyncio.TimeoutError:
+        reason = REASON_DEADLINE if deadline.expired else REASON_RUN_TIMEOUT
+        _record_abandoned(reason, "run")
+        _record_run_outcome(circuit, run, reason, run_started)
+        if run_id:
+            await _cancel_run(thread_id, run_id, reason)
+        if stream is not None:
+            await stream.close()
+        if parts:
+            metrics.incr("assistant.run.partial_reply")
+            yield "final", {"reply": "".join(parts), "token_usage": token_usage}
+        else:
+            yield "final", {"reply": _abandoned_reply(reason), "token_usage": token_usage}
+        return
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client disconnected and the response is being torn down: nothing can be awaited here
+        _record_abandoned(REASON_DISCONNECT, "run")
+        if run_id and run is None:
+            _cancel_run_in_background(thread_id, run_id, REASON_DISCONNECT)
+        raise
+    except OpenAIOverloaded as e:
+        logger.warning(f"Streaming assistant call shed: {e}")
+        yield "final", {"reply": OVERLOADED_REPLY, "token_usage": token_usage}
+        return
+    except Exception as e:
+        logger.error(f"OpenAI Assistant API streaming error: {e}")
+        circuit.record_failure()
+        yield "final", {"reply": "[Error communicating with Assistant API.]", "token_usage": token_usage}
+        return
+
+    if run is None:
+        circuit.record_failure()
+    else:
+        _record_run_outcome(circuit, run, None, run_started)
+    if run is None or run.status != "completed":
+        logger.error(f"Assistant streaming run failed: {run.status if run else 'no terminal event'}")
+        yield "final", {"reply": "[Assistant failed to generate a response.]", "token_usage": token_usage}
+        return
+
+    token_usage = usage_to_dict(run.usage, run.model)
+    assistant_reply = "".join(parts)
+    if not assistant_reply:
+        yield "final", {"reply": "[No assistant reply found.]", "token_usage": token_usage}
+        return
+
+    decision = decide_enhancement(assistant_reply, deadline.remaining()) if enhance_response else None
+    degraded = bool(decision and decision.reason in TIME_DEGRADED_REASONS)
+    enhancement_model = _available_model(decision.model) if decision and decision.action != ENHANCE_SKIP else None
+    if decision and decision.action == ENHANCE_SKIP:
+        logger.info(f"Streaming enhancement skipped by policy ({decision.reason})")
+    elif decision and enhancement_model is None:
+        logger.warning(f"Streaming enhancement skipped, circuit open for {decision.model}")
+        degraded = True
+    elif decision:
+        yield "enhancement_start", {}
+        enhanced_parts = []
+        response = None
+        enhancement_circuit = get_circuit_breaker(enhancement_model)
+        try:
+            enhancement_messages = build_enhancement_messages(assistant_reply, message)
+            response = await asyncio.wait_for(
+                openai_scheduler.call(
+                    lambda: client.chat.completions.create(
+                        model=enhancement_model,
+                        messages=enhancement_messages,
+                        max_tokens=ENHANCEMENT_MAX_TOKENS,
+                        temperature=0.3,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    ),
+                    tokens=count_messages_tokens(enhancement_messages) + ENHANCEMENT_MAX_TOKENS,
+                    priority=priority,
+                    deadline=deadline
+                ),
+                timeout=deadline.remaining()
+            )
+            async for chunk in iterate_until(response, deadline):
+                if chunk.usage:
+                    enhancement_usage = usage_to_dict(chunk.usage, enhancement_model)
+                    _record_enhancement_usage(enhancement_usage)
+                    token_usage = _merge_usage(token_usage, enhancement_usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = _strip_emojis(chunk.choices[0].delta.content)
+                    enhanced_parts.append(text)
+                    yield "enhancement_delta", {"text": text}
+            enhancement_circuit.record_success()
+            enhanced_reply = "".join(enhanced_parts).strip()
+            if enhanced_reply:
+                assistant_reply = enhanced_reply
+            else:
+                logger.warning("Streaming enhancement returned empty result")
+        except asyncio.TimeoutError:
+            # Out of time: fall back to the complete raw reply instead of a cut-off enhancement
+            logger.warning("Streaming enhancement cut off by the request deadline, using raw reply")
+            _record_abandoned(REASON_DEADLINE, "enhancement")
+            degraded = True
+            if response is not None:
+                await response.close()
+        except OpenAIOverloaded as e:
+            logger.warning(f"Streaming enhancement shed: {e}")
+            degraded = True
+        except Exception as e:
+            # Keep the raw reply the client has already rendered
+            logger.error(f"Streaming enhancement failed: {e}")
+            enhancement_circuit.record_failure()
+            degraded = True
+
+    assistant_reply = _strip_emojis(assistant_reply)
+    if not degraded:
+        await cache_lookup.store(assistant_reply, token_usage)
+    yield "final", {"reply": assistant_reply, "token_usage": token_usage}
+
+async def _stream_with_completion(
+    message: str,
+    session_id: Optional[str],
+    session_data: Optional[dict],
+    context: Tuple[List[Dict[str, str]], int],
+    enhance_response: bool,
+    deadline: Deadline,
+    priority: int,
+    cache_lookup: _CacheLookup
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Streaming variant of _answer_with_completion (same events as the Assistant stream)."""
+    model = settings.COMPLETION_MODEL
+    circuit = get_circuit_breaker(model)
+    token_usage = usage_to_dict(None)
+    parts = []
+    response = None
     try:
-        enhancement_prompt = f"""Đây là phản hồi từ trợ lý AI cho câu hỏi: "{original_message}"
-Phản hồi gốc: {raw_response} Vai trò & phong cách: Bạn là một "nhà tư vấn bán hàng có tâm" — thân thiện, trung thực, thực tế và nhiệt tình. Trả lời như một người tư vấn trực tiếp cho khách: dùng ngôi xưng thân mật (ví dụ "Mình"), ngắn gọn, dễ đọc, không khoa trương. Yêu cầu cải thiện (trả về bằng tiếng Việt, tự nhiên và không giống robot): 1) Giữ định dạng rõ ràng: xuống dòng để tách phần, dùng **text** để in đậm tiêu đề sản phẩm. 2) Tuyệt đối KHÔNG TẠO hoặc BÁN CÁC liên kết/giá giả. Chỉ chèn liên kết nếu phản hồi gốc có URL thực; nếu không có URL, bỏ luôn mục "Nơi mua". Nếu có link thực, ẩn link bên trong tên nền tảng bằng cú pháp markdown, ví dụ [Shopee](https://...), [Drive](https://...). 3) KHÔNG THÊM emoji/biểu tượng dưới bất kỳ hình thức nào trong toàn bộ phản hồi. Tuyệt đối không chèn bất kỳ ký tự cảm xúc hoặc biểu tượng nào. 4) Thay vì một mục riêng "Nhận định của tôi", hãy khéo léo xen 1 câu nhận xét tinh tế ngay trong mô tả sản phẩm (ví dụ: "Mình thấy sản phẩm này phù hợp cho gia đình có trẻ nhỏ vì..."). Giữ nhận xét ngắn, thực tế và có tính đề xuất (ví dụ "phù hợp nếu...", "tốt cho..."). 5) Nếu có giá/ưu đãi trong phản hồi gốc, đặt vào mục "Giá & Ưu đãi"; không đoán giá nếu không có dữ liệu. 6) Nếu phản hồi gốc có link rút gọn hoặc link đến Drive/TikTok/Facebook/Shopee, hiển thị dưới dạng markdown link với tên nền tảng (ví dụ [Drive](...)). 7) Tránh bảng, JSON hay metadata; viết như một người tư vấn: thân thiện, ngắn, rõ ràng. Kết quả mong muốn (chỉ trả về phần văn bản đã định dạng, không giải thích cách làm): - Tiêu đề sản phẩm (in đậm bằng ** ) - Các thuộc tính chính (dung tích, công dụng, đặc điểm nổi bật,...), mỗi dòng 1 ý - Giá & Ưu đãi (nếu phản hồi gốc có) - Nơi mua (nếu phản hồi gốc có link) với markdown links Phong cách cụ thể: thân mật, nhẹ nhàng, trung thực; tránh xưng quá trang trọng hoặc quá kỹ thuật. Khi cần gợi ý, dùng câu như "Mình khuyên..." hoặc "Nếu bạn cần...". YÊU CẦU MỞ RỘNG (bắt buộc): - Với mỗi sản phẩm, liệt kê CHI TIẾT tất cả tính năng / đặc tính có trong phản hồi gốc và nếu có thể suy luận một cách hợp lý từ dữ liệu: thành phần, công nghệ (nếu có), khả năng tẩy/rửa, khử mùi, độ an toàn cho da, cấp độ hương thơm, hiệu quả tiết kiệm/người dùng, dạng (lỏng/túi/bọt), dung tích, hướng dẫn sử dụng (liều lượng cho kg quần áo), lưu ý an toàn (tránh tiếp xúc với mắt, v.v.), cách bảo quản, và đối tượng khuyên dùng. - Nếu phản hồi gốc KHÔNG CUNG CẤP thông tin nào trong các mục trên, hãy BỎ QUA mục đó (không in "Không có thông tin" và không tự bịa thông tin). - Ở cuối mỗi sản phẩm, thêm 1 mục nhỏ "Mẹo ngắn" (1 câu) gợi ý bảo quản hoặc cách dùng để hiệu quả hơn, nếu có thể. - Giữ phong cách tư vấn: xen 1 câu nhận xét tinh tế trong mô tả (không cần mục riêng), ví dụ "Mình nghĩ sản phẩm này phù hợp cho...". - Không thêm liên kết hoặc giá nếu không có trong phản hồi gốc; nếu có link, dùng markdown link với tên nền tảng. Trả về chỉ phần văn bản đã định dạng, đầy đủ chi tiết theo yêu cầu trên.
-"""
+        messages = await _completion_messages(message, context, enhance_response)
+        response = await asyncio.wait_for(
+            openai_scheduler.call(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=settings.COMPLETION_MAX_TOKENS,
+                    temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ),
+                tokens=count_messages_tokens(messages) + settings.COMPLETION_MAX_TOKENS,
+                priority=priority,
+                deadline=deadline
+            ),
+            timeout=deadline.remaining()
+        )
+        async for chunk in iterate_until(response, deadline):
+            if chunk.usage:
+                token_usage = usage_to_dict(chunk.usage, model)
+                _record_completion_usage(token_usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = _strip_emojis(chunk.choices[0].delta.content)
+                parts.append(text)
+                yield "assistant_delta", {"text": text}
+        circuit.record_success()
+    except asyncio.TimeoutError:
+        _record_abandoned(REASON_DEADLINE, "completion")
+        if response is not None:
+            await response.close()
+        reply = "".join(parts) or _abandoned_reply(REASON_DEADLINE)
+        yield "final", {"reply": reply, "token_usage": token_usage}
+        return
+    except OpenAIOverloaded as e:
+        logger.warning(f"Streaming completion shed: {e}")
+        yield "final", {"reply": OVERLOADED_REPLY, "token_usage": token_usage}
+        return
+    except (asyncio.CancelledError, GeneratorExit):
+        _record_abandoned(REASON_DISCONNECT, "completion")
+        raise
+    except Exception as e:
+        logger.error(f"OpenAI completion streaming error: {e}")
+        circuit.record_failure()
+        yield "final", {"reply": "[Error communicating with Assistant API.]", "token_usage": token_usage}
+        return
+
+    reply = _strip_emojis("".join(parts).strip())
+    if not reply:
+        yield "final", {"reply": "[No assistant reply found.]", "token_usage": token_usage}
+        return
+    await _forget_session_thread(session_id, session_data)
+    await cache_lookup.store(reply, token_usage)
+    yield "final", {"reply": reply, "token_usage": token_usage}
 
+async def enhance_with_openai(
+    raw_response: str,
+    original_message: str,
+    model: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB,
+    raise_errors: bool = False
+) -> Tuple[str, dict]:
+    """
+    Send the raw response to OpenAI for final enhancement and formatting.
+    Returns (enhanced text, token_usage of the enhancement call incl. cached_tokens).
+    A model whose circuit is open is replaced by the fast model (or the raw response is
+    returned); slow calls are hedged when HEDGE_ENABLED. With raise_errors, a failed,
+    shed or circuit-broken enhancement raises instead of returning the raw response.
+    """
+    model = _available_model(model or ENHANCEMENT_MODEL)
+    if model is None:
+        logger.warning("Enhancement skipped, circuit open")
+        if raise_errors:
+            raise OpenAIOverloaded("enhancement circuit open")
+        return raw_response, usage_to_dict(None)
+    circuit = get_circuit_breaker(model)
+    try:
         # Create a simple chat completion for enhancement
-        response = client.chat.completions.create(
-            model="gpt-4.1",  # Use cheaper model for enhancement
-            messages=[
-                {"role": "system", "content": "Bạn là một chuyên gia định dạng và cải thiện phản hồi chatbot. Hãy làm cho phản hồi trở nên đẹp mắt và chuyên nghiệp hơn."},
-                {"role": "user", "content": enhancement_prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.3
+        messages = build_enhancement_messages(raw_response, original_message)
+        tokens = count_messages_tokens(messages) + ENHANCEMENT_MAX_TOKENS
+        response = await hedged(
+            model,
+            lambda: openai_scheduler.call(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=ENHANCEMENT_MAX_TOKENS,
+                    temperature=0.3
+                ),
+                tokens=tokens,
+                priority=priority,
+                deadline=deadline
+            ),
+            estimated_tokens=tokens
         )
+        circuit.record_success()
         
         enhanced_response = response.choices[0].message.content.strip()
-        return enhanced_response
+        usage = usage_to_dict(response.usage, model)
+        _record_enhancement_usage(usage)
+        return enhanced_response, usage
         
+    except OpenAIOverloaded as e:
+        logger.warning(f"Enhancement shed: {e}")
+        if raise_errors:
+            raise
+        return raw_response, usage_to_dict(None)
     except Exception as e:
         logger.error(f"Error enhancing response with OpenAI: {e}")
+        circuit.record_failure()
+        if raise_errors:
+            raise
         # Return raw response if enhancement fails
-        return raw_response
+        return raw_response, usage_to_dict(None)
+
+def _available_model(model: str) -> Optional[str]:
+    """model if its circuit allows a call, else the fast model as fallback, else None."""
+    if get_circuit_breaker(model).allow():
+        return model
+    fallback = settings.ENHANCE_FAST_MODEL
+    if fallback != model and get_circuit_breaker(fallback).allow():
+        metrics.incr("enhancement.circuit_fallback")
+        return fallback
+    metrics.incr("enhancement.circuit_open")
+    return None
@@ -0,0 +1,44 @@
+"""
+Prompt for the chat-completions engine.
+
+The engine answers in a single call, so the system prompt combines the sales-assistant role
+with the enhancement formatting instructions (when enhancement is requested). That part is
+fixed and comes first so it stays cacheable; the retrieved products, history and question
+follow.
+"""
+
+from typing import Dict, List
+
+from .enhancement_prompt import ENHANCEMENT_INSTRUCTIONS
+
+COMPLETION_ROLE = (
+    "Bạn là trợ lý tư vấn bán hàng của cửa hàng. Chỉ tư vấn dựa trên danh sách sản phẩm được cung cấp "
+    "trong phần \"Sản phẩm liên quan\"; không bịa tên sản phẩm, giá hay liên kết. Nếu không có sản phẩm "
+    "phù hợp, hãy nói rõ và hỏi thêm nhu cầu của khách. Trả lời bằng tiếng Việt."
+)
+COMPLETION_SYSTEM_PROMPT = COMPLETION_ROLE
+COMPLETION_ENHANCED_SYSTEM_PROMPT = f"{COMPLETION_ROLE}\n\n{ENHANCEMENT_INSTRUCTIONS}"
+PRODUCTS_HEADER = "Sản phẩm liên quan:"
+NO_PRODUCTS = "Sản phẩm liên quan: (không tìm thấy sản phẩm phù hợp)"
+
+
+def build_completion_messages(
+    history: List[Dict[str, str]],
+    message: str,
+    products: List[str],
+    enhance_response: bool
+) -> List[Dict[str, str]]:
+    """Build the messages for a single-call answer: instructions, products, history, question."""
+    system_prompt = COMPLETION_ENHANCED_SYSTEM_PROMPT if enhance_response else COMPLETION_SYSTEM_PROMPT
+    if products:
+        product_block = PRODUCTS_HEADER + "\n\n" + "\n\n".join(
+            f"[{number}]\n{product}" for number, product in enumerate(products, 1)
+        )
+    else:
+        product_block = NO_PRODUCTS
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": product_block},
+        *history,
+        {"role": "user", "content": message}
+    ]
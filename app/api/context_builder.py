@@ -0,0 +1,102 @@
+"""
+Token-budgeted context assembly for the Assistant thread.
+
+Instead of a fixed number of history messages, history is added from newest to oldest until
+a token budget is spent. Oversized messages are truncated, and token counts are memoized per
+message text so stored history is not re-encoded on every turn.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import tiktoken
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-message framing overhead (role, separators) in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+# Do not bother adding a truncated message smaller than this
+MIN_TRUNCATED_TOKENS = 32
+# Rough characters-per-token ratio used when the tiktoken encoding cannot be loaded
+FALLBACK_CHARS_PER_TOKEN = 3
+TRUNCATION_MARKER = "…"
+
+
+@lru_cache(maxsize=1)
+def get_encoder() -> Optional[tiktoken.Encoding]:
+    """Load the tiktoken encoding once per process; None if it is unavailable (e.g. offline)."""
+    try:
+        return tiktoken.get_encoding(settings.CONTEXT_TOKEN_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {settings.CONTEXT_TOKEN_ENCODING} unavailable, estimating tokens: {e}")
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Count tokens of a text (memoized per text)."""
+    encoder = get_encoder()
+    if encoder is None:
+        return len(text) // FALLBACK_CHARS_PER_TOKEN + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """Count tokens of chat messages including the per-message framing overhead."""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text down to at most max_tokens tokens, marking the cut (the marker's tokens included)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(max_tokens - count_tokens(TRUNCATION_MARKER), 0)
+    encoder = get_encoder()
+    if encoder is None:
+        return text[:keep * FALLBACK_CHARS_PER_TOKEN] + TRUNCATION_MARKER
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARKER
+
+
+def build_context(
+    history: List[dict],
+    message: str,
+    token_budget: int,
+    max_message_tokens: int,
+    max_messages: Optional[int] = None,
+    summary_message: Optional[Dict[str, str]] = None
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Fill token_budget with history from newest to oldest, then append the current message.
+    The current message is always included as is and counts against the budget, and so does
+    summary_message (the summary of older history), which is placed first.
+    Returns (messages oldest-first, tokens spent).
+    """
+    spent = count_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+    if summary_message:
+        spent += count_tokens(summary_message["content"]) + MESSAGE_OVERHEAD_TOKENS
+    selected: List[Dict[str, str]] = []
+    candidates = history[-max_messages:] if max_messages else history
+
+    for msg in reversed(candidates):
+        remaining = token_budget - spent - MESSAGE_OVERHEAD_TOKENS
+        if remaining < MIN_TRUNCATED_TOKENS:
+            break
+        content = msg["content"]
+        tokens = count_tokens(content)
+        limit = min(max_message_tokens, remaining)
+        if tokens > limit:
+            content = truncate_to_tokens(content, limit)
+            tokens = count_tokens(content)
+        selected.append({"role": msg["role"], "content": content})
+        spent += tokens + MESSAGE_OVERHEAD_TOKENS
+        if tokens >= remaining:
+            break
+
+    if summary_message:
+        selected.append(summary_message)
+    selected.reverse()
+    selected.append({"role": "user", "content": message})
+    return selected, spent
@@ -0,0 +1,152 @@
+"""
+Index bootstrap and query-plan checks for the hot chat-history / token-usage queries.
+
+ensure_indexes() runs at startup (lifespan) and is idempotent: create_index is a no-op for
+an index that already exists with the same options, and a TTL whose configured lifetime
+changed is updated in place with collMod. explain_hot_queries() backs the diagnostics
+endpoint: it explains each query the data layer runs on every turn and flags the ones
+that fall back to a collection scan.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.core.config import settings
+from app.database import get_async_collection
+
+logger = logging.getLogger(__name__)
+
+# Server error codes for an existing index with different options / a missing index or collection
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_NOT_FOUND = 27
+NAMESPACE_NOT_FOUND = 26
+SECONDS_PER_DAY = 86400
+
+
+def index_specs() -> List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]]:
+    """(collection, keys, options) of every index the app relies on, given the current settings."""
+    specs = [
+        ("chat_history", [("session_id", ASCENDING)], {"name": "session_id_unique", "unique": True}),
+        ("chat_history", [("user_id", ASCENDING), ("updated_at", DESCENDING)], {"name": "user_updated"}),
+        # Exports walk a user's sessions in session_id order
+        ("chat_history", [("user_id", ASCENDING), ("session_id", ASCENDING)], {"name": "user_session"}),
+        ("token_usage", [("user_id", ASCENDING), ("session_id", ASCENDING)], {"name": "user_session_unique", "unique": True}),
+        ("chat_messages", [("session_id", ASCENDING), ("bucket", ASCENDING)], {"name": "session_bucket_unique", "unique": True}),
+    ]
+    if settings.CHAT_HISTORY_TTL_DAYS > 0:
+        specs.append((
+            "chat_history",
+            [("updated_at", ASCENDING)],
+            {"name": "updated_at_ttl", "expireAfterSeconds": int(settings.CHAT_HISTORY_TTL_DAYS * SECONDS_PER_DAY)}
+        ))
+    if settings.CHAT_ARCHIVE_AFTER_DAYS > 0 or settings.CHAT_SEARCH_ENABLED:
+        # updated_at range scans of the archival job and the search refresh (not the TTL index key pattern)
+        specs.append(("chat_history", [("updated_at", ASCENDING), ("session_id", ASCENDING)], {"name": "updated_at_session"}))
+    if settings.CHAT_ARCHIVE_RETENTION_DAYS > 0:
+        specs.append((
+            "chat_archive",
+            [("updated_at", ASCENDING)],
+            {"name": "updated_at_ttl", "expireAfterSeconds": int(settings.CHAT_ARCHIVE_RETENTION_DAYS * SECONDS_PER_DAY)}
+        ))
+    if settings.RESPONSE_CACHE_MONGO_ENABLED:
+        # Entries carry their own expiry time
+        specs.append(("response_cache", [("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}))
+    return specs
+
+
+# TTL indexes that are dropped again when their setting is turned off
+OPTIONAL_TTL_INDEXES = [
+    ("chat_history", "updated_at_ttl", lambda: settings.CHAT_HISTORY_TTL_DAYS > 0),
+    ("chat_archive", "updated_at_ttl", lambda: settings.CHAT_ARCHIVE_RETENTION_DAYS > 0),
+]
+
+
+async def ensure_indexes() -> List[str]:
+    """Create (or update) the indexes; returns the names that are in place. Failures are logged."""
+    ready = []
+    for collection_name, keys, options in index_specs():
+        collection = get_async_collection(collection_name)
+        try:
+            ready.append(await collection.create_index(keys, **options))
+        except OperationFailure as e:
+            if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in options:
+                await collection.database.command({
+                    "collMod": collection_name,
+                    "index": {"name": options["name"], "expireAfterSeconds": options["expireAfterSeconds"]}
+                })
+                logger.info(f"Updated TTL of index {collection_name}.{options['name']}")
+                ready.append(options["name"])
+            else:
+                # e.g. duplicate session_ids in old data: keep serving, the diagnostics show the scan
+                logger.error(f"Could not create index {collection_name}.{options['name']}: {e}")
+
+    for collection_name, name, enabled in OPTIONAL_TTL_INDEXES:
+        if enabled():
+            continue
+        try:
+            await get_async_collection(collection_name).drop_index(name)
+            logger.info(f"Dropped disabled TTL index {collection_name}.{name}")
+        except OperationFailure as e:
+            if e.code not in (INDEX_NOT_FOUND, NAMESPACE_NOT_FOUND):
+                logger.error(f"Could not drop index {collection_name}.{name}: {e}")
+
+    logger.info(f"Indexes ready: {', '.join(ready)}")
+    return ready
+
+
+# name -> (collection, filter, sort) of the queries chat_history.py / token_tracker.py run
+HOT_QUERIES: Dict[str, Tuple[str, dict, Optional[List[Tuple[str, int]]]]] = {
+    "chat_history.by_session": ("chat_history", {"session_id": "__explain__"}, None),
+    "chat_history.message_by_id": (
+        "chat_history", {"session_id": "__explain__", "messages.message_id": "__explain__"}, None
+    ),
+    "chat_history.user_sessions": ("chat_history", {"user_id": "__explain__"}, [("updated_at", DESCENDING)]),
+    "chat_messages.recent_buckets": ("chat_messages", {"session_id": "__explain__", "bucket": {"$gte": 0}}, [("bucket", ASCENDING)]),
+    "token_usage.by_user_session": ("token_usage", {"user_id": "__explain__", "session_id": "__explain__"}, None),
+    "token_usage.by_user": ("token_usage", {"user_id": "__explain__"}, None),
+}
+
+
+async def explain_hot_queries() -> List[dict]:
+    """Winning plan of every hot query; collection_scan is True when it reads the whole collection."""
+    results = []
+    for name, (collection_name, query, sort) in HOT_QUERIES.items():
+        cursor = get_async_collection(collection_name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explained = await cursor.explain()
+        except Exception as e:
+            results.append({"query": name, "error": str(e)})
+            continue
+        winning_plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        # Servers using the slot-based engine nest the plan one level deeper
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        nodes = _walk_plan(winning_plan)
+        stages = [node["stage"] for node in nodes if "stage" in node]
+        index_names = [node["indexName"] for node in nodes if "indexName" in node]
+        results.append({
+            "query": name,
+            "collection": collection_name,
+            "stages": stages,
+            "indexes": index_names,
+            "collection_scan": "COLLSCAN" in stages,
+            "docs_examined": explained.get("executionStats", {}).get("totalDocsExamined")
+        })
+    scans = [result["query"] for result in results if result.get("collection_scan")]
+    if scans:
+        logger.warning(f"Queries using a collection scan: {', '.join(scans)}")
+    return results
+
+
+def _walk_plan(plan: dict) -> List[dict]:
+    """Every stage of a query plan, outermost first."""
+    nodes = [plan]
+    if "inputStage" in plan:
+        nodes += _walk_plan(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        nodes += _walk_plan(child)
+    return nodes
@@ -0,0 +1,124 @@
+"""
+Background execution of deferred enhancements.
+
+The chat endpoint stores the raw assistant reply with enhancement_status="pending" and hands
+the enhancement job to schedule_enhancement(). When the job finishes, the stored message is
+swapped for the enhanced text (status "done"), or marked "skipped"/"failed", and an optional
+callback pushes the new text to the client (e.g. the Messenger send API). Clients without a
+push channel poll GET /api/chatbot/messages/{session_id}/{message_id}.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+from .chat_history import update_message_content
+from .token_tracker import update_token_usage
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+EnhanceJob = Callable[[], Awaitable[Optional[Tuple[str, dict]]]]
+NotifyCallback = Callable[[str], Awaitable[None]]
+
+# message_id -> running task, so the poll endpoint can wait on local jobs
+_tasks: Dict[str, asyncio.Task] = {}
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.DEFERRED_ENHANCEMENT_CONCURRENCY)
+    return _semaphore
+
+
+def schedule_enhancement(
+    session_id: str,
+    user_id: str,
+    message_id: str,
+    job: EnhanceJob,
+    notify: Optional[NotifyCallback] = None
+) -> asyncio.Task:
+    """Run an enhancement job in the background and apply its result to the stored message."""
+    task = asyncio.create_task(_run(session_id, user_id, message_id, job, notify))
+    _tasks[message_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(message_id, None))
+    metrics.incr("deferred_enhancement.scheduled")
+    return task
+
+
+def get_local_task(message_id: str) -> Optional[asyncio.Task]:
+    """Task running the enhancement of a message in this worker, if any."""
+    return _tasks.get(message_id)
+
+
+async def drain(timeout: float) -> None:
+    """Wait up to timeout seconds for pending jobs at shutdown, then cancel the rest."""
+    tasks = list(_tasks.values())
+    if not tasks:
+        return
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Cancelled {len(pending)} deferred enhancements at shutdown")
+
+
+async def _update_message(session_id: str, message_id: str, content: Optional[str], status: str) -> bool:
+    # Nobody awaits the task: a failed write is logged rather than left as an unretrieved exception
+    try:
+        await update_message_content(session_id, message_id, content, status)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to mark enhancement of message {message_id} as {status}: {e}")
+        return False
+
+
+async def _run(
+    session_id: str,
+    user_id: str,
+    message_id: str,
+    job: EnhanceJob,
+    notify: Optional[NotifyCallback]
+) -> None:
+    async with _get_semaphore():
+        try:
+            result = await job()
+        except Exception as e:
+            logger.error(f"Deferred enhancement of message {message_id} failed: {e}")
+            metrics.incr("deferred_enhancement.failed")
+            await _update_message(session_id, message_id, None, STATUS_FAILED)
+            return
+
+    if result is None:
+        metrics.incr("deferred_enhancement.skipped")
+        await _update_message(session_id, message_id, None, STATUS_SKIPPED)
+        return
+
+    enhanced_reply, token_usage = result
+    if not await _update_message(session_id, message_id, enhanced_reply, STATUS_DONE):
+        return
+    metrics.incr("deferred_enhancement.done")
+    try:
+        await update_token_usage(
+            user_id=user_id,
+            session_id=session_id,
+            prompt_tokens=token_usage.get("prompt_tokens", 0),
+            completion_tokens=token_usage.get("completion_tokens", 0),
+            cached_tokens=token_usage.get("cached_tokens", 0)
+        )
+    except Exception as e:
+        logger.error(f"Failed to record deferred enhancement usage for session {session_id}: {e}")
+
+    if notify:
+        try:
+            await notify(enhanced_reply)
+        except Exception as e:
+            logger.error(f"Failed to push enhanced reply {message_id}: {e}")
@@ -0,0 +1,60 @@
+"""
+Per-reply policy for the enhancement (second LLM) pass.
+
+Short plain replies gain nothing from formatting, and a slow assistant run may leave no
+time for a full enhancement. Based on the reply's length and structure (URLs, lists, product
+markers) and the time left in the request budget, the policy chooses to enhance fully,
+enhance with a faster model, or skip. Every decision is counted in app.core.metrics.
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+ENHANCE_FULL = "full"
+ENHANCE_FAST = "fast"
+ENHANCE_SKIP = "skip"
+
+_URL_RE = re.compile(r"https?://\S+")
+_LIST_RE = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+", re.MULTILINE)
+_PRODUCT_RE = re.compile(r"\*\*[^*]+\*\*|\d[\d.,]*\s*(?:k|đ|₫|vnđ|vnd|nghìn|triệu)(?!\w)", re.IGNORECASE)
+
+
+class EnhancementDecision(NamedTuple):
+    action: str
+    model: Optional[str]
+    reason: str
+
+
+def _has_structure(reply: str) -> bool:
+    return bool(_URL_RE.search(reply) or _LIST_RE.search(reply) or _PRODUCT_RE.search(reply))
+
+
+def decide_enhancement(reply: str, time_left: Optional[float] = None) -> EnhancementDecision:
+    """Choose how to enhance a raw reply given the seconds left in the request budget."""
+    decision = _decide(reply, time_left)
+    metrics.incr(f"enhancement.decision.{decision.action}")
+    metrics.incr(f"enhancement.reason.{decision.reason}")
+    return decision
+
+
+def _decide(reply: str, time_left: Optional[float]) -> EnhancementDecision:
+    if not settings.ENHANCE_POLICY_ENABLED:
+        return EnhancementDecision(ENHANCE_FULL, settings.OPENAI_ENHANCEMENT_MODEL, "policy_disabled")
+
+    structured = _has_structure(reply)
+    if not structured and len(reply) <= settings.ENHANCE_SKIP_MAX_CHARS:
+        return EnhancementDecision(ENHANCE_SKIP, None, "short_plain")
+
+    if time_left is not None:
+        if time_left < settings.ENHANCE_MIN_SECONDS_FAST:
+            return EnhancementDecision(ENHANCE_SKIP, None, "no_time")
+        if time_left < settings.ENHANCE_MIN_SECONDS_FULL:
+            return EnhancementDecision(ENHANCE_FAST, settings.ENHANCE_FAST_MODEL, "low_time")
+
+    if not structured and len(reply) <= settings.ENHANCE_FAST_MAX_CHARS:
+        return EnhancementDecision(ENHANCE_FAST, settings.ENHANCE_FAST_MODEL, "plain")
+
+    return EnhancementDecision(ENHANCE_FULL, settings.OPENAI_ENHANCEMENT_MODEL, "structured" if structured else "long")
@@ -0,0 +1,191 @@
+"""
+Streaming NDJSON exports of a user's chat sessions and token usage.
+
+The exports walk a Mongo cursor in batches (EXPORT_BATCH_SIZE documents per round trip,
+EXPORT_SESSION_BATCH_SIZE for sessions with their messages), render each record as one JSON
+line with orjson and yield chunks of about EXPORT_CHUNK_BYTES, optionally gzip-compressed.
+A StreamingResponse sends each chunk before the next batch is read, so memory depends on the
+batch size and not on the size of the export. The messages of a bucketed session are written
+bucket by bucket.
+
+Records come in session_id order: an interrupted export is resumed by passing the session_id
+of the last line received as `after`. since/until filter on updated_at. Archived sessions
+(chat_archive.py) are not exported.
+"""
+
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+import logging
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.database import get_async_chat_history_collection, get_async_chat_messages_collection, get_async_token_usage_collection
+from .chat_history import STORAGE_BUCKETED, _header_projection
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GZIP_MEDIA_TYPE = "application/gzip"
+GZIP_LEVEL = 6
+# zlib window bits that produce a gzip stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Fields of the stored documents that are not exported
+INTERNAL_FIELDS = ("_id", "storage")
+
+
+def _query(user_id: str, since: Optional[datetime], until: Optional[datetime], after: Optional[str]) -> dict:
+    query = {"user_id": user_id}
+    if since or until:
+        query["updated_at"] = {op: value for op, value in (("$gte", since), ("$lt", until)) if value}
+    if after:
+        query["session_id"] = {"$gt": after}
+    return query
+
+
+def _dumps(record: dict) -> bytes:
+    # Mongo returns naive UTC datetimes; ObjectIds and other BSON types are rendered as strings
+    return orjson.dumps(record, default=str, option=orjson.OPT_NAIVE_UTC)
+
+
+def _exported(document: dict) -> dict:
+    for field in INTERNAL_FIELDS:
+        document.pop(field, None)
+    return document
+
+
+async def _session_pieces(
+    user_id: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    after: Optional[str],
+    messages: bool
+) -> AsyncIterator[bytes]:
+    query = _query(user_id, since, until, after)
+    if not messages:
+        cursor = get_async_chat_history_collection().aggregate(
+            [{"$match": query}, {"$sort": {"session_id": 1}}, {"$project": _header_projection()}],
+            batchSize=settings.EXPORT_BATCH_SIZE
+        )
+        try:
+            async for session in cursor:
+                yield _dumps(_exported(session)) + b"\n"
+        finally:
+            await cursor.close()
+        return
+
+    cursor = get_async_chat_history_collection().find(query).sort("session_id", 1).batch_size(
+        settings.EXPORT_SESSION_BATCH_SIZE
+    )
+    try:
+        async for session in cursor:
+            if session.get("storage") != STORAGE_BUCKETED:
+                session["message_count"] = len(session.get("messages") or [])
+                yield _dumps(_exported(session)) + b"\n"
+                continue
+            # One line like an embedded session's, written bucket by bucket: `{...,"messages":[` ... `]}`
+            session.pop("messages", None)
+            head = _dumps({**_exported(session), "messages": []})
+            yield head[:-2]
+            separator = b""
+            async for message in _bucket_message_lines(session["session_id"]):
+                yield separator + message
+                separator = b","
+            yield b"]}\n"
+    finally:
+        await cursor.close()
+
+
+async def _bucket_message_lines(session_id: str) -> AsyncIterator[bytes]:
+    buckets = get_async_chat_messages_collection().find(
+        {"session_id": session_id}, {"_id": 0, "messages": 1}
+    ).sort("bucket", 1).batch_size(1)
+    try:
+        async for bucket in buckets:
+            for message in bucket["messages"]:
+                message.pop("seq", None)
+                yield _dumps(message)
+    finally:
+        await buckets.close()
+
+
+async def _token_usage_lines(
+    user_id: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    after: Optional[str]
+) -> AsyncIterator[bytes]:
+    cursor = get_async_token_usage_collection().find(
+        _query(user_id, since, until, after), {"_id": 0}
+    ).sort("session_id", 1).batch_size(settings.EXPORT_BATCH_SIZE)
+    try:
+        async for usage in cursor:
+            yield _dumps(usage) + b"\n"
+    finally:
+        await cursor.close()
+
+
+async def _chunks(pieces: AsyncIterator[bytes], compress: bool) -> AsyncIterator[bytes]:
+    """Group pieces into chunks of about EXPORT_CHUNK_BYTES, gzip-compressed if asked"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS) if compress else None
+    buffer, size = [], 0
+    async for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= settings.EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_user_sessions(
+    user_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None,
+    messages: bool = True,
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """NDJSON chunks of a user's sessions (one line per session, with or without its messages)"""
+    return _chunks(_session_pieces(user_id, since, until, after, messages), compress)
+
+
+def export_user_token_usage(
+    user_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None,
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """NDJSON chunks of a user's token usage records (one line per session)"""
+    return _chunks(_token_usage_lines(user_id, since, until, after), compress)
+
+
+async def _logged(chunks: AsyncIterator[bytes], name: str) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        # The status line is already sent: the client sees a truncated body and resumes with `after`
+        logger.error(f"Export {name} failed: {e}")
+        raise
+
+
+def export_response(chunks: AsyncIterator[bytes], name: str, compress: bool) -> StreamingResponse:
+    """StreamingResponse that downloads an export as name.ndjson (or name.ndjson.gz)"""
+    filename = f"{name}.ndjson.gz" if compress else f"{name}.ndjson"
+    return StreamingResponse(
+        _logged(chunks, name),
+        media_type=GZIP_MEDIA_TYPE if compress else NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
@@ -6,6 +6,7 @@ import httpx
 import logging
 import hmac
 import hashlib
+from app.api.openai_scheduler import PRIORITY_MESSENGER
 
 router = APIRouter()
 
@@ -14,6 +15,8 @@ PAGE_ACCESS_TOKENS: Dict[str, str] = {
 }
 VERIFY_TOKEN = os.getenv("FB_VERIFY_TOKEN", "KUNNE")
 APP_SECRET = os.getenv("FB_APP_SECRET")
+# Send the raw reply at once and follow up with the enhanced one
+MESSENGER_DEFER_ENHANCEMENT = os.getenv("MESSENGER_DEFER_ENHANCEMENT", "False").lower() == "true"
 logger = logging.getLogger(__name__)
 
 class MessagingEvent(BaseModel):
@@ -81,9 +84,17 @@ async def handle_message(request: Request):
                         user_message = messaging_event.message["text"]
                         # Gọi chatbot để lấy câu trả lời
                         from app.models.chatbot_model import ChatRequest
-                        from app.routes.chatbot import handle_chat_interaction
-                        chat_req = ChatRequest(message=user_message, user_id=sender_id)
-                        response = await handle_chat_interaction(chat_req)
+                        from app.routes.chatbot import run_chat_interaction
+                        chat_req = ChatRequest(
+                            message=user_message,
+                            user_id=sender_id,
+                            defer_enhancement=MESSENGER_DEFER_ENHANCEMENT
+                        )
+                        response = await run_chat_interaction(
+                            chat_req,
+                            notify_enhanced=_facebook_push(sender_id, page_id),
+                            priority=PRIORITY_MESSENGER
+                        )
                         reply_text = response.reply
                         await send_message_to_facebook(sender_id, reply_text, page_id)
             if entry.changes:
@@ -92,6 +103,12 @@ async def handle_message(request: Request):
     else:
         return Response(status_code=404)
 
+def _facebook_push(recipient_id, page_id):
+    """Callback that sends a deferred (enhanced) reply over the Messenger send API."""
+    async def push(message_text):
+        await send_message_to_facebook(recipient_id, message_text, page_id)
+    return push
+
 async def send_message_to_facebook(recipient_id, message_text, page_id):
     access_token = PAGE_ACCESS_TOKENS.get(page_id)
     if not access_token:
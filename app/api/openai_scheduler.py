@@ -0,0 +1,277 @@
+"""
+Rate-limit-aware admission control for OpenAI calls.
+
+Every OpenAI call made while answering a chat goes through the shared scheduler:
+- requests-per-minute and tokens-per-minute token buckets are charged up front with a
+  local (tiktoken) estimate and corrected with the reported usage afterwards;
+- callers that cannot be admitted wait in a priority queue, so interactive web traffic
+  goes ahead of Messenger backlogs, which go ahead of batch/background work;
+- a call whose expected queue wait exceeds its request deadline is shed immediately;
+- 429s and 5xx/connection errors are retried with jittered exponential backoff (429s also
+  pause admission for everybody, honouring Retry-After).
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import logging
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_WEB = 0
+PRIORITY_MESSENGER = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_WEB: "web", PRIORITY_MESSENGER: "messenger", PRIORITY_BATCH: "batch"}
+
+
+class OpenAIOverloaded(Exception):
+    """Raised when a call is shed because it could not be admitted before its deadline."""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute; capacity bounds bursts."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.level -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge extra (negative) tokens once real usage is known."""
+        if not self.unlimited:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class OpenAIScheduler:
+    """Priority admission queue in front of the OpenAI API, with retries."""
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        burst_seconds: float,
+        max_retries: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float
+    ):
+        self._requests = TokenBucket(rpm, max(1.0, rpm * burst_seconds / 60.0))
+        self._tokens = TokenBucket(tpm, max(1.0, tpm * burst_seconds / 60.0))
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        # Heap of (priority, sequence, tokens, future)
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        priority: int = PRIORITY_WEB,
+        deadline: Optional[Deadline] = None,
+        idempotent: bool = True,
+        admit: bool = True
+    ) -> Any:
+        """
+        Run fn() once admitted, retrying transient failures.
+        tokens is the estimated prompt + completion size; non-idempotent calls are only
+        retried on 429 (the request was rejected before being processed). admit=False skips
+        the queue (for polls/cancels that carry no model tokens) but keeps the retries.
+        """
+        attempt = 0
+        while True:
+            if admit:
+                await self._admit(tokens, priority, deadline)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, idempotent)
+                if delay is None:
+                    raise
+                if deadline is not None and delay >= deadline.remaining():
+                    metrics.incr("openai.retry.gave_up")
+                    raise
+                logger.warning(f"OpenAI call failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+                metrics.incr(f"openai.retry.{getattr(e, 'status_code', None) or 'connection'}")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            if admit:
+                self._settle(tokens, result)
+            return result
+
+    def stats(self) -> dict:
+        """Queue depth per priority and current bucket levels."""
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "queued": queued,
+            "requests_available": None if self._requests.unlimited else round(self._requests.level, 1),
+            "tokens_available": None if self._tokens.unlimited else round(self._tokens.level),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2)
+        }
+
+    async def _admit(self, tokens: float, priority: int, deadline: Optional[Deadline]) -> None:
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        # A call larger than the bucket could never be admitted; let it drain the bucket instead
+        tokens = min(tokens, self._tokens.capacity)
+        if not self._has_waiters() and self._wait_time(1, tokens) <= 0:
+            self._take(tokens)
+            metrics.incr(f"openai.admitted.{name}")
+            return
+
+        expected_wait = self._expected_wait(tokens, priority)
+        if deadline is not None and expected_wait > deadline.remaining():
+            metrics.incr(f"openai.shed.{name}")
+            raise OpenAIOverloaded(f"OpenAI queue wait {expected_wait:.1f}s exceeds the request deadline")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, future))
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=deadline.remaining() if deadline is not None else None)
+        except asyncio.TimeoutError:
+            metrics.incr(f"openai.shed.{name}")
+            raise OpenAIOverloaded("OpenAI call not admitted before the request deadline")
+        metrics.incr(f"openai.admitted.{name}")
+        metrics.incr(f"openai.queue_wait_seconds.{name}", time.monotonic() - queued_at)
+
+    def _has_waiters(self) -> bool:
+        while self._waiters and self._waiters[0][3].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters)
+
+    def _wait_time(self, requests: float, tokens: float) -> float:
+        return max(
+            self._paused_until - time.monotonic(),
+            self._requests.time_until(requests),
+            self._tokens.time_until(tokens)
+        )
+
+    def _expected_wait(self, tokens: float, priority: int) -> float:
+        """Time until the buckets cover everything queued at this priority or higher, plus this call."""
+        ahead = [w for w in self._waiters if w[0] <= priority and not w[3].done()]
+        return self._wait_time(len(ahead) + 1, sum(w[2] for w in ahead) + tokens)
+
+    def _take(self, tokens: float) -> None:
+        self._requests.take(1)
+        self._tokens.take(tokens)
+
+    def _settle(self, estimated: float, result: Any) -> None:
+        """Correct the token bucket with the usage OpenAI reported, when the response has one."""
+        usage = getattr(result, "usage", None)
+        total = getattr(usage, "total_tokens", None) if usage else None
+        if isinstance(total, int) and total > 0:
+            self._tokens.adjust(min(estimated, self._tokens.capacity) - total)
+
+    def _retry_delay(self, error: Exception, attempt: int, idempotent: bool) -> Optional[float]:
+        """Backoff before retrying error, or None if it should not be retried."""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, RateLimitError):
+            if getattr(error, "code", None) == "insufficient_quota":
+                return None
+            retry_after = _retry_after(error)
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            # Everybody else would hit the same limit: hold the queue as well
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            metrics.incr("openai.rate_limited")
+            return delay
+        if not idempotent:
+            return None
+        if isinstance(error, APIStatusError) and error.status_code >= 500:
+            return self._backoff(attempt)
+        if isinstance(error, APIConnectionError):
+            return self._backoff(attempt)
+        return None
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt)))
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._waiters = [w for w in self._waiters if w[3].get_loop() is loop]
+            heapq.heapify(self._waiters)
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        """Admit queued calls in priority order as the buckets refill."""
+        while True:
+            self._wakeup.clear()
+            if not self._has_waiters():
+                await self._wakeup.wait()
+                continue
+            _, _, tokens, future = self._waiters[0]
+            delay = self._wait_time(1, tokens)
+            if delay <= 0:
+                heapq.heappop(self._waiters)
+                self._take(tokens)
+                future.set_result(None)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Retry-After header of an API error, in seconds."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+openai_scheduler = OpenAIScheduler(
+    rpm=settings.OPENAI_RPM_LIMIT,
+    tpm=settings.OPENAI_TPM_LIMIT,
+    burst_seconds=settings.OPENAI_BURST_SECONDS,
+    max_retries=settings.OPENAI_MAX_RETRIES,
+    retry_base_seconds=settings.OPENAI_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.OPENAI_RETRY_MAX_SECONDS
+)
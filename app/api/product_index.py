@@ -0,0 +1,202 @@
+"""
+In-memory BM25 index over the products collection.
+
+Used by the chat-completions engine to find the products relevant to a question without
+the Assistant's file search. Text fields of every product are tokenized with the shared
+diacritic-folding tokenizer (app.core.text) into an inverted index. The index is refreshed
+incrementally from the products' PRODUCT_UPDATED_FIELD timestamp and rebuilt completely
+every PRODUCT_INDEX_FULL_REFRESH_SECONDS (which also drops deleted products).
+"""
+
+import asyncio
+import heapq
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.text import tokenize_with_bigrams
+from app.database import get_products_collection
+from .context_builder import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longest rendering of a single value in the product context
+MAX_VALUE_CHARS = 300
+
+
+def _text_values(value: Any) -> List[str]:
+    """All strings (and numbers) inside a product field, flattened."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return [str(value)]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in _text_values(item)]
+    if isinstance(value, (list, tuple)):
+        return [text for item in value for text in _text_values(item)]
+    return []
+
+
+def render_product(doc: dict) -> str:
+    """Compact "field: value" rendering of a product for the completion prompt."""
+    lines = []
+    for key, value in doc.items():
+        if key == "_id" or key == settings.PRODUCT_UPDATED_FIELD:
+            continue
+        text = ", ".join(_text_values(value))
+        if text:
+            lines.append(f"{key}: {text[:MAX_VALUE_CHARS]}")
+    return truncate_to_tokens("\n".join(lines), settings.PRODUCT_MAX_TOKENS)
+
+
+class ProductIndex:
+    """BM25 inverted index of products, keyed by str(_id)."""
+
+    def __init__(self, fields: Optional[List[str]] = None):
+        self.fields = fields
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._rendered: Dict[str, str] = {}
+        self._total_length = 0
+        self.watermark = None
+        self.loaded_at = 0.0
+        self.full_loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def _index_text(self, doc: dict) -> str:
+        fields = self.fields or [key for key in doc if key != "_id"]
+        return " ".join(text for field in fields for text in _text_values(doc.get(field)))
+
+    def upsert(self, doc: dict) -> None:
+        """Add a product, replacing its previous version."""
+        doc_id = str(doc["_id"])
+        self.remove(doc_id)
+        terms = Counter(tokenize_with_bigrams(self._index_text(doc)))
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = sum(terms.values())
+        self._rendered[doc_id] = render_product(doc)
+        self._total_length += self._doc_lengths[doc_id]
+        updated = doc.get(settings.PRODUCT_UPDATED_FIELD)
+        if updated is not None and (self.watermark is None or updated > self.watermark):
+            self.watermark = updated
+
+    def remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._rendered.pop(doc_id, None)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, str]]:
+        """Top-k (score, rendered product) by BM25."""
+        n_docs = len(self._doc_terms)
+        if not n_docs:
+            return []
+        avg_length = self._total_length / n_docs
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize_with_bigrams(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self._rendered[doc_id]) for doc_id, score in best]
+
+
+class ProductCatalog:
+    """Keeps a ProductIndex in sync with Mongo and serves searches from it."""
+
+    def __init__(self):
+        fields = [f.strip() for f in settings.PRODUCT_INDEX_FIELDS.split(",") if f.strip()]
+        self.fields = fields or None
+        self.index = ProductIndex(self.fields)
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def search(self, query: str, k: Optional[int] = None) -> List[str]:
+        """Rendered top-k products for a query, refreshing the index when it is stale."""
+        await self.ensure_fresh()
+        started = time.perf_counter()
+        results = self.index.search(query, k or settings.PRODUCT_TOP_K)
+        metrics.incr("product_index.searches")
+        metrics.incr("product_index.search_seconds", time.perf_counter() - started)
+        return [rendered for _, rendered in results]
+
+    async def ensure_fresh(self) -> None:
+        """Load the index on first use; afterwards refresh it in the background when stale."""
+        if not self.index.loaded_at:
+            await self.refresh()
+            return
+        if time.monotonic() - self.index.loaded_at >= settings.PRODUCT_INDEX_REFRESH_SECONDS:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self) -> None:
+        """Pull changed products (or everything, when a full rebuild is due)."""
+        full = (
+            not self.index.full_loaded_at
+            or time.monotonic() - self.index.full_loaded_at >= settings.PRODUCT_INDEX_FULL_REFRESH_SECONDS
+        )
+        since = None if full else self.index.watermark
+        if not full and since is None:
+            # Products carry no change timestamp: only the periodic full rebuild picks up changes
+            self.index.loaded_at = time.monotonic()
+            return
+        try:
+            docs = await asyncio.to_thread(self._fetch, since, full)
+        except Exception as e:
+            logger.error(f"Product index refresh failed: {e}")
+            # Try again after the normal refresh interval rather than on every request
+            self.index.loaded_at = time.monotonic()
+            return
+
+        index = ProductIndex(self.fields) if full else self.index
+        for doc in docs:
+            index.upsert(doc)
+        now = time.monotonic()
+        index.loaded_at = now
+        if full:
+            index.full_loaded_at = now
+            self.index = index
+            logger.info(f"Product index rebuilt with {len(index)} products")
+        metrics.incr("product_index.refreshes")
+        metrics.incr("product_index.documents_loaded", len(docs))
+
+    def _fetch(self, since, full: bool) -> List[dict]:
+        # $gte: products written later with the same timestamp as the watermark are not missed
+        query = {} if full else {settings.PRODUCT_UPDATED_FIELD: {"$gte": since}}
+        return list(get_products_collection().find(query))
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.index),
+            "terms": self.index.term_count,
+            "watermark": str(self.index.watermark) if self.index.watermark is not None else None
+        }
+
+
+product_catalog = ProductCatalog()
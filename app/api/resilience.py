@@ -0,0 +1,193 @@
+"""
+Tail-latency and failure handling for OpenAI calls: hedging and circuit breakers.
+
+Hedging: latencies of each model are kept in a rolling window. When a call has not
+finished after the window's p95 (HEDGE_PERCENTILE), a second identical attempt is started;
+the first to succeed wins and the other is cancelled. Hedges draw from a budget that grows
+by HEDGE_BUDGET_RATIO per primary call, so hedging can add at most that fraction of extra
+calls; hedge.* counters report what was spent.
+
+Circuit breakers: after CIRCUIT_FAILURE_THRESHOLD consecutive failures a model (or the
+Assistant) is not called for CIRCUIT_RESET_SECONDS; callers take their fallback path
+instead. Then a single trial call decides whether the circuit closes again.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class LatencyTracker:
+    """Rolling window of call latencies (seconds)."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        return float(np.percentile(np.fromiter(self._samples, dtype=np.float64), q))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        if len(self._samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.percentile(settings.HEDGE_PERCENTILE), settings.HEDGE_MIN_DELAY_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self._samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+class HedgeBudget:
+    """Each primary call earns `ratio` hedge credits (capped); each hedge spends one."""
+
+    def __init__(self, ratio: float, max_credits: float = 10.0):
+        self.ratio = ratio
+        self.max_credits = max_credits
+        self.credits = 1.0
+
+    def earn(self) -> None:
+        self.credits = min(self.max_credits, self.credits + self.ratio)
+
+    def spend(self) -> bool:
+        if self.credits < 1.0:
+            return False
+        self.credits -= 1.0
+        return True
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may be made now (in half-open state, only the first one)."""
+        if not settings.CIRCUIT_BREAKER_ENABLED or self.state == CIRCUIT_CLOSED:
+            return True
+        now = time.monotonic()
+        # Also re-arms a half-open circuit whose trial call never reported back
+        if now - self._opened_at >= self.reset_seconds:
+            self.state = CIRCUIT_HALF_OPEN
+            self._opened_at = now
+            logger.info(f"Circuit {self.name} half-open, trying one call")
+            return True
+        metrics.incr(f"circuit.{self.name}.rejected")
+        return False
+
+    def record_success(self) -> None:
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                metrics.incr(f"circuit.{self.name}.opened")
+            self.state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+_latency: Dict[str, LatencyTracker] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+hedge_budget = HedgeBudget(settings.HEDGE_BUDGET_RATIO)
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    if name not in _latency:
+        _latency[name] = LatencyTracker(settings.LATENCY_WINDOW)
+    return _latency[name]
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+    return _breakers[name]
+
+
+async def hedged(name: str, call: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+    """
+    Await call(), starting a second call() if the first is slower than the rolling p95 of
+    `name` (when HEDGE_ENABLED and the budget allows). Returns the first successful result
+    and cancels the other attempt; raises the last error if every attempt fails.
+    """
+    tracker = get_latency_tracker(name)
+    hedge_budget.earn()
+
+    async def attempt() -> Any:
+        started = time.monotonic()
+        result = await call()
+        tracker.record(time.monotonic() - started)
+        return result
+
+    tasks = [asyncio.create_task(attempt())]
+    try:
+        delay = tracker.hedge_delay() if settings.HEDGE_ENABLED else None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if hedge_budget.spend():
+                    metrics.incr("hedge.sent")
+                    # The losing attempt is cancelled, but its prompt is typically billed anyway
+                    metrics.incr("hedge.estimated_extra_tokens", estimated_tokens)
+                    tasks.append(asyncio.create_task(attempt()))
+                else:
+                    metrics.incr("hedge.skipped_budget")
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        metrics.incr("hedge.hedge_won" if task is tasks[1] else "hedge.primary_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def stats() -> dict:
+    """Latency percentiles, breaker states and hedge budget for the metrics endpoint."""
+    return {
+        "latency": {name: tracker.stats() for name, tracker in _latency.items()},
+        "circuits": {name: breaker.stats() for name, breaker in _breakers.items()},
+        "hedge_credits": round(hedge_budget.credits, 2)
+    }
@@ -0,0 +1,182 @@
+"""
+Exact-match cache for assistant replies.
+
+Tier 1 is a bounded in-process LRU with TTL, tier 2 an optional Mongo collection shared by
+all workers. Keys cover the normalized message, the history window sent to the Assistant,
+the assistant id and the enhancement flag/model, so a reply is only reused for the same
+question asked in the same context.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.database import get_async_response_cache_collection
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s.!?…,;:~]+$")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivially different spellings share a cache entry."""
+    text = unicodedata.normalize("NFC", message or "").lower().strip()
+    text = _WHITESPACE_RE.sub(" ", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def make_context_hash(
+    history: List[Dict[str, str]],
+    assistant_id: str,
+    enhance_response: bool,
+    enhancement_model: str
+) -> str:
+    """Hash everything except the question itself that determines the reply."""
+    history_hash = hashlib.sha256(
+        json.dumps([(m["role"], m["content"]) for m in history], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    raw = "\x1f".join([
+        history_hash,
+        assistant_id or "",
+        "1" if enhance_response else "0",
+        enhancement_model if enhance_response else ""
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(message: str, context_hash: str) -> str:
+    """Build the cache key for a question asked in the context returned by make_context_hash."""
+    raw = f"{normalize_message(message)}\x1f{context_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_generation(assistant_id: str, enhancement_model: str) -> str:
+    """Identify the assistant/model configuration that produced the cached replies."""
+    return hashlib.sha256(f"{assistant_id}\x1f{enhancement_model}".encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Two-tier (LRU+TTL in process, optional Mongo) exact-match reply cache."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, use_mongo: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_mongo = use_mongo
+        self.generation: Optional[str] = None
+        self._entries: "OrderedDict[str, Tuple[float, str, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+
+    async def ensure_generation(self, generation: str) -> None:
+        """Drop every entry produced under a different assistant id / enhancement model."""
+        if generation == self.generation:
+            return
+        with self._lock:
+            if self.generation is not None:
+                self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self.generation = generation
+        if self.use_mongo:
+            try:
+                result = await get_async_response_cache_collection().delete_many({"generation": {"$ne": generation}})
+                self._stats["invalidations"] += result.deleted_count
+            except Exception as e:
+                logger.error(f"Failed to invalidate shared response cache: {e}")
+
+    async def get(self, key: str) -> Optional[Tuple[str, dict]]:
+        """Return (reply, token_usage) for a key, or None on miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, reply, token_usage = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return reply, token_usage
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        if self.use_mongo:
+            try:
+                doc = await get_async_response_cache_collection().find_one({
+                    "_id": key,
+                    "generation": self.generation,
+                    "expires_at": {"$gt": datetime.now(timezone.utc)}
+                })
+            except Exception as e:
+                logger.error(f"Shared response cache lookup failed: {e}")
+                doc = None
+            if doc:
+                self._store_local(key, doc["reply"], doc.get("token_usage") or {})
+                with self._lock:
+                    self._stats["mongo_hits"] += 1
+                return doc["reply"], doc.get("token_usage") or {}
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, reply: str, token_usage: dict) -> None:
+        """Store a reply in the local tier and, if enabled, the shared tier."""
+        self._store_local(key, reply, token_usage)
+        with self._lock:
+            self._stats["stores"] += 1
+        if self.use_mongo:
+            now = datetime.now(timezone.utc)
+            try:
+                await get_async_response_cache_collection().replace_one(
+                    {"_id": key},
+                    {
+                        "reply": reply,
+                        "token_usage": token_usage,
+                        "generation": self.generation,
+                        "created_at": now,
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Shared response cache write failed: {e}")
+
+    def clear(self) -> None:
+        """Empty the local tier."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters plus current size."""
+        with self._lock:
+            return {**self._stats, "size": len(self._entries), "max_entries": self.max_entries}
+
+    def _store_local(self, key: str, reply: str, token_usage: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, reply, token_usage)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    use_mongo=settings.RESPONSE_CACHE_MONGO_ENABLED
+)
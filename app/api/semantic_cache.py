@@ -0,0 +1,239 @@
+"""
+Semantic cache for assistant replies.
+
+Catches paraphrases the exact-match cache misses: questions are embedded into unit vectors
+kept in one contiguous float32 matrix, and a lookup is a single matrix-vector product
+restricted to entries asked in the same context (history window, assistant, enhancement).
+The matrix can be persisted to .npy files and memory-mapped back at startup so a restarted
+worker starts warm. Like the exact-match cache, rows expire after RESPONSE_CACHE_TTL_SECONDS
+and are all dropped when the assistant/model generation changes.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import List, Optional
+import logging
+
+import numpy as np
+
+from app.core.config import settings
+from .response_cache import normalize_message
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder:
+    """Turns texts into L2-normalized float32 vectors of a fixed dimension."""
+
+    dim: int
+    # Whether embed() calls the OpenAI API (and so goes through the rate-limit scheduler)
+    remote: bool = False
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic local embedder using signed feature hashing of words and character
+    trigrams. No network calls, so it is cheap and suitable for tests.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        text = normalize_message(text)
+        words = _WORD_RE.findall(text)
+        features = [f"w:{w}" for w in words]
+        for word in words:
+            padded = f" {word} "
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        return _normalize_rows(vectors)
+
+
+class OpenAIEmbedder(Embedder):
+    """Embedder backed by the OpenAI embeddings endpoint."""
+
+    remote = True
+
+    def __init__(self, client, model: str, dim: int):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await self.client.embeddings.create(model=self.model, input=texts, dimensions=self.dim)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return _normalize_rows(vectors)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def context_id(context_hash: str) -> int:
+    """Fold a hex context hash into the int64 stored next to each cached vector."""
+    return int(context_hash[:15], 16)
+
+
+class SemanticCache:
+    """Capacity-bounded nearest-neighbour reply cache over a contiguous float32 matrix."""
+
+    def __init__(self, dim: int, capacity: int, threshold: float, ttl_seconds: float, path: Optional[str] = None):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.generation: Optional[str] = None
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._contexts = np.zeros(capacity, dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        # Wall-clock insertion time, so the TTL still holds for rows loaded after a restart
+        self._inserted_at = np.zeros(capacity, dtype=np.float64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._replies: List[Optional[str]] = [None] * capacity
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        if path:
+            self.load()
+
+    def ensure_generation(self, generation: str) -> None:
+        """Drop every row produced under a different assistant id / enhancement model."""
+        if generation == self.generation:
+            return
+        if self.generation is not None:
+            self._stats["invalidations"] += int(self._valid.sum())
+            self._drop(self._valid)
+        self.generation = generation
+
+    def lookup(self, vector: np.ndarray, context: int) -> Optional[str]:
+        """Return the cached reply of the most similar question in the same context, if close enough."""
+        expired = self._valid & (self._inserted_at <= time.time() - self.ttl_seconds)
+        if expired.any():
+            self._stats["expirations"] += int(expired.sum())
+            self._drop(expired)
+        scores = self._vectors @ vector
+        scores[~self._valid | (self._contexts != context)] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            self._last_used[best] = time.time()
+            self._stats["hits"] += 1
+            return self._replies[best]
+        self._stats["misses"] += 1
+        return None
+
+    def add(self, vector: np.ndarray, context: int, reply: str) -> None:
+        """Insert a reply, evicting the least recently used entry when full."""
+        free = np.flatnonzero(~self._valid)
+        if free.size:
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self._last_used))
+            self._stats["evictions"] += 1
+        self._vectors[slot] = vector
+        self._contexts[slot] = context
+        self._last_used[slot] = self._inserted_at[slot] = time.time()
+        self._valid[slot] = True
+        self._replies[slot] = reply
+        self._stats["stores"] += 1
+
+    def _drop(self, rows: np.ndarray) -> None:
+        self._valid[rows] = False
+        for slot in np.flatnonzero(rows):
+            self._replies[slot] = None
+
+    def stats(self) -> dict:
+        return {**self._stats, "size": int(self._valid.sum()), "capacity": self.capacity}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def load(self) -> None:
+        """
+        Warm the cache from files written by flush(); incompatible or missing files are ignored.
+        Rows older than the TTL are left out; the generation they were produced under is kept,
+        so the first lookup drops them all if it changed since.
+        """
+        try:
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim or meta["capacity"] != self.capacity:
+                logger.warning("Semantic cache files have a different shape, starting cold")
+                return
+            inserted_at = np.load(self._file("inserted_at.npy"), mmap_mode="r")
+            self._vectors[:] = np.load(self._file("vectors.npy"), mmap_mode="r")
+            self._contexts[:] = np.load(self._file("contexts.npy"), mmap_mode="r")
+            self._last_used[:] = np.load(self._file("last_used.npy"), mmap_mode="r")
+            self._inserted_at[:] = inserted_at
+            self._replies = meta["replies"]
+            self.generation = meta.get("generation")
+            self._valid[:] = [reply is not None for reply in self._replies]
+            stale = self._valid & (self._inserted_at <= time.time() - self.ttl_seconds)
+            self._drop(stale)
+            logger.info(
+                f"Semantic cache loaded {int(self._valid.sum())} entries from {self.path} "
+                f"({int(stale.sum())} expired)"
+            )
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to load semantic cache from {self.path}: {e}")
+
+    def flush(self) -> None:
+        """Persist the cache through memory-mapped .npy files (atomic replace, last writer wins)."""
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for name, array in (
+            ("vectors.npy", self._vectors),
+            ("contexts.npy", self._contexts),
+            ("last_used.npy", self._last_used),
+            ("inserted_at.npy", self._inserted_at)
+        ):
+            tmp = self._file(f"{name}.{os.getpid()}.tmp")
+            mapped = np.lib.format.open_memmap(tmp, mode="w+", dtype=array.dtype, shape=array.shape)
+            mapped[:] = array
+            mapped.flush()
+            del mapped
+            os.replace(tmp, self._file(name))
+        tmp = self._file(f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"dim": self.dim, "capacity": self.capacity, "generation": self.generation, "replies": self._replies},
+                f,
+                ensure_ascii=False
+            )
+        os.replace(tmp, self._file("meta.json"))
+
+
+def build_embedder(client) -> Embedder:
+    """Create the embedder selected by SEMANTIC_CACHE_EMBEDDER."""
+    if settings.SEMANTIC_CACHE_EMBEDDER == "openai":
+        return OpenAIEmbedder(client, settings.OPENAI_EMBEDDING_MODEL, settings.SEMANTIC_CACHE_DIM)
+    return HashingEmbedder(settings.SEMANTIC_CACHE_DIM)
+
+
+semantic_cache = SemanticCache(
+    dim=settings.SEMANTIC_CACHE_DIM,
+    capacity=settings.SEMANTIC_CACHE_CAPACITY,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    path=settings.SEMANTIC_CACHE_PATH or None
+) if settings.SEMANTIC_CACHE_ENABLED else None
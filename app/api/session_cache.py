@@ -0,0 +1,223 @@
+"""
+In-process cache of recent session context: the session header (user, timestamps, metadata,
+message_count) plus its last recent_message_limit() messages.
+
+chat_history.py writes through it: every add_message_to_session stores the session it just
+wrote, and any other change (metadata, thread id, an enhanced message, deletion) drops the
+entry; the next turn's write stores it again. Reads that only need the recent part of a
+session (a chat turn's context, the newest history page) are then served without a Mongo
+round trip; ETag checks still read updated_at from Mongo, as a stale one would mean a wrong 304. The cache is an LRU bounded by the estimated memory of its entries
+(SESSION_CACHE_MAX_BYTES); entries also expire after SESSION_CACHE_TTL_SECONDS.
+
+With several workers each one has its own cache. SESSION_CACHE_INVALIDATION publishes every
+change to a small capped collection that all workers tail, so a worker drops its copy as soon
+as another one writes the session; without it an entry can be stale for up to the TTL.
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+import logging
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from app.core.config import settings
+from app.database import get_async_collection
+
+logger = logging.getLogger(__name__)
+
+# Rough per-object overhead (dicts, datetimes, ids) added to the size of the message texts
+ENTRY_OVERHEAD_BYTES = 1024
+MESSAGE_OVERHEAD_BYTES = 512
+EVENTS_COLLECTION = "session_cache_events"
+# Pause before re-tailing the events after the cursor died or failed
+TAIL_RETRY_SECONDS = 1.0
+# Identifies this process's own events, which it does not need to apply
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _entry_size(header: dict, messages: List[dict]) -> int:
+    size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(str(header.get("metadata") or ""))
+    for message in messages:
+        size += MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.get("content") or "")
+    return size
+
+
+class SessionCache:
+    """Byte-bounded LRU of (session header, recent messages), keyed by session_id."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # session_id -> (expires_at, header, messages, size)
+        self._entries: "OrderedDict[str, Tuple[float, dict, List[dict], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "stale_stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "remote_invalidations": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, session_id: str) -> Optional[Tuple[dict, List[dict]]]:
+        """(header, recent messages) of a session, oldest message first, or None on miss."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                expires_at, header, messages, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(session_id)
+                    self._stats["hits"] += 1
+                    # Copies: callers may add fields to the header they get
+                    return dict(header), list(messages)
+                self._remove(session_id)
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, session_id: str, header: dict, messages: List[dict]) -> None:
+        """
+        Store the state of a session just read or written. A state older than the cached one
+        (a concurrent write that finished later) is ignored.
+        """
+        if not self.enabled:
+            return
+        size = _entry_size(header, messages)
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current is not None and _version(current[1]) > _version(header):
+                self._stats["stale_stores"] += 1
+                return
+            self._remove(session_id)
+            if size > self.max_bytes:
+                return
+            self._entries[session_id] = (time.monotonic() + self.ttl_seconds, header, messages, size)
+            self._bytes += size
+            self._stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                evicted, _ = next(iter(self._entries.items()))
+                self._remove(evicted)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, session_id: str, remote: bool = False) -> None:
+        """Drop a session; remote marks invalidations received from another worker."""
+        with self._lock:
+            if self._remove(session_id):
+                self._stats["remote_invalidations" if remote else "invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "cross_worker_invalidation": invalidation_channel.running
+            }
+
+    def _remove(self, session_id: str) -> bool:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[3]
+        return True
+
+
+def _version(header: dict) -> tuple:
+    updated_at = header.get("updated_at")
+    if updated_at is not None and updated_at.tzinfo is None:
+        # Mongo returns naive UTC datetimes
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return (header.get("message_count") or 0, updated_at or datetime.min.replace(tzinfo=timezone.utc))
+
+
+class InvalidationChannel:
+    """
+    Cross-worker invalidation over a capped collection: publish() inserts the changed
+    session_id, and every worker tails the collection and drops the sessions changed elsewhere.
+    """
+
+    def __init__(self, cache: SessionCache):
+        self.cache = cache
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        db = get_async_collection(EVENTS_COLLECTION).database
+        try:
+            await db.create_collection(EVENTS_COLLECTION, capped=True, size=settings.SESSION_CACHE_EVENTS_BYTES)
+        except CollectionInvalid:
+            pass  # Created by another worker
+        self._task = asyncio.create_task(self._tail())
+        logger.info(f"Session cache invalidation channel started (worker {WORKER_ID})")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, session_id: str) -> None:
+        if not self.running:
+            return
+        try:
+            await get_async_collection(EVENTS_COLLECTION).insert_one(
+                {"session_id": session_id, "origin": WORKER_ID, "at": datetime.now(timezone.utc)}
+            )
+        except Exception as e:
+            # Other workers may now serve this session stale until their entry expires
+            logger.error(f"Could not publish session cache invalidation for {session_id}: {e}")
+
+    async def _tail(self) -> None:
+        collection = get_async_collection(EVENTS_COLLECTION)
+        while True:
+            try:
+                # Starts from the oldest event kept: replaying old invalidations is harmless
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        if event.get("origin") != WORKER_ID:
+                            self.cache.invalidate(event["session_id"], remote=True)
+                    await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Session cache invalidation channel failed: {e}")
+                # Events may have been missed meanwhile
+                self.cache.clear()
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+
+session_cache = SessionCache(settings.SESSION_CACHE_MAX_BYTES, settings.SESSION_CACHE_TTL_SECONDS)
+invalidation_channel = InvalidationChannel(session_cache)
@@ -0,0 +1,91 @@
+"""
+Single-flight request coalescing.
+
+When many users ask the same question at the same moment (e.g. a Messenger campaign), only
+the first request (the leader) calls OpenAI; concurrent requests with the same key wait for
+the leader's result instead of starting their own run. The shared call runs in its own task,
+so followers still get the result if the leader's client goes away, and a failure is fanned
+out to every waiter and never remembered: the next request after it starts a fresh call.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One in-flight call and the number of followers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution."""
+
+    def __init__(self, max_waiters: int):
+        self.max_waiters = max_waiters
+        self._flights: Dict[str, _Flight] = {}
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Return (result of fn(), shared). shared is True when the result came from another
+        caller's in-flight call. Followers wait at most timeout seconds (asyncio.TimeoutError);
+        past max_waiters a caller runs fn() on its own instead of queueing on the flight.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            if flight.waiters >= self.max_waiters:
+                metrics.incr("single_flight.overflow")
+                return await fn(), False
+            flight.waiters += 1
+            metrics.incr("single_flight.collapsed")
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight.task), timeout=timeout), True
+            except asyncio.TimeoutError:
+                metrics.incr("single_flight.follower_timeout")
+                raise
+            except Exception:
+                metrics.incr("single_flight.error_fanout")
+                raise
+            finally:
+                flight.waiters -= 1
+
+        flight = _Flight(asyncio.create_task(fn()))
+        self._flights[key] = flight
+        flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        metrics.incr("single_flight.leader")
+        return await asyncio.shield(flight.task), False
+
+    def waiting(self, key: str) -> int:
+        """Number of followers currently waiting on the flight for key."""
+        flight = self._flights.get(key)
+        return flight.waiters if flight else 0
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "waiters": sum(flight.waiters for flight in self._flights.values()),
+            "max_waiters": self.max_waiters
+        }
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody may be left to retrieve a failure; log it instead of asyncio's warning
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            logger.error(f"Single-flight call failed: {flight.task.exception()}")
+
+
+single_flight = SingleFlight(max_waiters=settings.SINGLE_FLIGHT_MAX_WAITERS)
@@ -0,0 +1,170 @@
+"""
+Rolling conversation summaries, computed in the background (SUMMARY_ENABLED).
+
+Once at least SUMMARY_MIN_MESSAGES messages have left the live window (the newest
+SUMMARY_KEEP_MESSAGES messages), the chat routes hand the session to maybe_schedule(). A pool
+of SUMMARY_CONCURRENCY workers folds those messages (at most SUMMARY_MAX_MESSAGES per pass)
+into the session's summary with one chat completion at batch priority, and stores it with
+summary_upto, the number of messages it covers. The context assembly then sends the summary
+ahead of the messages after summary_upto.
+
+Summaries never sit on the request path: maybe_schedule() only enqueues. The queue is bounded
+(SUMMARY_QUEUE_SIZE). A session already queued is not queued twice, and when the queue is
+full the session is dropped; its next turn schedules it again.
+"""
+
+import asyncio
+from typing import List, Optional, Set, Tuple
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.models.chat_history_model import ChatHistory
+from .chat_history import load_session_context, get_chat_history_page, save_summary
+from . import chatbot_tool
+from .chatbot_tool import usage_to_dict
+from .context_builder import count_messages_tokens, truncate_to_tokens
+from .openai_scheduler import openai_scheduler, PRIORITY_BATCH
+from .summary_prompt import build_summary_messages
+from .token_tracker import update_token_usage
+
+logger = logging.getLogger(__name__)
+
+
+def summary_end(message_count: int) -> int:
+    """Number of leading messages that are outside the live window and may be summarized."""
+    return max(message_count - settings.SUMMARY_KEEP_MESSAGES, 0)
+
+
+class RollingSummarizer:
+    """Bounded queue plus worker pool that keeps session summaries up to date."""
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Sessions queued or being summarized
+        self._pending: Set[str] = set()
+        self._stats = {"scheduled": 0, "coalesced": 0, "dropped": 0, "summarized": 0, "conflicts": 0, "failed": 0}
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        logger.info(f"Summarizer started with {self.concurrency} workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished summaries are picked up again by later turns."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+
+    def maybe_schedule(self, session: ChatHistory) -> bool:
+        """Queue a session whose unsummarized old messages reached SUMMARY_MIN_MESSAGES; never waits."""
+        if self._queue is None or not session.message_count:
+            return False
+        if summary_end(session.message_count) - (session.summary_upto or 0) < settings.SUMMARY_MIN_MESSAGES:
+            return False
+        if session.session_id in self._pending:
+            self._stats["coalesced"] += 1
+            return False
+        try:
+            self._queue.put_nowait((session.session_id, session.user_id))
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            metrics.incr("summary.dropped")
+            return False
+        self._pending.add(session.session_id)
+        self._stats["scheduled"] += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "workers": len(self._workers)
+        }
+
+    async def _work(self) -> None:
+        while True:
+            session_id, user_id = await self._queue.get()
+            try:
+                await self.summarize(session_id, user_id)
+            except Exception as e:
+                logger.error(f"Summarizing session {session_id} failed: {e}")
+                self._stats["failed"] += 1
+            finally:
+                self._pending.discard(session_id)
+                self._queue.task_done()
+
+    async def summarize(self, session_id: str, user_id: str) -> None:
+        """Fold every message that left the live window into the summary, one pass at a time."""
+        while True:
+            session = await load_session_context(session_id, 1)
+            if not session:
+                return
+            previous_upto = session.get("summary_upto")
+            start = previous_upto or 0
+            end = min(summary_end(session.get("message_count") or 0), start + settings.SUMMARY_MAX_MESSAGES)
+            if end <= start:
+                return
+            page = await get_chat_history_page(session_id, end - start, end)
+            if not page:
+                return
+            messages = [
+                {"role": m.role, "content": truncate_to_tokens(m.content, settings.CONTEXT_MAX_MESSAGE_TOKENS)}
+                for m in page.messages
+            ]
+            summary, token_usage = await self._fold(session.get("summary") or "", messages)
+            if not summary:
+                return
+            await self._record_usage(session_id, user_id, token_usage)
+            if not await save_summary(session_id, summary, end, previous_upto):
+                # Another worker (or process) moved the summary on meanwhile
+                self._stats["conflicts"] += 1
+                return
+            self._stats["summarized"] += 1
+            metrics.incr("summary.messages_folded", end - start)
+            if summary_end(session.get("message_count") or 0) - end < settings.SUMMARY_MIN_MESSAGES:
+                return
+
+    async def _fold(self, summary: str, messages: List[dict]) -> Tuple[str, dict]:
+        prompt = build_summary_messages(summary, messages)
+        tokens = count_messages_tokens(prompt) + settings.SUMMARY_MAX_TOKENS
+        deadline = Deadline(settings.SUMMARY_TIMEOUT_SECONDS)
+        response = await asyncio.wait_for(
+            openai_scheduler.call(
+                # Looked up at call time: the client can be replaced after import (openai_stand_in)
+                lambda: chatbot_tool.client.chat.completions.create(
+                    model=settings.SUMMARY_MODEL,
+                    messages=prompt,
+                    max_tokens=settings.SUMMARY_MAX_TOKENS,
+                    temperature=0.2
+                ),
+                tokens=tokens,
+                priority=PRIORITY_BATCH,
+                deadline=deadline
+            ),
+            timeout=deadline.remaining()
+        )
+        return (response.choices[0].message.content or "").strip(), usage_to_dict(response.usage, settings.SUMMARY_MODEL)
+
+    async def _record_usage(self, session_id: str, user_id: str, token_usage: dict) -> None:
+        try:
+            await update_token_usage(
+                user_id=user_id,
+                session_id=session_id,
+                prompt_tokens=token_usage["prompt_tokens"],
+                completion_tokens=token_usage["completion_tokens"],
+                cached_tokens=token_usage.get("cached_tokens", 0)
+            )
+        except Exception as e:
+            logger.error(f"Failed to record summary usage for session {session_id}: {e}")
+
+
+summarizer = RollingSummarizer(settings.SUMMARY_CONCURRENCY, settings.SUMMARY_QUEUE_SIZE)
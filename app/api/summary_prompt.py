@@ -0,0 +1,44 @@
+"""
+Prompts for the rolling conversation summary.
+
+The summarizer folds messages that left the live window into the previous summary; the
+context assembly then sends the summary ahead of the recent turns. The fixed instructions
+come first (cacheable prefix), the previous summary and the new messages last.
+"""
+
+from typing import Dict, List
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Bạn tóm tắt cuộc trò chuyện giữa khách hàng và trợ lý tư vấn bán hàng. Cập nhật bản tóm tắt "
+    "hiện có bằng các tin nhắn mới: giữ lại nhu cầu, ngân sách, sở thích của khách, các sản phẩm "
+    "đã được hỏi hoặc gợi ý (tên, giá, liên kết nếu có) và các câu hỏi còn bỏ ngỏ. Bỏ lời chào, "
+    "câu xã giao và định dạng. Viết ngắn gọn bằng tiếng Việt, dạng gạch đầu dòng, chỉ trả về bản tóm tắt."
+)
+SUMMARY_REQUEST_TEMPLATE = """Bản tóm tắt hiện có:
+{summary}
+
+Tin nhắn mới:
+{messages}"""
+NO_SUMMARY = "(chưa có)"
+ROLE_LABELS = {"user": "Khách", "assistant": "Trợ lý"}
+# Prefix of the history message that carries the summary
+SUMMARY_CONTEXT_PREFIX = "Tóm tắt phần trước của cuộc trò chuyện:"
+
+
+def build_summary_messages(summary: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Build the chat-completion messages that fold messages into the previous summary."""
+    transcript = "\n".join(
+        f"{ROLE_LABELS.get(message['role'], message['role'])}: {message['content']}" for message in messages
+    )
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": SUMMARY_REQUEST_TEMPLATE.format(summary=summary or NO_SUMMARY, messages=transcript)
+        }
+    ]
+
+
+def summary_context_message(summary: str) -> Dict[str, str]:
+    """History message placed before the recent turns to carry the summary."""
+    return {"role": "user", "content": f"{SUMMARY_CONTEXT_PREFIX}\n{summary}"}
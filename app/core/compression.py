@@ -0,0 +1,46 @@
+"""
+Response compression.
+
+RESPONSE_COMPRESSION selects "gzip" (Starlette's GZipMiddleware), "br" (brotli-asgi, which
+falls back to gzip for clients that do not accept br; install it with `pip install brotli-asgi`)
+or "off". Responses smaller than RESPONSE_COMPRESSION_MIN_BYTES are sent as they are. Streamed
+(SSE) responses are never compressed: the compressor would hold frames back until its buffer
+fills. Neither are NDJSON exports, which compress themselves when asked (gzip=true).
+"""
+
+import logging
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_OFF = "off"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_BROTLI = "br"
+# Endpoints that stream frame by frame, and exports (gzipped on request by app/api/export.py)
+UNCOMPRESSED_PATH_SUFFIXES = ("/stream", "/export")
+
+
+def _compressor(app: ASGIApp, algorithm: str, minimum_size: int) -> ASGIApp:
+    if algorithm == COMPRESSION_BROTLI:
+        try:
+            from brotli_asgi import BrotliMiddleware
+            return BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        except ImportError:
+            logger.warning("RESPONSE_COMPRESSION=br needs the brotli-asgi package; using gzip")
+    return GZipMiddleware(app, minimum_size=minimum_size)
+
+
+class CompressionMiddleware:
+    """Compresses HTTP responses, except those of streaming endpoints."""
+
+    def __init__(self, app: ASGIApp, algorithm: str = COMPRESSION_GZIP, minimum_size: int = 1024):
+        self.app = app
+        self.compressed_app = _compressor(app, algorithm, minimum_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].endswith(UNCOMPRESSED_PATH_SUFFIXES):
+            await self.compressed_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -27,10 +27,121 @@ class Settings(BaseSettings):
     # OpenAI Settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_ASSISTANT_ID: str = os.getenv("OPENAI_ASSISTANT_ID", "")
+    OPENAI_ENHANCEMENT_MODEL: str = os.getenv("OPENAI_ENHANCEMENT_MODEL", "gpt-4.1")
+
+    # Response Cache Settings
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MONGO_ENABLED: bool = os.getenv("RESPONSE_CACHE_MONGO_ENABLED", "False").lower() == "true"
+
+    # Semantic Cache Settings
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+    SEMANTIC_CACHE_EMBEDDER: str = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing")  # "hashing" or "openai"
+    SEMANTIC_CACHE_DIM: int = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+    SEMANTIC_CACHE_CAPACITY: int = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "5000"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_PATH: str = os.getenv("SEMANTIC_CACHE_PATH", "")
+    OPENAI_EMBEDDING_MODEL: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+    # Context Assembly Settings
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_MAX_MESSAGE_TOKENS: int = int(os.getenv("CONTEXT_MAX_MESSAGE_TOKENS", "800"))
+    CONTEXT_MAX_HISTORY_MESSAGES: int = int(os.getenv("CONTEXT_MAX_HISTORY_MESSAGES", "50"))
+    CONTEXT_TOKEN_ENCODING: str = os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+
+    # Enhancement Policy Settings
+    ENHANCE_POLICY_ENABLED: bool = os.getenv("ENHANCE_POLICY_ENABLED", "True").lower() == "true"
+    ENHANCE_FAST_MODEL: str = os.getenv("ENHANCE_FAST_MODEL", "gpt-4.1-mini")
+    ENHANCE_SKIP_MAX_CHARS: int = int(os.getenv("ENHANCE_SKIP_MAX_CHARS", "120"))
+    ENHANCE_FAST_MAX_CHARS: int = int(os.getenv("ENHANCE_FAST_MAX_CHARS", "500"))
+    ENHANCE_MIN_SECONDS_FULL: float = float(os.getenv("ENHANCE_MIN_SECONDS_FULL", "6"))
+    ENHANCE_MIN_SECONDS_FAST: float = float(os.getenv("ENHANCE_MIN_SECONDS_FAST", "2"))
+    # End-to-end time allowed for one chat turn, and for the Assistant run within it
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+    ASSISTANT_RUN_TIMEOUT_SECONDS: float = float(os.getenv("ASSISTANT_RUN_TIMEOUT_SECONDS", "25"))
+    # OpenAI Rate Limit Settings (0 disables a bucket)
+    OPENAI_RPM_LIMIT: int = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+    OPENAI_TPM_LIMIT: int = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+    OPENAI_BURST_SECONDS: float = float(os.getenv("OPENAI_BURST_SECONDS", "10"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+    OPENAI_RETRY_BASE_SECONDS: float = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5"))
+    OPENAI_RETRY_MAX_SECONDS: float = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "8"))
+    ASSISTANT_RUN_TOKEN_ESTIMATE: int = int(os.getenv("ASSISTANT_RUN_TOKEN_ESTIMATE", "3000"))
+    # Request Coalescing Settings
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    SINGLE_FLIGHT_MAX_WAITERS: int = int(os.getenv("SINGLE_FLIGHT_MAX_WAITERS", "100"))
+    # Hedging / Circuit Breaker Settings
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "False").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+    HEDGE_BUDGET_RATIO: float = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+    LATENCY_WINDOW: int = int(os.getenv("LATENCY_WINDOW", "200"))
+    CIRCUIT_BREAKER_ENABLED: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "True").lower() == "true"
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+    # Chat Engine / Product Index Settings
+    CHAT_ENGINE: str = os.getenv("CHAT_ENGINE", "assistant")  # "assistant" or "completion"
+    COMPLETION_MODEL: str = os.getenv("COMPLETION_MODEL", "gpt-4.1")
+    COMPLETION_MAX_TOKENS: int = int(os.getenv("COMPLETION_MAX_TOKENS", "1200"))
+    PRODUCT_TOP_K: int = int(os.getenv("PRODUCT_TOP_K", "5"))
+    PRODUCT_INDEX_FIELDS: str = os.getenv("PRODUCT_INDEX_FIELDS", "")  # comma-separated; empty = all fields
+    PRODUCT_UPDATED_FIELD: str = os.getenv("PRODUCT_UPDATED_FIELD", "updated_at")
+    PRODUCT_MAX_TOKENS: int = int(os.getenv("PRODUCT_MAX_TOKENS", "300"))
+    PRODUCT_INDEX_REFRESH_SECONDS: float = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "60"))
+    PRODUCT_INDEX_FULL_REFRESH_SECONDS: float = float(os.getenv("PRODUCT_INDEX_FULL_REFRESH_SECONDS", "3600"))
+    # Rolling Summary Settings
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "False").lower() == "true"
+    SUMMARY_MODEL: str = os.getenv("SUMMARY_MODEL", "gpt-4.1-mini")
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))
+    # Newest messages never summarized, and how many older ones it takes to trigger a pass
+    SUMMARY_KEEP_MESSAGES: int = int(os.getenv("SUMMARY_KEEP_MESSAGES", "20"))
+    SUMMARY_MIN_MESSAGES: int = int(os.getenv("SUMMARY_MIN_MESSAGES", "10"))
+    SUMMARY_MAX_MESSAGES: int = int(os.getenv("SUMMARY_MAX_MESSAGES", "60"))
+    SUMMARY_CONCURRENCY: int = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+    SUMMARY_QUEUE_SIZE: int = int(os.getenv("SUMMARY_QUEUE_SIZE", "200"))
+    SUMMARY_TIMEOUT_SECONDS: float = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "60"))
+    DEFERRED_ENHANCEMENT_CONCURRENCY: int = int(os.getenv("DEFERRED_ENHANCEMENT_CONCURRENCY", "8"))
+    DEFERRED_ENHANCEMENT_DRAIN_SECONDS: float = float(os.getenv("DEFERRED_ENHANCEMENT_DRAIN_SECONDS", "10"))
     
+    # HTTP Response Settings
+    # Compression: "gzip", "br" (needs brotli-asgi) or "off"
+    RESPONSE_COMPRESSION: str = os.getenv("RESPONSE_COMPRESSION", "gzip")
+    RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+
     # Database Settings
     DB_URI: str = os.getenv("DB_URI", "")
     MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "auth")
+    MONGO_ENSURE_INDEXES: bool = os.getenv("MONGO_ENSURE_INDEXES", "True").lower() == "true"
+    # "embedded" (messages array in the session) or "bucketed" (chat_messages buckets)
+    CHAT_STORAGE_MODE: str = os.getenv("CHAT_STORAGE_MODE", "embedded")
+    CHAT_BUCKET_SIZE: int = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+    # Recent session context kept in memory per worker (0 disables the cache)
+    SESSION_CACHE_MAX_BYTES: int = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    SESSION_CACHE_TTL_SECONDS: float = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+    # Tail a capped collection so each worker drops sessions written by the others
+    SESSION_CACHE_INVALIDATION: bool = os.getenv("SESSION_CACHE_INVALIDATION", "False").lower() == "true"
+    SESSION_CACHE_EVENTS_BYTES: int = int(os.getenv("SESSION_CACHE_EVENTS_BYTES", str(1024 * 1024)))
+    # Delete sessions not updated for this many days (0 keeps them forever)
+    CHAT_HISTORY_TTL_DAYS: float = float(os.getenv("CHAT_HISTORY_TTL_DAYS", "0"))
+    # Move sessions idle for this many days to the compressed archive (app/scripts/archive_sessions.py)
+    CHAT_ARCHIVE_AFTER_DAYS: float = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "0"))
+    # Delete archived sessions this many days after their last activity (0 keeps them forever)
+    CHAT_ARCHIVE_RETENTION_DAYS: float = float(os.getenv("CHAT_ARCHIVE_RETENTION_DAYS", "0"))
+    # "zstd" (needs the zstandard package, falls back to zlib) or "zlib"
+    CHAT_ARCHIVE_CODEC: str = os.getenv("CHAT_ARCHIVE_CODEC", "zstd")
+    # Streaming NDJSON exports: documents per round trip (sessions with their messages use
+    # the smaller batch) and size of the chunks written to the response
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+    EXPORT_SESSION_BATCH_SIZE: int = int(os.getenv("EXPORT_SESSION_BATCH_SIZE", "20"))
+    EXPORT_CHUNK_BYTES: int = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+    # In-process BM25 search over chat messages (app/api/chat_search.py)
+    CHAT_SEARCH_ENABLED: bool = os.getenv("CHAT_SEARCH_ENABLED", "False").lower() == "true"
+    # Only index sessions updated within this many days (0 = all)
+    CHAT_SEARCH_MAX_AGE_DAYS: float = float(os.getenv("CHAT_SEARCH_MAX_AGE_DAYS", "0"))
+    CHAT_SEARCH_REFRESH_SECONDS: float = float(os.getenv("CHAT_SEARCH_REFRESH_SECONDS", "60"))
+    CHAT_SEARCH_FULL_REFRESH_SECONDS: float = float(os.getenv("CHAT_SEARCH_FULL_REFRESH_SECONDS", "3600"))
 
     
     # Security Settings
@@ -0,0 +1,63 @@
+"""
+Per-request deadlines.
+
+A Deadline is created when a chat request arrives and is passed down through history
+loading, the Assistant run, polling and enhancement, so every stage works with the time
+that is actually left. It can also watch the HTTP connection so work for a client that
+went away is stopped early.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+DisconnectCheck = Callable[[], Awaitable[bool]]
+
+# Reasons a request stops waiting on OpenAI
+REASON_DEADLINE = "deadline"
+REASON_DISCONNECT = "disconnect"
+
+
+class Deadline:
+    """Absolute point in (monotonic) time by which a request must be answered."""
+
+    def __init__(self, seconds: float, is_disconnected: Optional[DisconnectCheck] = None):
+        self.expires_at = time.monotonic() + seconds
+        self.is_disconnected = is_disconnected
+        self.disconnected = False
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def limited(self, seconds: float) -> "Deadline":
+        """A deadline at most `seconds` away that shares this one's disconnect check."""
+        child = Deadline(0, self.is_disconnected)
+        child.expires_at = min(self.expires_at, time.monotonic() + seconds)
+        return child
+
+    async def abandoned(self) -> Optional[str]:
+        """REASON_DEADLINE if time is up, REASON_DISCONNECT if the client went away, else None."""
+        if self.expired:
+            return REASON_DEADLINE
+        if self.is_disconnected and not self.disconnected:
+            try:
+                self.disconnected = await self.is_disconnected()
+            except Exception:
+                pass
+        return REASON_DISCONNECT if self.disconnected else None
+
+
+async def iterate_until(stream: AsyncIterator, deadline: Deadline) -> AsyncIterator:
+    """Iterate an async stream, raising asyncio.TimeoutError once the deadline passes."""
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            item = await asyncio.wait_for(iterator.__anext__(), timeout=deadline.remaining())
+        except StopAsyncIteration:
+            return
+        yield item
@@ -0,0 +1,29 @@
+"""
+Lightweight in-process counters used to measure performance features
+(thread reuse, caches, timeouts, ...). Values are per worker process.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(int)
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Increase a named counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def get_counters(prefix: str = "") -> Dict[str, float]:
+    """Return a snapshot of all counters, optionally filtered by name prefix."""
+    with _lock:
+        return {k: v for k, v in sorted(_counters.items()) if k.startswith(prefix)}
+
+
+def reset_counters() -> None:
+    """Reset all counters (useful for benchmarks)."""
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,49 @@
+"""
+Text normalization shared by the in-process search indexes.
+
+Vietnamese users often type without diacritics ("ao khoac" for "áo khoác"), so both
+indexed text and queries are lower-cased and folded to plain ASCII letters before
+tokenizing; "đ" is folded to "d" explicitly because it has no Unicode decomposition.
+"""
+
+import re
+import unicodedata
+from typing import List, Tuple
+
+# Alphanumeric runs; "_" is left out so it never collides with the bigram separator
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+# Runs joined by "-", "_" or "/", as in order codes and SKUs ("DH-12345", "SP_01", "A/B")
+_COMPOUND_RE = re.compile(r"[^\W_]+(?:[-_/][^\W_]+)+", re.UNICODE)
+_COMPOUND_SEPARATOR_RE = re.compile(r"[-_/]")
+
+
+def fold_diacritics(text: str) -> str:
+    """Lower-case text and strip diacritics (e.g. "Áo khoác Đẹp" -> "ao khoac dep")."""
+    decomposed = unicodedata.normalize("NFD", (text or "").lower())
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return stripped.replace("đ", "d")
+
+
+def _split(text: str) -> Tuple[List[str], List[str]]:
+    """(word tokens, joined forms of the separator-joined runs) of folded text."""
+    folded = fold_diacritics(text)
+    joined = [_COMPOUND_SEPARATOR_RE.sub("", run) for run in _COMPOUND_RE.findall(folded)]
+    return _TOKEN_RE.findall(folded), joined
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split folded text into word tokens (Vietnamese syllables). A run like "DH-12345" gives
+    its parts plus the joined form "dh12345", so it matches "DH12345" as well as "DH 12345".
+    """
+    tokens, joined = _split(text)
+    return tokens + joined
+
+
+def tokenize_with_bigrams(text: str) -> List[str]:
+    """
+    Tokens plus adjacent-token bigrams, so multi-syllable Vietnamese words ("ao khoac")
+    rank above documents that merely contain the syllables apart.
+    """
+    tokens, joined = _split(text)
+    return tokens + joined + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
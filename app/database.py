@@ -6,6 +6,9 @@ from pymongo.database import Database
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 from pymongo.collection import Collection
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from app.core import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,6 +17,30 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv(".env", override=True)
 
+class CommandCounter(monitoring.CommandListener):
+    """Counts database round trips per command (mongo.ops.<command>) for the metrics endpoint"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.incr(f"mongo.ops.{event.command_name}")
+        metrics.incr("mongo.seconds", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        metrics.incr(f"mongo.ops.{event.command_name}")
+        metrics.incr("mongo.failures")
+
+# Connection pool options shared by the sync and async clients
+POOL_OPTIONS = dict(
+    event_listeners=[CommandCounter()],
+    maxPoolSize=50,
+    minPoolSize=10,
+    maxIdleTimeMS=30000,
+    waitQueueTimeoutMS=2500,
+    serverSelectionTimeoutMS=5000
+)
+
 class MongoDB:
     _instance = None
     _client = None
@@ -37,14 +64,7 @@ class MongoDB:
             logger.info(f"Connecting to MongoDB using URI: {uri}")
             
             # Create MongoDB client with connection pooling
-            self._client = MongoClient(
-                uri,
-                maxPoolSize=50,
-                minPoolSize=10,
-                maxIdleTimeMS=30000,
-                waitQueueTimeoutMS=2500,
-                serverSelectionTimeoutMS=5000
-            )
+            self._client = MongoClient(uri, **POOL_OPTIONS)
             
             # Test connection
             self._client.admin.command('ping')
@@ -75,6 +95,40 @@ class MongoDB:
             self._connect()
         return self._db
 
+class AsyncMongoDB:
+    """
+    Motor client used by the async data layer (chat history, token usage), so request
+    handlers never block the event loop on a database round trip. The app lifespan opens it
+    at startup and closes it at shutdown; it is also opened lazily on first use.
+    """
+    _client: Optional[AsyncIOMotorClient] = None
+    _db: Optional[AsyncIOMotorDatabase] = None
+
+    @classmethod
+    async def connect(cls) -> AsyncIOMotorDatabase:
+        """Open the pool and check the server is reachable"""
+        db = cls.get_db()
+        await cls._client.admin.command('ping')
+        logger.info("Async MongoDB client connected")
+        return db
+
+    @classmethod
+    def get_db(cls) -> AsyncIOMotorDatabase:
+        if cls._db is None:
+            uri = os.getenv("DB_URI")
+            database = os.getenv("MONGO_DB_NAME", "auth")
+            cls._client = AsyncIOMotorClient(uri, **POOL_OPTIONS)
+            cls._db = cls._client[database]
+        return cls._db
+
+    @classmethod
+    def close(cls) -> None:
+        if cls._client:
+            cls._client.close()
+            cls._client = None
+            cls._db = None
+            logger.info("Async MongoDB connection closed")
+
 def get_db() -> Database:
     """Get database instance"""
     return MongoDB().db
@@ -91,6 +145,10 @@ def get_chat_history_collection() -> Collection:
     """Get chat history collection"""
     return get_collection("chat_history")
 
+def get_chat_messages_collection() -> Collection:
+    """Get message buckets collection (bucketed chat storage)"""
+    return get_collection("chat_messages")
+
 def get_users_collection() -> Collection:
     """Get users collection"""
     return get_collection("users")
@@ -102,3 +160,31 @@ def get_products_collection() -> Collection:
 def get_token_usage_collection() -> Collection:
     """Get token usage collection"""
     return get_collection("token_usage")
+
+def get_response_cache_collection() -> Collection:
+    """Get shared response cache collection"""
+    return get_collection("response_cache")
+
+def get_async_collection(collection_name: str) -> AsyncIOMotorCollection:
+    """Get async (Motor) collection instance"""
+    return AsyncMongoDB.get_db()[collection_name]
+
+def get_async_chat_history_collection() -> AsyncIOMotorCollection:
+    """Get async chat history collection"""
+    return get_async_collection("chat_history")
+
+def get_async_chat_messages_collection() -> AsyncIOMotorCollection:
+    """Get async collection of message buckets (bucketed chat storage)"""
+    return get_async_collection("chat_messages")
+
+def get_async_chat_archive_collection() -> AsyncIOMotorCollection:
+    """Get async collection of archived (compressed) chat sessions"""
+    return get_async_collection("chat_archive")
+
+def get_async_token_usage_collection() -> AsyncIOMotorCollection:
+    """Get async token usage collection"""
+    return get_async_collection("token_usage")
+
+def get_async_response_cache_collection() -> AsyncIOMotorCollection:
+    """Get async shared response cache collection"""
+    return get_async_collection("response_cache")
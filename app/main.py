@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 import time
 import logging
@@ -7,14 +8,25 @@ import signal
 import sys
 from contextlib import asynccontextmanager
 from app.core.config import settings
+from app.core.compression import CompressionMiddleware, COMPRESSION_OFF
 from app.core.logging import init_logging
+from app.database import AsyncMongoDB
 from app.routes import (
     chatbot_router,
     chat_history_router,
+    chat_search_router,
     token_tracker_router,
 )
 
 from app.api.messenger_webhook import router as messenger_router
+from app.api.semantic_cache import semantic_cache
+from app.api import deferred_enhancement
+from app.api.product_index import product_catalog
+from app.api.db_indexes import ensure_indexes
+from app.api.chat_history import check_session_id_index
+from app.api.session_cache import invalidation_channel
+from app.api.summarizer import summarizer
+from app.api.chat_search import chat_search
 # Setup logging
 init_logging()
 
@@ -34,11 +46,41 @@ async def lifespan(app: FastAPI):
     
     # Startup
     logger.info("Starting up application...")
+    try:
+        await AsyncMongoDB.connect()
+    except Exception as e:
+        # Keep serving; the pool retries server selection on every operation
+        logger.error(f"Async MongoDB client could not reach the server: {e}")
+    if settings.MONGO_ENSURE_INDEXES:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {e}")
+    await check_session_id_index()
+    if settings.SESSION_CACHE_INVALIDATION and settings.SESSION_CACHE_MAX_BYTES > 0:
+        try:
+            await invalidation_channel.start()
+        except Exception as e:
+            logger.error(f"Session cache invalidation channel could not start: {e}")
+    if settings.SUMMARY_ENABLED:
+        summarizer.start()
+    if settings.CHAT_SEARCH_ENABLED:
+        chat_search.start()
+    if settings.CHAT_ENGINE == "completion":
+        # Build the product index now rather than on the first question
+        await product_catalog.refresh()
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
     shutdown_event = True
+    await deferred_enhancement.drain(settings.DEFERRED_ENHANCEMENT_DRAIN_SECONDS)
+    await summarizer.stop()
+    await chat_search.stop()
+    if semantic_cache is not None:
+        semantic_cache.flush()
+    await invalidation_channel.stop()
+    AsyncMongoDB.close()
     # Add any cleanup code here
     logger.info("Application shutdown complete")
 
@@ -64,6 +106,8 @@ def create_app() -> FastAPI:
         description="Chatbot powered by GPT-4 Turbo with product suggestions from Shopee, TikTok, and Amazon",
         version="1.0.0",
         lifespan=lifespan,
+        # orjson renders the (already serialized) response bodies several times faster than json
+        default_response_class=ORJSONResponse,
     )
     
     # CORS middleware
@@ -75,6 +119,13 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    if settings.RESPONSE_COMPRESSION != COMPRESSION_OFF:
+        app.add_middleware(
+            CompressionMiddleware,
+            algorithm=settings.RESPONSE_COMPRESSION,
+            minimum_size=settings.RESPONSE_COMPRESSION_MIN_BYTES
+        )
+
     # Logging middleware
     app.middleware("http")(log_requests)
     
@@ -82,6 +133,7 @@ def create_app() -> FastAPI:
     route_configs = [
         (chatbot_router, "/api/chatbot", ["Chatbot"]),
         (chat_history_router, "/api/chat-history", ["Chat History"]),
+        (chat_search_router, "/api/chat-search", ["Chat Search"]),
         (token_tracker_router, "/api/token-tracker", ["Token Tracker"]),
     ]
     app.include_router(messenger_router)
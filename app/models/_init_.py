@@ -1,8 +1,10 @@
 """
 This package contains data models for the application.
 """
-from .chat_history_model import ChatHistory, Message
+from .chat_history_model import (
+    ChatHistory, ChatHistoryPage, ChatSessionSummary, ChatSearchHit, ChatSearchResults, Message
+)
 from .chatbot_model import ChatRequest, ChatResponse
 from .token_usage_model import TokenUsage
 
-__all__ = ["ChatHistory", "Message", "ChatRequest", "ChatResponse", "TokenUsage"]
\ No newline at end of file
+__all__ = ["ChatHistory", "ChatHistoryPage", "ChatSessionSummary", "ChatSearchHit", "ChatSearchResults", "Message", "ChatRequest", "ChatResponse", "TokenUsage"]
\ No newline at end of file
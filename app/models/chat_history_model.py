@@ -10,6 +10,8 @@ class Message(BaseModel):
     role: str  
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    message_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    enhancement_status: Optional[str] = None  # "pending" while a deferred enhancement runs
 
 class ChatHistory(BaseModel):
     """
@@ -24,6 +26,11 @@ class ChatHistory(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     messages: List[Message] = []
     metadata: Optional[Dict[str, Any]] = None  
+    # Total number of messages; with bucketed storage `messages` may hold only the recent ones
+    message_count: Optional[int] = None
+    # Rolling summary of the first summary_upto messages (app/api/summarizer.py)
+    summary: Optional[str] = None
+    summary_upto: Optional[int] = None
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -31,4 +38,57 @@ class ChatHistory(BaseModel):
         json_encoders={
             datetime: lambda dt: dt.isoformat()
         }
-    )
\ No newline at end of file
+    )
+
+class ChatHistoryPage(ChatHistory):
+    """
+    A page of a session's messages, oldest first.
+    """
+
+    # Pass as `before` to get the previous (older) page; None when the page starts at the first message
+    next_before: Optional[int] = None
+
+class ChatSessionSummary(BaseModel):
+    """
+    A session without its messages, for listings.
+    """
+
+    id: Optional[str] = Field(alias="_id", default=None)
+    session_id: str
+    user_id: str
+    created_at: datetime
+    updated_at: datetime
+    metadata: Optional[Dict[str, Any]] = None
+    message_count: int = 0
+    summary: Optional[str] = None
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class ChatSearchHit(BaseModel):
+    """
+    A session matching a search, with its best-matching message.
+    """
+
+    session_id: str
+    user_id: str
+    updated_at: Optional[datetime] = None
+    score: float
+    # Messages of the session that match the query
+    matches: int
+    # Position of the best-matching message; history pages ending there use before=message_position + 1
+    message_position: int
+    message: Optional[Message] = None
+
+
+class ChatSearchResults(BaseModel):
+    """
+    A page of search results, best first.
+    """
+
+    query: str
+    # Sessions matching the query and filters
+    total: int
+    hits: List[ChatSearchHit] = []
+    # Pass as `offset` to get the next page; None on the last page
+    next_offset: Optional[int] = None
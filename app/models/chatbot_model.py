@@ -6,8 +6,14 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = None
     user_id: str
     message: str
+    defer_enhancement: Optional[bool] = False
+    engine: Optional[str] = None
+    history_since: Optional[int] = None
 
 class ChatResponse(BaseModel):
     session_id: str
     reply: str
-    history: List[Message] 
\ No newline at end of file
+    history: List[Message]
+    message_id: Optional[str] = None
+    enhancement_status: Optional[str] = None
+    history_cursor: Optional[int] = None 
\ No newline at end of file
@@ -4,6 +4,7 @@ This package contains route handlers for the application.
 
 from .chatbot import router as chatbot_router
 from .chat_history import router as chat_history_router
+from .chat_search import router as chat_search_router
 from .token_tracker import router as token_tracker_router
 
-__all__ = ["chatbot_router", "chat_history_router", "token_tracker_router"]
\ No newline at end of file
+__all__ = ["chatbot_router", "chat_history_router", "chat_search_router", "token_tracker_router"]
\ No newline at end of file
@@ -1,61 +1,141 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.models.chat_history_model import ChatHistory, Message
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from app.models.chat_history_model import ChatHistory, ChatHistoryPage, ChatSessionSummary, Message
 from app.api import (
     add_message_to_session,
-    get_chat_history,
+    get_chat_history_page,
+    get_session_updated_at,
     get_user_chat_sessions,
+    get_user_session_summaries,
+    get_user_session_versions,
     delete_chat_session,
-    update_session_metadata
+    update_session_metadata,
+    export_user_sessions
 )
+from app.api.export import export_response
+from datetime import datetime
+import hashlib
 import logging
-from typing import List
+from typing import List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="", tags=["Chat History"])
 
+def _etag(*parts) -> str:
+    """Weak ETag of a response, from the updated_at value(s) it was built from and the query"""
+    return 'W/"' + hashlib.sha1(repr(parts).encode("utf-8")).hexdigest() + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check, with the weak comparison RFC 9110 prescribes for GET"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _cache_headers(etag: str) -> dict:
+    # no-cache: clients may keep the body but must revalidate it (a cheap 304) before reuse
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
 @router.post("/{session_id}", response_model=ChatHistory)
 async def add_message(session_id: str, message: Message, user_id: str):
     """
     Add a message to the chat session, or create a new session if not exist.
     """
     try:
-        return add_message_to_session(session_id, user_id, message)
+        session = await add_message_to_session(session_id, user_id, message)
+        if session.message_count and session.message_count > len(session.messages):
+            # The write only loaded the recent messages; the response holds the whole session
+            session = await get_chat_history_page(session_id, None) or session
+        return session
     except Exception as e:
         logger.error(f"Error adding message to session {session_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error adding message: {str(e)}")
 
-@router.get("/{session_id}", response_model=ChatHistory)
-async def get_history(session_id: str):
+@router.get("/{session_id}", response_model=ChatHistoryPage)
+async def get_history(
+    session_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1, le=500),
+    before: Optional[int] = Query(default=None, ge=0)
+):
     """
-    Retrieve the entire chat history of a session.
+    Retrieve the chat history of a session. Without `limit` every message is returned;
+    with it, the newest `limit` messages before position `before` (default: the end).
+    Pass the returned `next_before` as `before` to page backwards.
+    Answers 304 when If-None-Match holds the ETag of an unchanged session.
     """
-    session = get_chat_history(session_id)
+    if request.headers.get("if-none-match"):
+        # Only the header's updated_at is read to decide whether anything changed
+        updated_at = await get_session_updated_at(session_id)
+        if updated_at is None:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        etag = _etag(session_id, updated_at, limit, before)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+
+    session = await get_chat_history_page(session_id, limit, before)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
+    response.headers.update(_cache_headers(_etag(session_id, session.updated_at, limit, before)))
     return session
 
-@router.get("/user/{user_id}", response_model=List[ChatHistory])
+@router.get("/user/{user_id}", response_model=None)
 async def get_user_sessions(
     user_id: str,
-    limit: int = Query(default=10, ge=1, le=50)
-):
+    request: Request,
+    response: Response,
+    limit: int = Query(default=10, ge=1, le=50),
+    summary: bool = Query(default=False, description="Leave out the messages (message_count is kept)")
+) -> Union[List[ChatHistory], List[ChatSessionSummary], Response]:
     """
-    Get recent chat sessions for a user.
+    Get recent chat sessions for a user, or with `summary=true` just their headers.
+    Answers 304 when If-None-Match holds the ETag of an unchanged listing.
     """
     try:
-        return get_user_chat_sessions(user_id, limit)
+        if request.headers.get("if-none-match"):
+            versions = await get_user_session_versions(user_id, limit)
+            etag = _etag(user_id, limit, summary, versions)
+            if _etag_matches(request, etag):
+                return Response(status_code=304, headers=_cache_headers(etag))
+
+        if summary:
+            sessions = await get_user_session_summaries(user_id, limit)
+        else:
+            sessions = await get_user_chat_sessions(user_id, limit)
+        versions = [(session.session_id, session.updated_at) for session in sessions]
+        response.headers.update(_cache_headers(_etag(user_id, limit, summary, versions)))
+        return sessions
     except Exception as e:
         logger.error(f"Error getting sessions for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving sessions: {str(e)}")
 
+@router.get("/user/{user_id}/export")
+async def export_sessions(
+    user_id: str,
+    since: Optional[datetime] = Query(default=None, description="Only sessions updated at or after this time"),
+    until: Optional[datetime] = Query(default=None, description="Only sessions updated before this time"),
+    after: Optional[str] = Query(default=None, description="Resume after this session_id (the last one received)"),
+    messages: bool = Query(default=True, description="Include the messages of each session"),
+    gzip: bool = Query(default=False, description="Send the export gzip-compressed (.ndjson.gz)")
+):
+    """
+    Stream all sessions of a user as NDJSON, one session per line in session_id order.
+    Memory use does not grow with the size of the export; pass the last session_id
+    received as `after` to resume an interrupted export.
+    """
+    return export_response(
+        export_user_sessions(user_id, since, until, after, messages, gzip), f"chat-sessions-{user_id}", gzip
+    )
+
 @router.delete("/{session_id}")
 async def delete_session(session_id: str):
     """
     Delete a chat session.
     """
     try:
-        success = delete_chat_session(session_id)
+        success = await delete_chat_session(session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Chat session not found")
         return {"message": "Chat session deleted successfully"}
@@ -71,7 +151,7 @@ async def update_metadata(session_id: str, metadata: dict):
     Update metadata for a chat session.
     """
     try:
-        success = update_session_metadata(session_id, metadata)
+        success = await update_session_metadata(session_id, metadata)
         if not success:
             raise HTTPException(status_code=404, detail="Chat session not found")
         return {"message": "Metadata updated successfully"}
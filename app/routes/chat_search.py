@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.models.chat_history_model import ChatSearchHit, ChatSearchResults, Message
+from app.api import get_chat_history_page
+from app.api.chat_search import chat_search
+from app.core.config import settings
+from datetime import datetime
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="", tags=["Chat Search"])
+
+async def _message_at(session_id: str, position: int) -> Optional[Message]:
+    """The message at a position of a session; None if it is gone (deleted or archived since indexing)"""
+    try:
+        page = await get_chat_history_page(session_id, 1, position + 1, restore=False)
+    except Exception as e:
+        logger.error(f"Error reading message {position} of session {session_id}: {e}")
+        return None
+    return page.messages[0] if page and page.messages else None
+
+@router.get("", response_model=ChatSearchResults)
+async def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for, with or without diacritics"),
+    user_id: Optional[str] = Query(default=None, description="Only sessions of this user"),
+    since: Optional[datetime] = Query(default=None, description="Only messages sent at or after this time"),
+    until: Optional[datetime] = Query(default=None, description="Only messages sent before this time"),
+    limit: int = Query(default=10, ge=1, le=50),
+    offset: int = Query(default=0, ge=0, le=1000)
+):
+    """
+    Find sessions whose messages mention the query (e.g. an order code or product name),
+    best match first, each with its best-matching message. Pass the returned `next_offset`
+    as `offset` to get the next page. Answers 503 until the index has been built once.
+    """
+    if not settings.CHAT_SEARCH_ENABLED:
+        raise HTTPException(status_code=503, detail="Chat search is disabled (CHAT_SEARCH_ENABLED)")
+    try:
+        total, page = await chat_search.search(q, user_id, since, until, offset, limit)
+        sessions = [chat_search.index.session_info(session_id) for _, session_id, _, _ in page]
+        messages = await asyncio.gather(*(_message_at(session_id, position) for _, session_id, position, _ in page))
+    except Exception as e:
+        logger.error(f"Error searching chat history for {q!r}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error searching chat history: {str(e)}")
+    if not chat_search.index.full_loaded_at:
+        # The first build failed: an empty result would look like "no match"
+        raise HTTPException(status_code=503, detail="Chat search index is not built yet, try again later")
+
+    hits = []
+    for (score, session_id, position, matches), (hit_user_id, updated_at), message in zip(page, sessions, messages):
+        hits.append(ChatSearchHit(
+            session_id=session_id,
+            user_id=hit_user_id,
+            updated_at=updated_at,
+            score=round(score, 4),
+            matches=matches,
+            message_position=position,
+            message=message
+        ))
+    return ChatSearchResults(
+        query=q,
+        total=total,
+        hits=hits,
+        next_offset=offset + limit if offset + limit < total else None
+    )
@@ -1,20 +1,47 @@
-from fastapi import APIRouter, HTTPException, Body, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, HTTPException, Body, Request, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel as PydanticBaseModel, Field, validator
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional
+import asyncio
 import uuid
+import json
 import logging
 from app.api import (
     update_token_usage,
-    create_or_get_session,
     add_message_to_session,
-    process_message_with_assistant_tool
+    process_message_with_assistant_tool,
+    process_message_with_deferred_enhancement,
+    stream_message_with_assistant_tool,
+    get_session_message,
+    get_chat_history_page
 )
 from ..models.chat_history_model import Message
+from app.core import metrics
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.api.response_cache import response_cache
+from app.api.semantic_cache import semantic_cache
+from app.api.openai_scheduler import openai_scheduler, PRIORITY_WEB
+from app.api.single_flight import single_flight
+from app.api import resilience
+from app.api.chatbot_tool import CHAT_ENGINES
+from app.api.product_index import product_catalog
+from app.api.session_cache import session_cache
+from app.api.summarizer import summarizer
+from app.api.chat_search import chat_search
+from app.api.db_indexes import explain_hot_queries
+from app.api.chat_archive import archive_stats
+from app.api.deferred_enhancement import (
+    schedule_enhancement,
+    get_local_task,
+    STATUS_PENDING
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
+# Interval used when long-polling a message stored by another worker
+MESSAGE_POLL_INTERVAL = 0.5
 templates = Jinja2Templates(directory="app/templates")
 
 # Request/Response Models
@@ -23,6 +50,13 @@ class ChatRequest(PydanticBaseModel):
     user_id: str
     message: str = Field(..., min_length=1, max_length=4000)
     enhance_response: Optional[bool] = True
+    # Return the raw reply at once and enhance it in the background
+    defer_enhancement: Optional[bool] = False
+    # "assistant" or "completion"; defaults to CHAT_ENGINE
+    engine: Optional[str] = None
+    # Return only the messages from this position on (the history_cursor of the previous
+    # response) instead of the whole history
+    history_since: Optional[int] = Field(default=None, ge=0)
 
     @validator('message')
     def validate_message(cls, v):
@@ -30,27 +64,53 @@ class ChatRequest(PydanticBaseModel):
             raise ValueError('Message cannot be empty or contain only whitespace')
         return v
 
+    @validator('engine')
+    def validate_engine(cls, v):
+        if v is not None and v not in CHAT_ENGINES:
+            raise ValueError(f"engine must be one of: {', '.join(CHAT_ENGINES)}")
+        return v
+
 class ChatResponse(PydanticBaseModel):
     session_id: str
     reply: str
     history: List[Message]
+    message_id: Optional[str] = None
+    enhancement_status: Optional[str] = None
+    # Number of messages in the session, i.e. the history_since of the next turn
+    history_cursor: Optional[int] = None
+
+class MessageStatusResponse(PydanticBaseModel):
+    message_id: str
+    content: str
+    enhancement_status: Optional[str] = None
 
 # Routes
 @router.post("/interact", response_model=ChatResponse)
-async def handle_chat_interaction(request: ChatRequest = Body(...)):
+async def handle_chat_interaction(http_request: Request, request: ChatRequest = Body(...)):
     """Handle chat interaction with product search integration"""
+    # Stop working on the turn (and cancel the OpenAI run) once the client has gone away
+    deadline = Deadline(settings.REQUEST_DEADLINE_SECONDS, http_request.is_disconnected)
+    return await run_chat_interaction(request, deadline=deadline)
+
+async def run_chat_interaction(
+    request: ChatRequest,
+    notify_enhanced: Optional[Callable[[str], Awaitable[None]]] = None,
+    deadline: Optional[Deadline] = None,
+    priority: int = PRIORITY_WEB
+) -> ChatResponse:
+    """
+    Run one chat turn. With defer_enhancement the raw reply is returned immediately and the
+    enhanced text replaces it in chat_history later; notify_enhanced (if given) receives it.
+    The turn is bounded by deadline (default REQUEST_DEADLINE_SECONDS from now) and its
+    OpenAI calls are scheduled at priority (web by default).
+    """
     session_id = request.session_id or str(uuid.uuid4())
+    deadline = deadline or Deadline(settings.REQUEST_DEADLINE_SECONDS)
 
     try:
-        # Load or create chat session
-        chat_session = create_or_get_session(
-            session_id=session_id, 
-            user_id=request.user_id
-        )
-       
-        # Add user message
+        # Add user message (creates the session if needed)
         user_message = Message(role="user", content=request.message)
-        chat_session = add_message_to_session(
+        chat_session = await add_message_to_session(
             session_id, 
             request.user_id, 
             user_message
@@ -58,17 +118,40 @@ async def handle_chat_interaction(request: ChatRequest = Body(...)):
        
         # Process message and get response with session context
         enhance_response_value = getattr(request, 'enhance_response', True)
-        logger.info(f"Chat request with enhance_response={enhance_response_value}")
-        
-        bot_reply_content, token_usage = await process_message_with_assistant_tool(
-            message=request.message,
-            session_id=session_id,
-            enhance_response=enhance_response_value
+        defer_enhancement_value = enhance_response_value and getattr(request, 'defer_enhancement', False)
+        logger.info(
+            f"Chat request with enhance_response={enhance_response_value}, "
+            f"defer_enhancement={defer_enhancement_value}"
         )
+
+        enhance_job = None
+        if defer_enhancement_value:
+            bot_reply_content, token_usage, enhance_job = await process_message_with_deferred_enhancement(
+                message=request.message,
+                session_id=session_id,
+                deadline=deadline,
+                priority=priority,
+                engine=request.engine,
+                session_data=_session_context(chat_session)
+            )
+        else:
+            bot_reply_content, token_usage = await process_message_with_assistant_tool(
+                message=request.message,
+                session_id=session_id,
+                enhance_response=enhance_response_value,
+                deadline=deadline,
+                priority=priority,
+                engine=request.engine,
+                session_data=_session_context(chat_session)
+            )
         
         # Add bot's reply to history
-        bot_message = Message(role="assistant", content=bot_reply_content)
-        chat_session = add_message_to_session(
+        bot_message = Message(
+            role="assistant",
+            content=bot_reply_content,
+            enhancement_status=STATUS_PENDING if enhance_job else None
+        )
+        chat_session = await add_message_to_session(
             session_id, 
             request.user_id, 
             bot_message
@@ -80,17 +163,26 @@ async def handle_chat_interaction(request: ChatRequest = Body(...)):
             session_id=session_id,
             prompt_tokens=token_usage["prompt_tokens"],
             completion_tokens=token_usage["completion_tokens"],
+            cached_tokens=token_usage.get("cached_tokens", 0),
             metadata={
-                "model": "gpt-4.1",
+                "model": token_usage.get("model"),
+                "enhancement_model": token_usage.get("enhancement_model"),
                 "interaction_type": "chat",
-                "message_count": len(chat_session.messages)
+                "message_count": chat_session.message_count or len(chat_session.messages)
             }
         )
 
+        if enhance_job:
+            schedule_enhancement(session_id, request.user_id, bot_message.message_id, enhance_job, notify_enhanced)
+        summarizer.maybe_schedule(chat_session)
+
         return ChatResponse(
             session_id=chat_session.session_id,
             reply=bot_reply_content,
-            history=chat_session.messages
+            history=await _history_since(chat_session, getattr(request, 'history_since', None)),
+            message_id=bot_message.message_id,
+            enhancement_status=bot_message.enhancement_status,
+            history_cursor=chat_session.message_count
         )
 
     except HTTPException as e:
@@ -99,6 +191,170 @@ async def handle_chat_interaction(request: ChatRequest = Body(...)):
         logger.error(f"Error in /chatbot/interact: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
 
+@router.get("/messages/{session_id}/{message_id}", response_model=MessageStatusResponse)
+async def get_message_status(
+    session_id: str,
+    message_id: str,
+    wait: float = Query(default=0, ge=0, le=30)
+):
+    """
+    Current content of a reply, used to pick up deferred enhancements.
+    With wait > 0 this long-polls: it returns as soon as the reply is no longer pending,
+    or after wait seconds.
+    """
+    message = await get_session_message(session_id, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    if wait and message.enhancement_status == STATUS_PENDING:
+        task = get_local_task(message_id)
+        if task:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # Enhancement runs in another worker: poll the stored message
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait
+            while message.enhancement_status == STATUS_PENDING and loop.time() < deadline:
+                await asyncio.sleep(MESSAGE_POLL_INTERVAL)
+                message = await get_session_message(session_id, message_id) or message
+        message = await get_session_message(session_id, message_id) or message
+
+    return MessageStatusResponse(
+        message_id=message.message_id,
+        content=message.content,
+        enhancement_status=message.enhancement_status
+    )
+
+def _session_context(chat_session) -> dict:
+    """The parts of a just-written session the chatbot needs, so it does not read it again."""
+    return chat_session.model_dump(include={"messages", "metadata", "message_count", "summary", "summary_upto"})
+
+async def _history_since(chat_session, since: Optional[int]) -> List[Message]:
+    """
+    Messages of a just-written session from position since on; the whole history when since
+    is None. A bucketed session holds only its recent messages after a write, so the rest is
+    loaded from its buckets. Keeps the response size proportional to the turn, not the session.
+    """
+    total = chat_session.message_count or len(chat_session.messages)
+    missing = total - (since or 0)
+    if missing <= 0:
+        return []
+    if missing <= len(chat_session.messages):
+        return chat_session.messages[-missing:]
+    # The client is further behind than the messages loaded for the turn (bucketed sessions)
+    page = await get_chat_history_page(chat_session.session_id, missing, total)
+    return page.messages if page else chat_session.messages
+
+def _sse_frame(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/interact/stream")
+async def handle_chat_interaction_stream(request: ChatRequest = Body(...)):
+    """
+    Streaming variant of /interact.
+    Emits SSE frames: assistant_delta / enhancement_start / enhancement_delta while the reply
+    is generated, then a single done frame once the final reply has been persisted
+    (or an error frame if persisting fails).
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    # StreamingResponse already watches for disconnects and closes the generator, which
+    # cancels the run; the deadline only bounds the time
+    deadline = Deadline(settings.REQUEST_DEADLINE_SECONDS)
+
+    try:
+        user_message = Message(role="user", content=request.message)
+        session_data = _session_context(
+            await add_message_to_session(session_id, request.user_id, user_message)
+        )
+    except Exception as e:
+        logger.error(f"Error in /chatbot/interact/stream: {e}")
+        raise HTTPException(status_code=500, detail="An internal server error occurred.")
+
+    enhance_response_value = getattr(request, 'enhance_response', True)
+    logger.info(f"Streaming chat request with enhance_response={enhance_response_value}")
+
+    async def event_stream():
+        async for event, data in stream_message_with_assistant_tool(
+            message=request.message,
+            session_id=session_id,
+            enhance_response=enhance_response_value,
+            deadline=deadline,
+            engine=request.engine,
+            session_data=session_data
+        ):
+            if event != "final":
+                yield _sse_frame(event, data)
+                continue
+
+            bot_reply_content = data["reply"]
+            token_usage = data["token_usage"]
+            try:
+                bot_message = Message(role="assistant", content=bot_reply_content)
+                chat_session = await add_message_to_session(session_id, request.user_id, bot_message)
+                await update_token_usage(
+                    user_id=request.user_id,
+                    session_id=session_id,
+                    prompt_tokens=token_usage["prompt_tokens"],
+                    completion_tokens=token_usage["completion_tokens"],
+                    cached_tokens=token_usage.get("cached_tokens", 0),
+                    metadata={
+                        "model": token_usage.get("model"),
+                        "enhancement_model": token_usage.get("enhancement_model"),
+                        "interaction_type": "chat_stream",
+                        "message_count": chat_session.message_count or len(chat_session.messages)
+                    }
+                )
+            except Exception as e:
+                logger.error(f"Error persisting streamed reply for session {session_id}: {e}")
+                yield _sse_frame("error", {"detail": "An internal server error occurred."})
+                return
+            summarizer.maybe_schedule(chat_session)
+            yield _sse_frame("done", {
+                "session_id": session_id,
+                "reply": bot_reply_content,
+                "history_cursor": chat_session.message_count
+            })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/metrics")
+async def get_chatbot_metrics():
+    """Expose in-process performance counters (per worker)."""
+    return {
+        "counters": metrics.get_counters(),
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "openai_scheduler": openai_scheduler.stats(),
+        "single_flight": single_flight.stats(),
+        "resilience": resilience.stats(),
+        "product_index": product_catalog.stats(),
+        "session_cache": session_cache.stats(),
+        "summarizer": summarizer.stats(),
+        "chat_search": chat_search.stats()
+    }
+
+@router.get("/diagnostics/query-plans")
+async def get_query_plans():
+    """Explain the hot chat-history / token-usage queries and flag collection scans."""
+    plans = await explain_hot_queries()
+    return {
+        "collection_scans": [plan["query"] for plan in plans if plan.get("collection_scan")],
+        "plans": plans
+    }
+
+@router.get("/diagnostics/archive")
+async def get_archive_stats():
+    """Archived sessions and the bytes moved out of the hot chat-history collections."""
+    return await archive_stats()
+
 #Renders the main chat interface (HTML page) for the user.
 
 @router.get("/", response_class=HTMLResponse)
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime
 from typing import List, Optional
 from app.models.token_usage_model import TokenUsage
 from app.api import (
     update_token_usage as api_update_token_usage,
     get_token_usage as api_get_token_usage,
-    get_user_token_usage as api_get_user_token_usage
+    get_user_token_usage as api_get_user_token_usage,
+    export_user_token_usage
 )
+from app.api.export import export_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,7 +21,8 @@ async def update_token_usage(
     session_id: str,
     prompt_tokens: int,
     completion_tokens: int,
-    metadata: Optional[dict] = None
+    metadata: Optional[dict] = None,
+    cached_tokens: int = 0
 ):
     """
     Update token usage for a user and session.
@@ -29,12 +33,27 @@ async def update_token_usage(
             session_id=session_id,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
-            metadata=metadata
+            metadata=metadata,
+            cached_tokens=cached_tokens
         )
     except Exception as e:
         logger.error(f"Error updating token usage: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/usage/{user_id}/export")
+async def export_token_usage(
+    user_id: str,
+    since: Optional[datetime] = Query(default=None, description="Only records updated at or after this time"),
+    until: Optional[datetime] = Query(default=None, description="Only records updated before this time"),
+    after: Optional[str] = Query(default=None, description="Resume after this session_id (the last one received)"),
+    gzip: bool = Query(default=False, description="Send the export gzip-compressed (.ndjson.gz)")
+):
+    """
+    Stream all token usage records of a user as NDJSON, one record per line in session_id order.
+    Declared before /usage/{user_id}/{session_id}, which would otherwise match it.
+    """
+    return export_response(export_user_token_usage(user_id, since, until, after, gzip), f"token-usage-{user_id}", gzip)
+
 @router.get("/usage/{user_id}/{session_id}", response_model=TokenUsage)
 async def get_token_usage(user_id: str, session_id: str):
     """
@@ -0,0 +1,55 @@
+"""
+Move chat sessions that have been idle for a while into the compressed archive (chat_archive).
+
+Usage:
+    python -m app.scripts.archive_sessions [--idle-days 90] [--limit N] [--dry-run]
+
+Run it periodically, e.g. daily from cron. --idle-days defaults to CHAT_ARCHIVE_AFTER_DAYS,
+which must be set: writes to a new session id only check the archive while it is.
+Archived sessions are restored into chat_history the next time they are read or written
+(see app/api/chat_archive.py). Prints the sessions archived and the bytes reclaimed from the
+hot collections; --dry-run only reports what would be archived.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.api.chat_archive import archive_idle_sessions, archive_stats
+from app.core.config import settings
+from app.database import AsyncMongoDB
+
+logger = logging.getLogger(__name__)
+
+
+async def run(idle_days: float, limit: int, dry_run: bool) -> None:
+    try:
+        stats = await archive_idle_sessions(idle_days, limit, dry_run)
+        logger.info(
+            f"Done: {stats['archived']} sessions {'to archive' if dry_run else 'archived'}, "
+            f"{stats['skipped']} written meanwhile, {stats['failed']} failed; "
+            f"{stats['raw_bytes']} bytes -> {stats['stored_bytes']} compressed, "
+            f"{stats['bytes_reclaimed']} bytes reclaimed"
+        )
+        if not dry_run:
+            logger.info(f"Archive: {await archive_stats()}")
+    finally:
+        AsyncMongoDB.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive chat sessions that have been idle for a while")
+    parser.add_argument("--idle-days", type=float, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                        help="archive sessions not updated for this many days (default CHAT_ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many sessions (0 = all)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    args = parser.parse_args()
+    if settings.CHAT_ARCHIVE_AFTER_DAYS <= 0:
+        parser.error("set CHAT_ARCHIVE_AFTER_DAYS (the app restores archived sessions on write only while it is set)")
+    if args.idle_days <= 0:
+        parser.error("--idle-days must be positive")
+    asyncio.run(run(args.idle_days, args.limit, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
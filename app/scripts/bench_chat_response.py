@@ -0,0 +1,87 @@
+"""
+Serialization cost of a /api/chatbot/interact response against the session length.
+
+Usage:
+    python -m app.scripts.bench_chat_response [--lengths 10,50,200,1000] [--repeat 200]
+
+For each history length it builds a ChatResponse and times what the route does with it:
+Pydantic serialization plus rendering with the stdlib json encoder (Starlette's JSONResponse)
+or orjson (ORJSONResponse), for the full history and for a history_since delta (the two
+messages of the turn). It also prints the body size, gzipped, and the bytes a client
+downloads over the whole conversation when it asks for the full history on every turn.
+No database or OpenAI access is needed.
+"""
+
+import argparse
+import gzip
+import json
+import time
+
+import orjson
+
+from app.models.chat_history_model import Message
+from app.models.chatbot_model import ChatResponse
+
+# A typical enhanced reply: a few hundred characters of Vietnamese with markdown
+SAMPLE_REPLY = (
+    "**Gợi ý sản phẩm phù hợp:**\n\n"
+    "1. **Tai nghe không dây ABC** – pin 30 giờ, chống ồn chủ động, giá 1.290.000đ. "
+    "[Xem sản phẩm](https://example.com/p/1)\n"
+    "2. **Tai nghe thể thao XYZ** – chống nước IPX5, kết nối Bluetooth 5.3, giá 790.000đ. "
+    "[Xem sản phẩm](https://example.com/p/2)\n\n"
+    "Bạn thích kiểu nhét tai hay chụp tai hơn ạ?"
+)
+SAMPLE_QUESTION = "Mình cần tai nghe không dây để chạy bộ, tầm giá dưới 1 triệu"
+
+
+def _history(length: int) -> list:
+    return [
+        Message(role="user" if i % 2 == 0 else "assistant", content=SAMPLE_QUESTION if i % 2 == 0 else SAMPLE_REPLY)
+        for i in range(length)
+    ]
+
+
+def _render_json(content) -> bytes:
+    # What Starlette's JSONResponse does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _time_ms(render, response: ChatResponse, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        render(response.model_dump(mode="json"))
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def _response(history: list) -> ChatResponse:
+    return ChatResponse(session_id="bench", reply=SAMPLE_REPLY, history=history, history_cursor=len(history))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat response serialization against history length")
+    parser.add_argument("--lengths", default="10,50,200,1000", help="comma-separated history lengths")
+    parser.add_argument("--repeat", type=int, default=200, help="serializations timed per case")
+    args = parser.parse_args()
+
+    print(
+        f"{'messages':>8} {'full KB':>8} {'gzip KB':>8} {'json ms':>8} {'orjson ms':>9} "
+        f"{'delta KB':>8} {'delta ms':>8} {'session MB':>10}"
+    )
+    for length in [int(value) for value in args.lengths.split(",") if value.strip()]:
+        history = _history(length)
+        full = _response(history)
+        delta = _response(history[-2:])
+        body = orjson.dumps(full.model_dump(mode="json"))
+        # Full history on every turn: turn t downloads 2t messages
+        session_bytes = sum(len(orjson.dumps(_response(history[:turn]).model_dump(mode="json")))
+                            for turn in range(2, length + 1, 2))
+        print(
+            f"{length:>8} {len(body) / 1024:>8.1f} {len(gzip.compress(body)) / 1024:>8.1f} "
+            f"{_time_ms(_render_json, full, args.repeat):>8.3f} {_time_ms(orjson.dumps, full, args.repeat):>9.3f} "
+            f"{len(orjson.dumps(delta.model_dump(mode='json'))) / 1024:>8.1f} "
+            f"{_time_ms(orjson.dumps, delta, args.repeat):>8.3f} {session_bytes / 1024 / 1024:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
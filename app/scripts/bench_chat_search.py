@@ -0,0 +1,113 @@
+"""
+Query latency of the chat search index against the size of the indexed corpus.
+
+Usage:
+    python -m app.scripts.bench_chat_search [--sizes 10000,100000,500000] [--queries 200] [--seed 1]
+
+For each corpus size (in messages) it builds a ChatSearchIndex over synthetic conversations
+of 20 messages (Vietnamese product talk with order codes, one user per 5 sessions) and times
+searches: a rare order code, a common phrase typed without diacritics, and the common phrase
+restricted to one user. It prints build time, index terms and p50/p95 latency in ms.
+Order codes are written "DH-0000042" in even sessions and "DH0000043" in odd ones, and
+searched the other way round; "code hit %" is the share of code searches whose top hit is
+the session with that code. No database access is needed.
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from app.api.chat_search import ChatSearchIndex
+
+MESSAGES_PER_SESSION = 20
+SESSIONS_PER_USER = 5
+WORDS = (
+    "áo khoác quần jean giày thể thao tai nghe không dây điện thoại ốp lưng sạc dự phòng túi xách "
+    "đồng hồ kính mát váy đầm màu đen trắng xanh đỏ size lớn nhỏ giá rẻ khuyến mãi giao hàng nhanh "
+    "đổi trả bảo hành chính hãng còn hàng hết hàng thanh toán chuyển khoản tư vấn giúp mình với ạ"
+).split()
+TEMPLATES = (
+    "Mình muốn hỏi về {words}",
+    "Đơn hàng {code} của mình khi nào giao vậy?",
+    "Shop còn {words} không ạ?",
+    "Gợi ý cho bạn: {words}. Đơn {code} đã được xác nhận.",
+)
+
+
+def _order_code(session_index: int, separator: bool) -> str:
+    return f"DH-{session_index:07d}" if separator else f"DH{session_index:07d}"
+
+
+def _message(rng: random.Random, session_index: int) -> str:
+    template = rng.choice(TEMPLATES)
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+    return template.format(words=words, code=_order_code(session_index, session_index % 2 == 0))
+
+
+def _build(size: int, rng: random.Random) -> ChatSearchIndex:
+    index = ChatSearchIndex()
+    started = datetime(2024, 1, 1)
+    for session_index in range(size // MESSAGES_PER_SESSION):
+        session_id = f"s{session_index}"
+        user_id = f"u{session_index // SESSIONS_PER_USER}"
+        timestamp = started + timedelta(minutes=session_index)
+        messages = [
+            {"content": _message(rng, session_index), "timestamp": timestamp} for _ in range(MESSAGES_PER_SESSION)
+        ]
+        index.index_session(session_id, user_id, timestamp, messages)
+    return index
+
+
+def _latency_ms(index: ChatSearchIndex, queries: list, **filters) -> tuple:
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, 10, **filters)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def _code_hit_rate(index: ChatSearchIndex, session_indexes: list) -> float:
+    """Share of order-code searches, typed with the other separator style, that rank their session first"""
+    hits = 0
+    for session_index in session_indexes:
+        _, top = index.search(_order_code(session_index, session_index % 2 == 1), 1)
+        hits += bool(top) and top[0][1] == f"s{session_index}"
+    return 100 * hits / len(session_indexes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat search latency against corpus size")
+    parser.add_argument("--sizes", default="10000,100000,500000", help="comma-separated corpus sizes, in messages")
+    parser.add_argument("--queries", type=int, default=200, help="searches timed per query kind")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{'messages':>9} {'build s':>8} {'terms':>8} {'code p50':>9} {'code p95':>9} "
+        f"{'phrase p50':>10} {'phrase p95':>10} {'user p50':>9} {'user p95':>9} {'code hit %':>10}"
+    )
+    for size in [int(value) for value in args.sizes.split(",") if value.strip()]:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        index = _build(size, rng)
+        build_seconds = time.perf_counter() - started
+        sessions = max(size // MESSAGES_PER_SESSION, 1)
+        code_sessions = [rng.randrange(sessions) for _ in range(args.queries)]
+        codes = [_order_code(session_index, session_index % 2 == 1) for session_index in code_sessions]
+        phrases = ["giao hang nhanh"] * args.queries
+        code_p50, code_p95 = _latency_ms(index, codes)
+        phrase_p50, phrase_p95 = _latency_ms(index, phrases)
+        user_p50, user_p95 = _latency_ms(index, phrases, user_id="u0")
+        print(
+            f"{len(index):>9} {build_seconds:>8.1f} {index.term_count:>8} {code_p50:>9.3f} {code_p95:>9.3f} "
+            f"{phrase_p50:>10.3f} {phrase_p95:>10.3f} {user_p50:>9.3f} {user_p95:>9.3f} "
+            f"{_code_hit_rate(index, code_sessions):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
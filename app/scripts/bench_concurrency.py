@@ -0,0 +1,101 @@
+"""
+Wall time of N concurrent chat turns against the time of one.
+
+Usage:
+    python -m app.scripts.bench_concurrency [--concurrency 1,10,50] [--run-seconds 1.0] [--engine assistant|completion]
+
+For each concurrency level it starts that many chat turns at once (run_chat_interaction, what
+POST /api/chatbot/interact does), each on its own new session, against the configured MongoDB
+(DB_URI, MONGO_DB_NAME). OpenAI is answered by the in-process stand-in (openai_stand_in.py),
+whose runs and chat completions take --run-seconds. With the OpenAI and database calls awaited,
+N turns finish in about the time of one; any call that blocks the event loop shows up as wall
+time growing with N and as event-loop lag (the worst delay of a 10 ms timer running alongside).
+It prints wall time, per-turn p50/p95, turns per second and that lag. The OpenAI scheduler
+still admits calls under OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT: raise them to measure the
+pipeline rather than the rate limits. The sessions are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+# Before app.api: chatbot_tool builds its OpenAI client at import time
+from app.scripts import openai_stand_in
+
+from app.database import (
+    AsyncMongoDB,
+    get_async_chat_history_collection,
+    get_async_chat_messages_collection,
+    get_async_token_usage_collection
+)
+from app.models.chatbot_model import ChatRequest
+from app.routes.chatbot import run_chat_interaction
+
+USER_ID = "bench-concurrency"
+LAG_INTERVAL = 0.01
+
+
+async def _turn(session_id: str, engine: str) -> float:
+    # A different question per turn, so neither the reply caches nor single-flight answer it
+    message = f"Đơn {session_id} có tai nghe không dây dưới 1 triệu không ạ?"
+    started = time.perf_counter()
+    await run_chat_interaction(ChatRequest(session_id=session_id, user_id=USER_ID, message=message, engine=engine))
+    return time.perf_counter() - started
+
+
+async def _measure_lag(stop: asyncio.Event) -> float:
+    """Worst delay of a LAG_INTERVAL timer until stop is set"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        worst = max(worst, time.perf_counter() - started - LAG_INTERVAL)
+    return worst
+
+
+async def run(levels: list, run_seconds: float, engine: str) -> None:
+    openai_stand_in.install(run_seconds)
+    prefix = f"bench-concurrency-{uuid.uuid4().hex[:8]}"
+    try:
+        await AsyncMongoDB.connect()
+        # Warm-up: connection pool, tokenizer, product index
+        await _turn(f"{prefix}-warmup", engine)
+        single = await _turn(f"{prefix}-single", engine)
+        print(f"one turn: {single:.2f} s")
+        print(f"{'turns':>6} {'wall s':>7} {'x one turn':>10} {'p50 s':>6} {'p95 s':>6} {'turns/s':>8} {'lag ms':>7}")
+        for level in levels:
+            stop = asyncio.Event()
+            lag = asyncio.create_task(_measure_lag(stop))
+            started = time.perf_counter()
+            durations = sorted(await asyncio.gather(
+                *(_turn(f"{prefix}-{level}-{index}", engine) for index in range(level))
+            ))
+            wall = time.perf_counter() - started
+            stop.set()
+            worst_lag = await lag
+            print(
+                f"{level:>6} {wall:>7.2f} {wall / single:>10.2f} {statistics.median(durations):>6.2f} "
+                f"{durations[max(int(len(durations) * 0.95) - 1, 0)]:>6.2f} {level / wall:>8.1f} {worst_lag * 1000:>7.1f}"
+            )
+    finally:
+        session_filter = {"session_id": {"$regex": f"^{prefix}-"}}
+        await get_async_chat_history_collection().delete_many(session_filter)
+        await get_async_chat_messages_collection().delete_many(session_filter)
+        await get_async_token_usage_collection().delete_many(session_filter)
+        AsyncMongoDB.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark concurrent chat turns against a single one")
+    parser.add_argument("--concurrency", default="1,10,50", help="comma-separated numbers of concurrent turns")
+    parser.add_argument("--run-seconds", type=float, default=1.0, help="duration of each stand-in OpenAI run")
+    parser.add_argument("--engine", choices=("assistant", "completion"), default="assistant")
+    args = parser.parse_args()
+    levels = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    asyncio.run(run(levels, args.run_seconds, args.engine))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Database operations per chat turn, as counted by the CommandListener behind mongo.ops.*.
+
+Usage:
+    python -m app.scripts.count_turn_ops [--turns 5] [--engine assistant|completion]
+
+Runs --turns chat turns (run_chat_interaction, what POST /api/chatbot/interact does) on a new
+session against the configured MongoDB (DB_URI, MONGO_DB_NAME), with the OpenAI calls answered
+by the in-process stand-in (openai_stand_in.py), and prints the Mongo commands each turn sent.
+A turn may send TURN_OP_BUDGET commands (user message, assistant message, token usage), the
+first turn of a session FIRST_TURN_OP_BUDGET (it also stores the thread id); the script exits
+with status 1 when a turn goes over. Some settings add to the budgets: bucketed storage
+(CHAT_STORAGE_MODE) a second write per message, plus a read of the previous bucket when the
+recent messages span two, CHAT_ARCHIVE_AFTER_DAYS an archive lookup on the first turn,
+RESPONSE_CACHE_MONGO_ENABLED a shared cache lookup and write on every turn (plus its
+generation check on the first). Background workers (summaries, search refresh, the session
+cache invalidation channel) are not started. The session and its
+token usage are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import sys
+import uuid
+
+# Before app.api: chatbot_tool builds its OpenAI client at import time
+from app.scripts import openai_stand_in
+
+from app.api.chat_history import recent_message_limit
+from app.core import metrics
+from app.core.config import settings
+from app.database import (
+    AsyncMongoDB,
+    get_async_chat_history_collection,
+    get_async_chat_messages_collection,
+    get_async_token_usage_collection
+)
+from app.models.chatbot_model import ChatRequest
+from app.routes.chatbot import run_chat_interaction
+
+TURN_OP_BUDGET = 3
+FIRST_TURN_OP_BUDGET = 4
+USER_ID = "count-turn-ops"
+
+
+def _budget(turn: int) -> int:
+    """Operation budget of a session's turn-th turn under the current settings"""
+    first = turn == 1
+    budget = FIRST_TURN_OP_BUDGET if first else TURN_OP_BUDGET
+    if first and settings.CHAT_ARCHIVE_AFTER_DAYS > 0:
+        # A new session id is looked up in the archive
+        budget += 1
+    if settings.CHAT_STORAGE_MODE == "bucketed":
+        # Each message write is a header upsert plus a bucket push, and it reads the previous
+        # bucket when the recent messages span two (the turn writes seqs 2 * turn - 2 and - 1)
+        limit, size = recent_message_limit(), settings.CHAT_BUCKET_SIZE
+        budget += 2 + sum(1 for seq in (2 * turn - 2, 2 * turn - 1) if seq >= size and seq % size + 1 < limit)
+    if settings.RESPONSE_CACHE_ENABLED and settings.RESPONSE_CACHE_MONGO_ENABLED:
+        budget += 3 if first else 2
+    return budget
+
+
+def _ops() -> dict:
+    return {
+        name[len("mongo.ops."):]: int(count) for name, count in metrics.get_counters("mongo.ops.").items()
+    }
+
+
+async def run(turns: int, engine: str) -> bool:
+    openai_stand_in.install(run_seconds=0)
+    session_id = f"count-turn-ops-{uuid.uuid4().hex[:12]}"
+    within_budget = True
+    try:
+        await AsyncMongoDB.connect()
+        print(f"{'turn':>4} {'ops':>4} {'budget':>6}  commands")
+        for turn in range(1, turns + 1):
+            before = _ops()
+            await run_chat_interaction(ChatRequest(
+                session_id=session_id, user_id=USER_ID, message=f"Câu hỏi số {turn}: còn hàng không ạ?", engine=engine
+            ))
+            after = _ops()
+            commands = {name: count - before.get(name, 0) for name, count in after.items() if count > before.get(name, 0)}
+            turn_budget = _budget(turn)
+            total = sum(commands.values())
+            within_budget = within_budget and total <= turn_budget
+            print(
+                f"{turn:>4} {total:>4} {turn_budget:>6}  "
+                f"{', '.join(f'{name} x{count}' for name, count in sorted(commands.items()))}"
+                f"{'' if total <= turn_budget else '  OVER BUDGET'}"
+            )
+    finally:
+        await get_async_chat_history_collection().delete_many({"session_id": session_id})
+        await get_async_chat_messages_collection().delete_many({"session_id": session_id})
+        await get_async_token_usage_collection().delete_many({"session_id": session_id})
+        AsyncMongoDB.close()
+    return within_budget
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Count the database operations of each chat turn")
+    parser.add_argument("--turns", type=int, default=5, help="chat turns to run on one session")
+    parser.add_argument("--engine", choices=("assistant", "completion"), default="assistant")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.turns, args.engine)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Move embedded chat sessions to bucketed message storage.
+
+Usage:
+    python -m app.scripts.migrate_message_buckets [--dry-run] [--session-id ID] [--limit N]
+
+Every session document that still holds a messages array is split into chat_messages
+buckets of CHAT_BUCKET_SIZE, and the session document becomes a header (storage="bucketed",
+message_count, no messages). Buckets are written with upserts keyed by (session_id, bucket),
+so an interrupted run can simply be restarted. The header is only switched if the session
+gained no message meanwhile; otherwise that session is retried. Set CHAT_STORAGE_MODE=bucketed
+before (or right after) migrating so new sessions are created bucketed as well.
+"""
+
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from app.core.config import settings
+from app.database import get_chat_history_collection, get_chat_messages_collection
+from app.api.chat_history import STORAGE_BUCKETED
+
+logger = logging.getLogger(__name__)
+
+# Attempts per session when it keeps receiving messages during migration
+MAX_ATTEMPTS = 3
+
+
+def migrate_session(session: dict, dry_run: bool = False) -> bool:
+    """Bucket one session's messages and turn its document into a header. Returns True when done."""
+    sessions = get_chat_history_collection()
+    buckets = get_chat_messages_collection()
+    session_id = session["session_id"]
+    bucket_size = settings.CHAT_BUCKET_SIZE
+
+    for _ in range(MAX_ATTEMPTS):
+        messages = session.get("messages") or []
+        if dry_run:
+            logger.info(f"Would move {len(messages)} messages of session {session_id} into buckets")
+            return True
+
+        now = datetime.now(timezone.utc)
+        writes = [
+            UpdateOne(
+                {"session_id": session_id, "bucket": start // bucket_size},
+                {
+                    "$set": {"messages": [
+                        {**message, "seq": seq}
+                        for seq, message in enumerate(messages[start:start + bucket_size], start)
+                    ]},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for start in range(0, len(messages), bucket_size)
+        ]
+        if writes:
+            buckets.bulk_write(writes, ordered=False)
+
+        # Only switch the header if no message was appended since we read it
+        result = sessions.update_one(
+            {"_id": session["_id"], "messages": {"$size": len(messages)}},
+            {
+                "$set": {"storage": STORAGE_BUCKETED, "message_count": len(messages)},
+                "$unset": {"messages": ""}
+            }
+        )
+        if result.modified_count:
+            return True
+        session = sessions.find_one({"_id": session["_id"]})
+        if session is None or session.get("storage") == STORAGE_BUCKETED:
+            return session is not None
+
+    logger.error(f"Session {session_id} kept changing, not migrated")
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move embedded chat sessions to bucketed message storage")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be migrated")
+    parser.add_argument("--session-id", help="migrate a single session")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many sessions (0 = all)")
+    args = parser.parse_args()
+
+    query = {"storage": {"$ne": STORAGE_BUCKETED}, "messages": {"$exists": True}}
+    if args.session_id:
+        query["session_id"] = args.session_id
+    cursor = get_chat_history_collection().find(query, no_cursor_timeout=True)
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    migrated = failed = 0
+    try:
+        for session in cursor:
+            if migrate_session(session, args.dry_run):
+                migrated += 1
+            else:
+                failed += 1
+            if migrated and migrated % 1000 == 0:
+                logger.info(f"{migrated} sessions migrated")
+    finally:
+        cursor.close()
+    logger.info(f"Done: {migrated} sessions {'to migrate' if args.dry_run else 'migrated'}, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
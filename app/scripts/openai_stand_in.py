@@ -0,0 +1,144 @@
+"""
+In-process stand-in for the OpenAI endpoints a chat turn calls, used by the scripts that drive
+the chat pipeline without network access (count_turn_ops, bench_concurrency).
+
+install(run_seconds) points chatbot_tool at an AsyncOpenAI client whose requests are answered
+by an httpx MockTransport: threads and their messages are kept in memory, a run completes
+run_seconds after it was created and chat completions (enhancement, completion engine) answer
+after run_seconds as well. The app never imports this module.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+# chatbot_tool builds its client at import time and needs a key to do so; import this module first
+os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+
+BASE_URL = "http://openai.stand-in/v1"
+ASSISTANT_REPLY = (
+    "**Gợi ý sản phẩm:** Tai nghe không dây ABC, pin 30 giờ, giá 1.290.000đ. "
+    "[Xem sản phẩm](https://example.com/p/1)"
+)
+# What enhancement / the completion engine make of it
+FORMATTED_REPLY = (
+    "Gợi ý cho bạn: **Tai nghe không dây ABC** – pin 30 giờ, giá 1.290.000đ. "
+    "[Xem sản phẩm](https://example.com/p/1)"
+)
+USAGE = {"prompt_tokens": 120, "completion_tokens": 40, "total_tokens": 160}
+
+_THREAD_RE = re.compile(r"^/v1/threads/([^/]+)/(messages|runs)(?:/([^/]+))?(?:/cancel)?$")
+
+
+class OpenAIStandIn:
+    """Request handler of the MockTransport; calls counts the requests per endpoint."""
+
+    def __init__(self, run_seconds: float):
+        self.run_seconds = run_seconds
+        self.calls: Counter = Counter()
+        self._runs = {}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        body = json.loads(request.content) if request.content else {}
+        if path == "/v1/threads" and request.method == "POST":
+            self.calls["threads.create"] += 1
+            return self._json({"id": f"thread_{uuid.uuid4().hex[:12]}", "object": "thread", "created_at": 0, "metadata": {}})
+        if path == "/v1/chat/completions":
+            self.calls["chat.completions"] += 1
+            await asyncio.sleep(self.run_seconds)
+            return self._json({
+                "id": f"chatcmpl_{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body.get("model", "stand-in"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": FORMATTED_REPLY}, "finish_reason": "stop"}],
+                "usage": USAGE
+            })
+        match = _THREAD_RE.match(path)
+        if not match:
+            return self._json({"error": {"message": f"{path} is not stood in", "type": "invalid_request_error"}}, 404)
+        thread_id, resource, run_id = match.groups()
+        if resource == "messages":
+            if request.method == "POST":
+                self.calls["threads.messages.create"] += 1
+                return self._json(self._message(thread_id, body.get("role", "user"), body.get("content", "")))
+            self.calls["threads.messages.list"] += 1
+            return self._json({
+                "object": "list",
+                "data": [self._message(thread_id, "assistant", ASSISTANT_REPLY)],
+                "first_id": "msg_reply",
+                "last_id": "msg_reply",
+                "has_more": False
+            })
+        if run_id is None:
+            self.calls["threads.runs.create"] += 1
+            run_id = f"run_{uuid.uuid4().hex[:12]}"
+            self._runs[run_id] = time.monotonic()
+        elif path.endswith("/cancel"):
+            self.calls["threads.runs.cancel"] += 1
+            self._runs.pop(run_id, None)
+        else:
+            self.calls["threads.runs.retrieve"] += 1
+        return self._json(self._run(thread_id, run_id))
+
+    def _run(self, thread_id: str, run_id: str) -> dict:
+        started: Optional[float] = self._runs.get(run_id)
+        if started is None:
+            status = "cancelled"
+        else:
+            status = "completed" if time.monotonic() - started >= self.run_seconds else "in_progress"
+        return {
+            "id": run_id,
+            "object": "thread.run",
+            "created_at": 0,
+            "thread_id": thread_id,
+            "assistant_id": "asst_stand_in",
+            "status": status,
+            "instructions": "",
+            "model": "stand-in",
+            "tools": [],
+            "parallel_tool_calls": True,
+            "usage": USAGE if status == "completed" else None
+        }
+
+    @staticmethod
+    def _message(thread_id: str, role: str, content: str) -> dict:
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:12]}",
+            "object": "thread.message",
+            "created_at": 0,
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "attachments": [],
+            "metadata": {},
+            "status": "completed"
+        }
+
+    @staticmethod
+    def _json(payload: dict, status_code: int = 200) -> httpx.Response:
+        return httpx.Response(status_code, json=payload)
+
+
+def install(run_seconds: float) -> OpenAIStandIn:
+    """Answer chatbot_tool's OpenAI calls with a stand-in whose runs take run_seconds."""
+    from app.api import chatbot_tool
+
+    stand_in = OpenAIStandIn(run_seconds)
+    chatbot_tool.client = AsyncOpenAI(
+        api_key="stand-in",
+        base_url=BASE_URL,
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(stand_in.handle))
+    )
+    chatbot_tool.assistant_id = chatbot_tool.assistant_id or "asst_stand_in"
+    return stand_in
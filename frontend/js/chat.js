@@ -102,15 +102,23 @@ class ChatbotUI {
         this.showTyping();
 
         try {
-            const response = await this.callChatAPI(message);
-
-            if (response) {
-                this.addMessage(response.reply, 'bot');
-                if (response.session_id) {
-                    this.sessionId = response.session_id;
+            const streamed = await this.streamChatAPI(message);
+
+            if (!streamed) {
+                // Streaming unavailable: fall back to the regular endpoint
+                const response = await this.callChatAPI(message);
+
+                if (response) {
+                    const textDiv = this.addMessage(response.reply, 'bot');
+                    if (response.session_id) {
+                        this.sessionId = response.session_id;
+                    }
+                    if (response.enhancement_status === 'pending' && response.message_id) {
+                        this.pollEnhancedReply(response.session_id, response.message_id, textDiv);
+                    }
+                } else {
+                    this.addMessage('Xin lỗi, có lỗi xảy ra. Vui lòng thử lại.', 'bot', true);
                 }
-            } else {
-                this.addMessage('Xin lỗi, có lỗi xảy ra. Vui lòng thử lại.', 'bot', true);
             }
         } catch (error) {
             console.error('Chat API error:', error);
@@ -125,7 +133,9 @@ class ChatbotUI {
             user_id: this.userId,
             message: message,
             session_id: this.sessionId,
-            enhance_response: this.enhanceResponseCheckbox.checked
+            enhance_response: this.enhanceResponseCheckbox.checked,
+            // Show the raw reply right away; the enhanced one is picked up by pollEnhancedReply
+            defer_enhancement: this.enhanceResponseCheckbox.checked
         };
 
         try {
@@ -148,6 +158,138 @@ class ChatbotUI {
         }
     }
 
+    // Long-poll a deferred enhancement and replace the raw reply once it is ready.
+    async pollEnhancedReply(sessionId, messageId, textDiv, attempts = 3) {
+        for (let i = 0; i < attempts; i++) {
+            try {
+                const response = await fetch(
+                    `${this.apiUrl}/api/chatbot/messages/${encodeURIComponent(sessionId)}/${encodeURIComponent(messageId)}?wait=20`
+                );
+                if (!response.ok) {
+                    return;
+                }
+                const message = await response.json();
+                if (message.enhancement_status !== 'pending') {
+                    if (message.enhancement_status === 'done' && textDiv) {
+                        this.renderRichText(textDiv, message.content);
+                        this.scrollToBottom();
+                    }
+                    return;
+                }
+            } catch (error) {
+                console.error('Enhancement poll failed:', error);
+                return;
+            }
+        }
+    }
+
+    // Stream a reply over Server-Sent Events and render it as it arrives.
+    // Returns false when nothing was rendered so the caller can fall back to callChatAPI.
+    async streamChatAPI(message) {
+        const payload = {
+            user_id: this.userId,
+            message: message,
+            session_id: this.sessionId,
+            enhance_response: this.enhanceResponseCheckbox.checked
+        };
+
+        let response;
+        try {
+            response = await fetch(`${this.apiUrl}/api/chatbot/interact/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify(payload)
+            });
+        } catch (error) {
+            console.error('Stream call failed:', error);
+            return false;
+        }
+        if (!response.ok || !response.body) {
+            console.error(`Stream HTTP error! status: ${response.status}`);
+            return false;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let textDiv = null;
+        let replacePending = false;
+        let renderScheduled = false;
+
+        // Coalesce many small deltas into at most one render per animation frame
+        const scheduleRender = () => {
+            if (renderScheduled) return;
+            renderScheduled = true;
+            requestAnimationFrame(() => {
+                renderScheduled = false;
+                this.renderRichText(textDiv, text);
+                this.scrollToBottom();
+            });
+        };
+
+        const appendDelta = (delta) => {
+            if (!textDiv) {
+                this.hideTyping();
+                this.isTyping = true;
+                this.updateSendButton();
+                textDiv = this.addMessage('', 'bot');
+            }
+            if (replacePending) {
+                // First enhanced chunk replaces the raw assistant text
+                text = '';
+                replacePending = false;
+            }
+            text += delta;
+            scheduleRender();
+        };
+
+        const handleFrame = (frame) => {
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length === 0) return;
+            const data = JSON.parse(dataLines.join('\n'));
+
+            if (event === 'assistant_delta' || event === 'enhancement_delta') {
+                appendDelta(data.text);
+            } else if (event === 'enhancement_start') {
+                replacePending = true;
+            } else if (event === 'done') {
+                text = data.reply;
+                if (textDiv) {
+                    this.renderRichText(textDiv, text);
+                } else {
+                    textDiv = this.addMessage(text, 'bot');
+                }
+                if (data.session_id) {
+                    this.sessionId = data.session_id;
+                }
+            } else if (event === 'error') {
+                this.addMessage('Xin lỗi, có lỗi xảy ra. Vui lòng thử lại.', 'bot', true);
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                handleFrame(frame);
+            }
+        }
+        return true;
+    }
+
     addMessage(text, sender, isError = false) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}`;
@@ -186,6 +328,7 @@ class ChatbotUI {
 
         this.chatMessages.appendChild(messageDiv);
         this.scrollToBottom();
+        return textDiv;
     }
 
     showTyping() {